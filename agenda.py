@@ -0,0 +1,105 @@
+import heapq
+from collections import deque
+
+class Agenda(object):
+    """Queue of facts and rules that were added to a KnowledgeBase but have not
+        been propagated through the inference engine yet. Subclasses decide in
+        which order they come out; this one is first in, first out.
+
+    Attributes:
+        pending (dictof Fact|Rule): ordered set of the queued items, used by
+            inference engines to leave items that are not propagated yet out
+            of their joins (they are joined when their own turn comes)
+    """
+    def __init__(self):
+        """Constructor for an empty Agenda
+        """
+        super(Agenda, self).__init__()
+        self.pending = {}
+        self.queue = deque()
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return '{}({!r})'.format(type(self).__name__, list(self.pending))
+
+    def __len__(self):
+        """Define behavior of len, the number of queued items
+        """
+        return len(self.pending)
+
+    def __contains__(self, item):
+        """Define behavior of `in`, whether item is waiting to be propagated
+        """
+        return item in self.pending
+
+    def push(self, item):
+        """Queue an item for propagation
+
+        Args:
+            item (Fact|Rule): item that was just stored in the KB
+        """
+        self.pending[item] = None
+        self._push(item)
+
+    def pop(self):
+        """Take the next item to propagate off the agenda
+
+        Returns:
+            Fact|Rule: next item
+        """
+        item = self._pop()
+        del self.pending[item]
+        return item
+
+    def _push(self, item):
+        """Put an item in the queue, for subclasses to override along with
+            _pop
+        """
+        self.queue.append(item)
+
+    def _pop(self):
+        """Take the next item out of the queue, the oldest one
+        """
+        return self.queue.popleft()
+
+
+class LifoAgenda(Agenda):
+    """Agenda handing out the most recently added item first, which follows
+        inference chains depth first like the old recursive propagation
+    """
+    def _pop(self):
+        """Take the next item out of the queue, the newest one
+        """
+        return self.queue.pop()
+
+
+class PriorityAgenda(Agenda):
+    """Agenda handing out items by priority, smallest key first and in
+        insertion order among equal keys
+
+    Attributes:
+        key (function): maps a Fact or Rule to its priority
+    """
+    def __init__(self, key):
+        """Constructor for PriorityAgenda
+
+        Args:
+            key (function): maps a Fact or Rule to its priority
+        """
+        super(PriorityAgenda, self).__init__()
+        self.key = key
+        self.queue = []
+        self.count = 0
+
+    def _push(self, item):
+        """Put an item in the heap under its key and a count that keeps
+            equal keys in insertion order
+        """
+        heapq.heappush(self.queue, (self.key(item), self.count, item))
+        self.count += 1
+
+    def _pop(self):
+        """Take the next item out of the heap, the one with the smallest key
+        """
+        return heapq.heappop(self.queue)[2]
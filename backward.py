@@ -0,0 +1,210 @@
+from logical_classes import *
+from util import *
+
+verbose = 0
+
+class TabledSolver(object):
+    """Goal-directed solver answering a query from the KB's facts and by
+        resolving it against the RHS of the KB's rules. Answers to every
+        subgoal are memoized in a table keyed on the subgoal up to variable
+        renaming, so recursive rules (e.g. a transitive isa) terminate and
+        each subgoal is only derived once.
+
+        A subgoal met for the first time only gets an empty table; the tables
+        are then re-evaluated in rounds, each reading the others' current
+        answers, until a round adds no answer anywhere. Evaluation never
+        nests, however deep the chain of subgoals. Re-evaluation is
+        semi-naive: a table is skipped when none of the tables it read last
+        time has grown, and otherwise only combines premise answers of which
+        at least one is new since then.
+
+    Attributes:
+        kb (KnowledgeBase): KnowledgeBase to answer from
+        rules (dictof list): maps a predicate to the rules concluding it
+        goals (dictof Statement): maps a table key to its subgoal
+        tables (dictof dict): maps a table key to the ordered set of its
+            answers (ground Statements)
+        changed (bool): whether the current round added an answer or a table
+        reads (dictof dict): maps a table key to the sizes of the tables its
+            last evaluation read (when first read), keyed by their keys
+    """
+    def __init__(self, kb):
+        """Constructor for TabledSolver
+
+        Args:
+            kb (KnowledgeBase): KnowledgeBase to answer from
+        """
+        super(TabledSolver, self).__init__()
+        self.kb = kb
+        self.rules = {}
+        for rule in kb.rules:
+            self.rules.setdefault(rule.rhs.predicate, []).append(rule)
+        self.goals = {}
+        self.tables = {}
+        self.changed = False
+        self.reads = {}
+        self.reading = {}
+
+    def solve(self, goal):
+        """Get all answers to goal
+
+        Args:
+            goal (Statement): statement to prove, may contain variables
+
+        Returns:
+            listof Statement: ground statements matching goal that follow
+                from the KB
+        """
+        key = self.table(goal)[0]
+        self.changed = True
+        while self.changed:
+            self.changed = False
+            for subgoal in reversed(list(self.goals)):
+                reads = self.reads.get(subgoal)
+                if reads is not None and all(len(self.tables[read]) == size
+                                             for read, size in reads.items()):
+                    continue
+                self.reading = {}
+                self.evaluate(self.goals[subgoal], self.tables[subgoal], reads)
+                self.reads[subgoal] = self.reading
+        return list(self.tables[key])
+
+    def table(self, goal):
+        """Get the current answers to a subgoal, registering a table for it
+            (to be filled by the next rounds) if it has none yet
+
+        Args:
+            goal (Statement): subgoal
+
+        Returns:
+            (tuple, listof Statement): table key and answers found so far
+        """
+        key = canonical(goal)
+        table = self.tables.get(key)
+        if table is None:
+            printv("Tabling {!r}", 1, verbose, [goal])
+            self.goals[key] = goal
+            table = self.tables[key] = {}
+            self.changed = True
+        self.reading.setdefault(key, len(table))
+        return key, list(table)
+
+    def evaluate(self, goal, table, reads):
+        """Add to table the answers to goal given the current answers of all
+            tables: matching facts, then conclusions of rules whose RHS unifies
+            with goal and whose premises have answers
+
+        Args:
+            goal (Statement): subgoal
+            table (dictof Statement): its answers
+            reads (dictof int|None): sizes of the tables read by the previous
+                evaluation of goal, None if this is the first one
+        """
+        if reads is None:
+            reads = {}
+            for fact in self.kb.facts.candidates(goal):
+                if fact.statement.ground and matches(goal, fact.statement):
+                    self.answer(table, fact.statement)
+        for rule in self.rules.get(goal.predicate, []):
+            bindings = unify_head(rule.rhs, goal)
+            if bindings is False:
+                continue
+            for delta in range(len(rule.lhs)):
+                for body_bindings in self.prove(rule.lhs, 0, bindings, delta, reads):
+                    head = instantiate(rule.rhs, body_bindings)
+                    if head.ground and matches(goal, head):
+                        self.answer(table, head)
+
+    def prove(self, premises, i, bindings, delta, reads):
+        """Generate the bindings under which premises[i:] all have answers,
+            taking for premise delta only answers that are new since the
+            previous evaluation, for the premises before it only older ones
+
+        Args:
+            premises (listof Statement): rule LHS
+            i (int): first premise still to prove
+            bindings (Bindings): bindings of the rule's variables so far
+            delta (int): premise restricted to new answers
+            reads (dictof int): sizes of the tables read by the previous
+                evaluation
+
+        Yields:
+            Bindings: extended bindings
+        """
+        if i == len(premises):
+            yield bindings
+            return
+        premise = instantiate(premises[i], bindings)
+        key, answers = self.table(premise)
+        if i < delta:
+            answers = answers[:reads.get(key, 0)]
+        elif i == delta:
+            answers = answers[reads.get(key, 0):]
+        for answer in answers:
+            extended = match(answer, premise, copy_bindings(bindings))
+            if extended:
+                for result in self.prove(premises, i + 1, extended, delta, reads):
+                    yield result
+
+    def answer(self, table, statement):
+        """Record an answer, noting whether it is new
+        """
+        if statement not in table:
+            table[statement] = None
+            self.changed = True
+
+
+class BackwardEngine(object):
+    """Inference engine that infers nothing when facts and rules are added,
+        to be passed as KnowledgeBase(engine=BackwardEngine()) when the KB is
+        only queried with kb_ask(..., mode="backward"): the closure of the
+        rules is never materialized, only the parts queries need.
+    """
+    # keeps no Fact of its own, see InferenceEngine
+    holds_facts = False
+
+    def fact_added(self, fact, kb):
+        """Nothing to infer ahead of queries
+        """
+        pass
+
+    def rule_added(self, rule, kb):
+        """Nothing to infer ahead of queries
+        """
+        pass
+
+    def saturate(self, kb):
+        """Empty the KB's agenda, nothing to infer ahead of queries
+        """
+        kb._drain()
+
+    def retracted(self, fact_rule, kb):
+        """Nothing to forget, this engine keeps no state
+        """
+        pass
+
+
+def unify_head(head, goal):
+    """Bind the variables of a rule's RHS so that it can conclude goal. The
+        goal's own variables are left unbound, they are matched against the
+        ground conclusions later on.
+
+    Args:
+        head (Statement): rule RHS
+        goal (Statement): subgoal
+
+    Returns:
+        Bindings|False: bindings of the RHS variables or no unifier
+    """
+    if len(head.terms) != len(goal.terms) or head.predicate != goal.predicate:
+        return False
+    bindings = Bindings()
+    for head_term, goal_term in zip(head.terms, goal.terms):
+        if goal_term.is_variable:
+            continue
+        if head_term.is_variable:
+            if not bindings.test_and_bind(head_term, goal_term):
+                return False
+        elif head_term is not goal_term:
+            return False
+    return bindings
@@ -0,0 +1,9 @@
+# Synthetic KBs (generate) and a suite timing load, kb_assert, kb_ask and
+# kb_retract on them at increasing sizes (suite). Run from the directory
+# above with
+#
+#   python -m benchmark --sizes 100,1000,10000 --memory --output results.json
+#   python -m benchmark --baseline results.json
+#
+# the second run exits with status 1 if a phase got slower per operation
+# than in the baseline by more than --threshold.
@@ -0,0 +1,45 @@
+import argparse, sys
+from student_code import KnowledgeBase
+from rete import ReteEngine
+from columnar import ColumnarFactStore
+from benchmark import suite
+
+KBS = {
+    "default": lambda: KnowledgeBase([], []),
+    "rete": lambda: KnowledgeBase([], [], engine=ReteEngine()),
+    "columnar": lambda: KnowledgeBase([], [], store=ColumnarFactStore()),
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmark",
+                                     description="Time KB operations on synthetic KBs")
+    parser.add_argument("--cases", default=",".join(sorted(suite.CASES)),
+                        help="comma separated cases, of " + ", ".join(sorted(suite.CASES)))
+    parser.add_argument("--sizes", default="100,1000", help="comma separated sizes")
+    parser.add_argument("--kb", choices=sorted(KBS), default="default")
+    parser.add_argument("--repeat", type=int, default=1, help="runs to keep the best time of")
+    parser.add_argument("--asks", type=int, default=200)
+    parser.add_argument("--memory", action="store_true", help="also measure peak memory")
+    parser.add_argument("--output", help="JSON file to save the results to")
+    parser.add_argument("--baseline", help="JSON file of earlier results to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown per operation counted as a regression")
+    args = parser.parse_args(argv)
+    cases = args.cases.split(",")
+    for case in cases:
+        if case not in suite.CASES:
+            parser.error("unknown case {!r}".format(case))
+    results = suite.run(cases, [int(size) for size in args.sizes.split(",")], KBS[args.kb],
+                        args.repeat, args.asks, args.memory, log=sys.stdout)
+    if args.output:
+        suite.save(results, args.output)
+    if args.baseline:
+        regressions = suite.compare(results, suite.load(args.baseline), args.threshold)
+        for r in regressions:
+            print("REGRESSION {case} {size} {phase}: {per_op:.9f}s/op vs {baseline:.9f}s/op "
+                  "({ratio:.2f}x)".format(**r))
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+import random
+from logical_classes import *
+from journal import unparse
+
+# Every generator returns the facts and rules of a KB in assertion order, as
+# read.read_tokenize does, and is deterministic for a given seed. Rules come
+# first, so that held-back facts asserted later still trigger them.
+
+def hierarchy(classes=40, depth=8, instances=100, seed=0):
+    """Deep taxonomy like statements_kb.txt: classes spread over depth
+        levels, each below a random class of the level above it by an isa
+        fact, and instances of random classes with a size and a color. The
+        rules make inst transitive over isa and mark instances of the first
+        class flat.
+
+    Args:
+        classes (int): number of classes, at least depth
+        depth (int): number of levels
+        instances (int): number of instances
+        seed (int): random seed
+
+    Returns:
+        listof Fact|Rule
+    """
+    rng = random.Random(seed)
+    items = [Rule([[["inst", "?x", "?y"], ["isa", "?y", "?z"]], ["inst", "?x", "?z"]]),
+             Rule([[["inst", "?x", "class0"]], ["flat", "?x"]])]
+    levels = [[] for _ in range(depth)]
+    for i in range(max(classes, depth)):
+        level = i if i < depth else rng.randrange(1, depth)
+        name = "class{}".format(i)
+        if level:
+            items.append(Fact(["isa", name, rng.choice(levels[level - 1])]))
+        levels[level].append(name)
+    names = [name for level in levels for name in level]
+    for i in range(instances):
+        name = "obj{}".format(i)
+        items.append(Fact(["inst", name, rng.choice(names)]))
+        items.append(Fact(["size", name, rng.choice(["small", "big"])]))
+        items.append(Fact(["color", name, rng.choice(["red", "green", "blue"])]))
+    return items
+
+
+def genealogy(people=100, width=10, seed=0):
+    """Wide family tree like statements_kb4.txt: people in generations of
+        width, each with a random mother in the generation before, and a
+        sisters fact for every pair of daughters of the same mother, with
+        statements_kb4.txt's parentof, auntof and grandmotherof rules
+
+    Args:
+        people (int): number of people
+        width (int): people per generation
+        seed (int): random seed
+
+    Returns:
+        listof Fact|Rule
+    """
+    rng = random.Random(seed)
+    items = [Rule([[["motherof", "?x", "?y"]], ["parentof", "?x", "?y"]]),
+             Rule([[["parentof", "?x", "?y"], ["sisters", "?x", "?z"]], ["auntof", "?z", "?y"]]),
+             Rule([[["parentof", "?x", "?y"], ["motherof", "?z", "?x"]],
+                   ["grandmotherof", "?z", "?y"]])]
+    children = {}
+    for i in range(width, people):
+        mother = "p{}".format(rng.randrange(i - i % width - width, i - i % width))
+        items.append(Fact(["motherof", mother, "p{}".format(i)]))
+        children.setdefault(mother, []).append("p{}".format(i))
+    for daughters in children.values():
+        for a in daughters:
+            for b in daughters:
+                if a != b:
+                    items.append(Fact(["sisters", a, b]))
+    return items
+
+
+def random_rules(facts=500, rules=10, predicates=8, constants=50, premises=3, seed=0):
+    """Random binary relations and rules joining up to premises of them in a
+        chain, (p ?v0 ?v1) (q ?v1 ?v2) ... -> (derivedN ?v0 ?vn), some
+        premises with a constant instead of ?v0. Rule N concludes its own
+        predicate derivedN, which later rules may use as premises, so rules
+        feed each other without the closure of the relations blowing up.
+
+    Args:
+        facts (int): number of facts
+        rules (int): number of rules
+        predicates (int): number of predicates of the facts
+        constants (int): number of constants
+        premises (int): most premises of a rule
+        seed (int): random seed
+
+    Returns:
+        listof Fact|Rule
+    """
+    rng = random.Random(seed)
+    names = ["rel{}".format(i) for i in range(predicates)]
+    items = []
+    for n in range(rules):
+        count = rng.randint(1, premises)
+        first = "?v0" if rng.random() < 0.8 else "c{}".format(rng.randrange(constants))
+        lhs = [[rng.choice(names), first if i == 0 else "?v{}".format(i), "?v{}".format(i + 1)]
+               for i in range(count)]
+        items.append(Rule([lhs, ["derived{}".format(n), first, "?v{}".format(count)]]))
+        names.append("derived{}".format(n))
+    names = names[:predicates]
+    for _ in range(facts):
+        items.append(Fact([rng.choice(names), "c{}".format(rng.randrange(constants)),
+                           "c{}".format(rng.randrange(constants))]))
+    return items
+
+
+def asks(facts, count=100, seed=0):
+    """Asks shaped like the given facts: each one a random fact with every
+        argument but the first made a variable half of the time, and the
+        first one a variable a quarter of the time
+
+    Args:
+        facts (listof Fact): facts to take the asks from
+        count (int): number of asks
+        seed (int): random seed
+
+    Returns:
+        listof Fact
+    """
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        statement = rng.choice(facts).statement
+        terms = [str(term) for term in statement.terms]
+        for i in range(len(terms)):
+            if rng.random() < (0.25 if i == 0 else 0.5):
+                terms[i] = "?x{}".format(i)
+        result.append(Fact([statement.predicate] + terms))
+    return result
+
+
+def write(items, path):
+    """Write facts and rules to a statements file read.read_tokenize reads
+    """
+    with open(path, "w") as file:
+        for item in items:
+            file.write(unparse(item) + "\n")
@@ -0,0 +1,183 @@
+import contextlib, io, json, os, platform, tempfile, time, tracemalloc
+import read
+from logical_classes import *
+from student_code import KnowledgeBase
+from benchmark import generate
+
+# Each case maps a size, roughly the number of facts asserted, to a KB.
+CASES = {
+    "hierarchy": lambda size: generate.hierarchy(classes=max(8, size // 10), depth=8,
+                                                 instances=max(1, size // 4)),
+    "genealogy": lambda size: generate.genealogy(people=size, width=max(4, size // 20)),
+    "rules": lambda size: generate.random_rules(facts=size, rules=10,
+                                                constants=max(10, size // 5)),
+}
+
+def run_case(case, size, make_kb=KnowledgeBase, asks=200, memory=False):
+    """Time the phases of a case at a size on a fresh KB:
+
+        load      read the KB from a statements file and kb_assert_many it
+        assert    kb_assert the facts held back from the file, one at a time
+        ask       kb_ask as many asks shaped like the KB's facts
+        retract   kb_retract the held-back facts, one at a time
+
+    Args:
+        case (str): key of CASES
+        size (int): size passed to the case
+        make_kb (callable): makes an empty KnowledgeBase
+        asks (int): number of asks
+        memory (bool): also trace allocations for each phase's peak memory,
+            which slows everything down, so the times are best taken
+            without it
+
+    Returns:
+        listof dict: one record per phase with case, size, phase, ops,
+            seconds, the KB's facts and rules after it, and peak_bytes
+            (None unless memory)
+    """
+    items = CASES[case](size)
+    facts = [item for item in items if isinstance(item, Fact)]
+    tail = facts[-max(1, len(facts) // 10):]
+    loaded = items[:len(items) - len(tail)]
+    # a held back fact that is also loaded would stay after its retraction
+    stored = set(item.statement for item in loaded if isinstance(item, Fact))
+    held = []
+    for fact in tail:
+        if fact.statement not in stored:
+            stored.add(fact.statement)
+            held.append(fact)
+    handle, path = tempfile.mkstemp(suffix=".txt")
+    os.close(handle)
+    records = []
+    kb = None
+
+    def phase(name, ops, body):
+        if memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        body()
+        seconds = time.perf_counter() - start
+        records.append({"case": case, "size": size, "phase": name, "ops": ops,
+                        "seconds": seconds, "facts": len(kb.facts), "rules": len(kb.rules),
+                        "peak_bytes": tracemalloc.get_traced_memory()[1] if memory else None})
+
+    def load():
+        kb.kb_assert_many(read.read_tokenize(path))
+
+    def assert_held():
+        for fact in held:
+            kb.kb_assert(Fact(fact.statement))
+
+    def ask():
+        # kb_ask prints every ask, which would swamp the output
+        with contextlib.redirect_stdout(io.StringIO()):
+            for fact in questions:
+                kb.kb_ask(fact)
+
+    def retract():
+        for fact in held:
+            kb.kb_retract(Fact(fact.statement))
+
+    if memory:
+        tracemalloc.start()
+    try:
+        generate.write(loaded, path)
+        kb = make_kb()
+        phase("load", len(loaded), load)
+        phase("assert", len(held), assert_held)
+        questions = generate.asks(list(kb.facts), asks)
+        phase("ask", asks, ask)
+        phase("retract", len(held), retract)
+    finally:
+        if memory:
+            tracemalloc.stop()
+        os.remove(path)
+    return records
+
+
+def run(cases=None, sizes=(100, 1000), make_kb=KnowledgeBase, repeat=1, asks=200,
+        memory=False, log=None):
+    """Run cases at increasing sizes, keeping the best time of repeat runs
+
+    Args:
+        cases (listof str|None): keys of CASES, None for all of them
+        sizes (listof int): sizes to run every case at
+        make_kb (callable): makes an empty KnowledgeBase
+        repeat (int): runs per case and size
+        asks (int): number of asks per run
+        memory (bool): add one more run per case and size tracing peak memory
+        log (file|None): where to print each record as it is measured
+
+    Returns:
+        listof dict: records as returned by run_case
+    """
+    results = []
+    for case in cases or sorted(CASES):
+        for size in sizes:
+            best = None
+            for _ in range(repeat):
+                records = run_case(case, size, make_kb, asks)
+                if best is None:
+                    best = records
+                else:
+                    for old, new in zip(best, records):
+                        old["seconds"] = min(old["seconds"], new["seconds"])
+            if memory:
+                for record, traced in zip(best, run_case(case, size, make_kb, asks, True)):
+                    record["peak_bytes"] = traced["peak_bytes"]
+            for record in best:
+                record["per_op"] = record["seconds"] / record["ops"] if record["ops"] else 0.0
+                if log is not None:
+                    print(format_record(record), file=log)
+            results.extend(best)
+    return results
+
+
+def format_record(record):
+    """One line summary of a record
+    """
+    peak = record["peak_bytes"]
+    return "{case:10} {size:>8} {phase:8} {ops:>8} ops {seconds:10.4f}s {per_op:12.9f}s/op " \
+           "{facts:>8} facts {rules:>8} rules {peak}".format(
+               peak="" if peak is None else "{:.1f} MiB".format(peak / 2 ** 20), **record)
+
+
+def save(results, path):
+    """Write results to a JSON file, with the Python version and platform
+    """
+    with open(path, "w") as file:
+        json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                   "results": results}, file, indent=1)
+
+
+def load(path):
+    """Read the results saved by save
+    """
+    with open(path) as file:
+        return json.load(file)["results"]
+
+
+def compare(results, baseline, threshold=1.25):
+    """Find the phases that got slower per operation than in a baseline
+
+    Args:
+        results (listof dict): records as returned by run
+        baseline (listof dict): records of an earlier run
+        threshold (float): slowdown ratio counted as a regression
+
+    Returns:
+        listof dict: for every regressed phase, its case, size, phase,
+            per_op, baseline per_op and their ratio
+    """
+    before = dict(((r["case"], r["size"], r["phase"]), r) for r in baseline)
+    regressions = []
+    for record in results:
+        old = before.get((record["case"], record["size"], record["phase"]))
+        if old is None or not old["per_op"]:
+            continue
+        ratio = record["per_op"] / old["per_op"]
+        if ratio > threshold:
+            regressions.append({"case": record["case"], "size": record["size"],
+                                "phase": record["phase"], "per_op": record["per_op"],
+                                "baseline": old["per_op"], "ratio": ratio})
+    return regressions
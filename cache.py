@@ -0,0 +1,117 @@
+from collections import OrderedDict
+from logical_classes import *
+from util import canonical
+
+class QueryCache(object):
+    """Least recently used cache of ask results, to be passed as
+        KnowledgeBase(cache=QueryCache()). Entries are keyed on the asked
+        statement up to variable renaming, so (isa ?X block) and
+        (isa ?Y block) share one entry, and hold the matching facts; the
+        bindings are rebuilt from them for the variables actually asked.
+
+        Every entry is stamped with the version of what it was computed
+        from: forward answers with the version of their predicate, which
+        changes whenever a fact with that predicate is stored or removed,
+        backward answers with the version of the whole KB, since rules make
+        them depend on other predicates. An entry whose stamp is out of date
+        is dropped when it is next looked up, so a write to color leaves the
+        cached isa answers alone.
+
+    Attributes:
+        maxsize (int|None): most entries kept, None for no limit
+        entries (OrderedDict): maps (mode, table key) to (version, facts),
+            least recently used first
+        versions (dictof int): maps a predicate to its version
+        version (int): version of the whole KB
+        hits (int): lookups answered from the cache
+        misses (int): lookups that had to be computed
+    """
+    def __init__(self, maxsize=None):
+        """Constructor for an empty QueryCache
+
+        Args:
+            maxsize (int|None): most entries kept, None for no limit
+        """
+        super(QueryCache, self).__init__()
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'QueryCache(maxsize={!r}, entries={}, hits={}, misses={})'.format(
+                self.maxsize, len(self.entries), self.hits, self.misses)
+
+    def __len__(self):
+        """Define behavior of len, the number of entries
+        """
+        return len(self.entries)
+
+    def get(self, statement, mode):
+        """Look up the facts answering an ask
+
+        Args:
+            statement (Statement): statement asked
+            mode (str): ask mode
+
+        Returns:
+            listof Fact|None: cached facts matching statement, None on a miss
+        """
+        key = (mode, canonical(statement))
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == self._stamp(statement, mode):
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, statement, mode, facts):
+        """Record the facts answering an ask, evicting the least recently
+            used entry if the cache is full
+
+        Args:
+            statement (Statement): statement asked
+            mode (str): ask mode
+            facts (listof Fact): facts matching statement
+        """
+        key = (mode, canonical(statement))
+        self.entries[key] = (self._stamp(statement, mode), facts)
+        self.entries.move_to_end(key)
+        if self.maxsize is not None:
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, fact_rule):
+        """Out-date the entries a fact or rule being stored or removed may
+            change
+
+        Args:
+            fact_rule (Fact|Rule): fact or rule stored in or removed from
+                the KB
+        """
+        self.version += 1
+        if fact_rule.name == "fact":
+            predicate = fact_rule.statement.predicate
+            self.versions[predicate] = self.versions.get(predicate, 0) + 1
+
+    def clear(self):
+        """Drop every entry, keeping the counters
+        """
+        self.entries.clear()
+
+    def _stamp(self, statement, mode):
+        """INTERNAL USE ONLY
+        Counter an entry for statement is valid under: the changes to its
+        predicate for forward asks, which only look at its facts, and all
+        changes for backward asks, which may use any fact or rule
+        """
+        if mode == "forward":
+            return self.versions.get(statement.predicate, 0)
+        return self.version
@@ -0,0 +1,196 @@
+import argparse, asyncio, collections, random, time, read, journal
+from logical_classes import *
+
+class Client(object):
+    """Connection to a KBServer (see server.py for the protocol). Requests
+        are pipelined: each is sent at once and its response matched to it
+        by order, so many requests can be in flight on one connection, e.g.
+        with asyncio.gather.
+
+    Attributes:
+        reader (asyncio.StreamReader): reads responses
+        writer (asyncio.StreamWriter): sends requests
+        pending (deque of asyncio.Future): futures of the requests waiting
+            for a response, oldest first
+        receiver (asyncio.Task): task reading responses
+    """
+    def __init__(self, reader, writer):
+        """Constructor for Client, see connect
+        """
+        super(Client, self).__init__()
+        self.reader = reader
+        self.writer = writer
+        self.pending = collections.deque()
+        self.receiver = asyncio.ensure_future(self._receive())
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=7070, path=None):
+        """Connect to a KBServer over TCP, or over a Unix socket if path
+
+        Returns:
+            Client: the connection
+        """
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def close(self):
+        """Wait for the pending responses and close the connection
+        """
+        if self.pending:
+            await asyncio.wait(list(self.pending))
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self.receiver
+
+    async def _receive(self):
+        """INTERNAL USE ONLY
+        Resolve the pending requests with their response lines
+        """
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            future = self.pending.popleft()
+            if not future.cancelled():
+                future.set_result(line.decode("utf-8").rstrip("\n"))
+        while self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError("connection closed"))
+
+    async def request(self, line):
+        """Send a request line and wait for its response line
+
+        Args:
+            line (str): request, e.g. "ask fact: (isa ?x block)"
+
+        Returns:
+            str: response, without the newline
+
+        Raises:
+            ValueError: if the server answered with an error
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(future)
+        self.writer.write((line + "\n").encode("utf-8"))
+        response = await future
+        if response.startswith("error"):
+            raise ValueError(response[6:])
+        return response
+
+    async def kb_ask(self, fact, mode="forward"):
+        """Ask if a fact is in the served KB
+
+        Args:
+            fact (str|Fact): statement asked, e.g. "fact: (isa ?x block)"
+            mode (str): "forward" or "backward", as for KnowledgeBase.kb_ask
+
+        Returns:
+            listof str: the bindings of every match, "" for a ground match
+        """
+        response = await self.request("ask {} {}".format(mode, unparse(fact)))
+        fields = response.split("\t")
+        count = int(fields[0].split()[1])
+        return fields[1:] if len(fields) > 1 else [""] * count
+
+    async def kb_assert(self, fact_rule):
+        """Assert a fact or rule, e.g. "fact: (isa cube block)"
+        """
+        await self.request("assert {}".format(unparse(fact_rule)))
+
+    async def kb_retract(self, fact):
+        """Retract a fact, e.g. "fact: (isa cube block)"
+        """
+        await self.request("retract {}".format(unparse(fact)))
+
+
+def unparse(fact_rule):
+    """Fact or rule as in a statements file, strings are taken as they are
+    """
+    if isinstance(fact_rule, str):
+        return fact_rule
+    return journal.unparse(fact_rule)
+
+
+def pattern(fact, rng):
+    """An ask for the predicate of fact, with some arguments made variables
+    """
+    terms = [str(term) if rng.random() < 0.5 else "?v{}".format(i)
+             for i, term in enumerate(fact.statement.terms)]
+    return "fact: ({})".format(" ".join([fact.statement.predicate] + terms))
+
+
+async def loadgen(facts, connections=8, requests=10000, asks=0.9, depth=32,
+                  host="127.0.0.1", port=7070, path=None, seed=0):
+    """Send a mix of asks and asserts to a KBServer and measure it
+
+    Args:
+        facts (listof Fact): facts to assert, and to make asks from
+        connections (int): number of connections
+        requests (int): number of requests over all connections
+        asks (float): share of asks among the requests
+        depth (int): most requests in flight on each connection
+        host, port, path: server address, as for Client.connect
+        seed (int): seed of the random mix
+
+    Returns:
+        dict: requests, seconds, requests per second and the 50th, 99th
+            percentile and largest latency in seconds
+    """
+    rng = random.Random(seed)
+    clients = [await Client.connect(host, port, path) for _ in range(connections)]
+    latencies = []
+
+    async def one(client):
+        fact = rng.choice(facts)
+        start = time.perf_counter()
+        if rng.random() < asks:
+            await client.kb_ask(pattern(fact, rng))
+        else:
+            await client.kb_assert(fact)
+        latencies.append(time.perf_counter() - start)
+
+    async def run(client, count):
+        slots = asyncio.Semaphore(depth)
+
+        async def limited():
+            async with slots:
+                await one(client)
+        await asyncio.gather(*[limited() for _ in range(count)])
+
+    start = time.perf_counter()
+    share, extra = divmod(requests, connections)
+    await asyncio.gather(*[run(client, share + (i < extra)) for i, client in enumerate(clients)])
+    seconds = time.perf_counter() - start
+    for client in clients:
+        await client.close()
+    latencies.sort()
+    return {"requests": requests, "seconds": seconds,
+            "throughput": requests / seconds if seconds else 0.0,
+            "p50": latencies[len(latencies) // 2] if latencies else 0.0,
+            "p99": latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+            "max": latencies[-1] if latencies else 0.0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate load on a KBServer")
+    parser.add_argument("files", nargs="+", help="statements files to take facts from")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7070)
+    parser.add_argument("--unix", metavar="PATH", help="connect to a Unix socket instead")
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--asks", type=float, default=0.9)
+    parser.add_argument("--depth", type=int, default=32)
+    args = parser.parse_args(argv)
+    facts = [item for item in read.load_many(args.files, workers=1) if isinstance(item, Fact)]
+    result = asyncio.run(loadgen(facts, args.connections, args.requests, args.asks, args.depth,
+                                 args.host, args.port, args.unix))
+    print("{requests} requests in {seconds:.3f}s: {throughput:.0f}/s, "
+          "p50 {p50:.6f}s, p99 {p99:.6f}s, max {max:.6f}s".format(**result))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,631 @@
+from array import array
+from itertools import islice
+from logical_classes import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# tables scanned over fewer rows than this are matched row by row, as are all
+# tables when NumPy is not installed
+VECTOR_MIN_ROWS = 512
+ALIVE = 1
+ASSERTED = 2
+EMPTY = -1
+DELETED = -2
+
+class SymbolTable(object):
+    """Interns the constants of a ColumnarFactStore as integer ids.
+        Predicates are not interned: each one picks its ColumnTable, which
+        keeps it as a string.
+
+    Attributes:
+        ids (dictof int): maps a symbol to its id
+        names (listof str): maps an id back to its symbol
+        terms (listof Term|None): Term of every id, built when first needed
+    """
+    __slots__ = ('ids', 'names', 'terms')
+
+    def __init__(self):
+        """Constructor for an empty SymbolTable
+        """
+        super(SymbolTable, self).__init__()
+        self.ids = {}
+        self.names = []
+        self.terms = []
+
+    def __len__(self):
+        """Define behavior of len, the number of symbols
+        """
+        return len(self.names)
+
+    def intern(self, name):
+        """Id of a symbol, giving it the next id if it has none yet
+        """
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.terms.append(None)
+        return i
+
+    def term(self, i):
+        """Term of the symbol with id i
+        """
+        term = self.terms[i]
+        if term is None:
+            term = self.terms[i] = Term(self.names[i])
+        return term
+
+
+class ColumnTable(object):
+    """Ground facts of one predicate and arity stored column-wise: one int32
+        array of symbol ids per argument position and one byte of flags per
+        row. Rows are found by their ids through an open-addressing hash table
+        of row numbers, and by argument through posting lists of row numbers.
+        Removed rows are only flagged dead until the store is compacted.
+
+    Attributes:
+        predicate (str): predicate of the facts
+        columns (listof array): symbol ids, one array per argument position
+        flags (bytearray): ALIVE and ASSERTED bits of every row
+        postings (dictof int|array): maps the key of (position, symbol id),
+            symbol id * arity + position, to the rows having that symbol at
+            that position: the row itself while there is only one
+        distinct (dictof int): maps a position to its number of posting lists
+        slots (array): hash table of row numbers, EMPTY or DELETED
+        used (int): slots that are not EMPTY
+        live (int): rows that are alive
+    """
+    __slots__ = ('predicate', 'columns', 'flags', 'postings', 'distinct',
+                 'slots', 'used', 'live')
+
+    def __init__(self, predicate, arity):
+        """Constructor for an empty ColumnTable
+
+        Args:
+            predicate (str): predicate of the facts
+            arity (int): number of arguments of the facts
+        """
+        super(ColumnTable, self).__init__()
+        self.predicate = predicate
+        self.columns = [array('i') for _ in range(arity)]
+        self.flags = bytearray()
+        self.postings = {}
+        self.distinct = {}
+        self.slots = array('i', [EMPTY]) * 8
+        self.used = 0
+        self.live = 0
+
+    def __len__(self):
+        """Define behavior of len, the number of rows, dead ones included
+        """
+        return len(self.flags)
+
+    def ids(self, row):
+        """Symbol ids of a row
+        """
+        return [column[row] for column in self.columns]
+
+    def find(self, ids):
+        """Row holding exactly ids, -1 if there is none
+        """
+        mask = len(self.slots) - 1
+        slot = hash(tuple(ids)) & mask
+        while True:
+            row = self.slots[slot]
+            if row == EMPTY:
+                return -1
+            if row != DELETED and all(column[row] == i for column, i in zip(self.columns, ids)):
+                return row
+            slot = (slot + 1) & mask
+
+    def add(self, ids, asserted):
+        """Append a row, which must not be stored yet
+
+        Args:
+            ids (listof int): symbol ids of the arguments
+            asserted (bool): whether the fact is asserted
+
+        Returns:
+            int: the new row
+        """
+        row = len(self.flags)
+        arity = len(self.columns)
+        postings = self.postings
+        for position, (column, i) in enumerate(zip(self.columns, ids)):
+            column.append(i)
+            key = i * arity + position
+            posting = postings.get(key)
+            if posting is None:
+                postings[key] = row
+                self.distinct[position] = self.distinct.get(position, 0) + 1
+            elif isinstance(posting, int):
+                postings[key] = array('i', (posting, row))
+            else:
+                posting.append(row)
+        self.flags.append(ALIVE | ASSERTED * bool(asserted))
+        self.live += 1
+        if 2 * (self.used + 1) > len(self.slots):
+            self._rehash(4 * self.live)
+        self._slot(ids, row)
+        return row
+
+    def kill(self, row):
+        """Flag a row dead and take it out of the hash table
+        """
+        mask = len(self.slots) - 1
+        slot = hash(tuple(self.ids(row))) & mask
+        while self.slots[slot] != row:
+            slot = (slot + 1) & mask
+        self.slots[slot] = DELETED
+        self.flags[row] &= ~ALIVE
+        self.live -= 1
+
+    def rows(self, constants, repeats=()):
+        """Live rows agreeing with the given arguments and having equal ids
+            at the given pairs of positions, in row order. Only the rows of
+            the shortest posting list of the constants are looked at; with
+            NumPy installed and enough of them, they are tested with a few
+            mask operations over the columns instead of one at a time.
+
+        Args:
+            constants (listof tuple): (position, symbol id) pairs
+            repeats (listof tuple): (position, earlier position) pairs, for
+                variables occurring more than once, e.g. (likes ?x ?x)
+
+        Returns:
+            listof int
+        """
+        driver = None
+        for position, i in constants:
+            posting = self.posting(position, i)
+            if not posting:
+                return []
+            if driver is None or len(posting) < len(driver):
+                driver = posting
+        size = len(self.flags) if driver is None else len(driver)
+        if numpy is not None and size >= VECTOR_MIN_ROWS:
+            return self._vector_rows(driver, constants, repeats)
+        if driver is None:
+            driver = range(len(self.flags))
+        flags, columns = self.flags, self.columns
+        return [row for row in driver if flags[row] & ALIVE
+                and all(columns[position][row] == i for position, i in constants)
+                and all(columns[position][row] == columns[earlier][row]
+                        for position, earlier in repeats)]
+
+    def _vector_rows(self, driver, constants, repeats):
+        """rows() with NumPy masks. The arrays only view the columns while
+            this runs, so the table can grow again afterwards.
+        """
+        if driver is None:
+            rows = numpy.arange(len(self.flags))
+        else:
+            # driver may be the tuple of a posting with a single row
+            rows = numpy.asarray(driver, dtype=numpy.intc)
+        keep = numpy.frombuffer(self.flags, dtype=numpy.uint8)[rows] & ALIVE != 0
+        columns = [numpy.frombuffer(column, dtype=numpy.intc) for column in self.columns]
+        for position, i in constants:
+            keep &= columns[position][rows] == i
+        for position, earlier in repeats:
+            keep &= columns[position][rows] == columns[earlier][rows]
+        return rows[keep].tolist()
+
+    def posting(self, position, i):
+        """Rows having symbol id i at position, dead ones included
+
+        Returns:
+            array|tuple
+        """
+        posting = self.postings.get(i * len(self.columns) + position, ())
+        return (posting,) if isinstance(posting, int) else posting
+
+    def _slot(self, ids, row):
+        """Put row, holding ids, in the first free slot of the hash table
+        """
+        mask = len(self.slots) - 1
+        slot = hash(tuple(ids)) & mask
+        while self.slots[slot] >= 0:
+            slot = (slot + 1) & mask
+        if self.slots[slot] == EMPTY:
+            self.used += 1
+        self.slots[slot] = row
+
+    def _rehash(self, size):
+        """Rebuild the hash table with room for size rows, dropping the
+            DELETED slots
+        """
+        capacity = 8
+        while capacity < size:
+            capacity *= 2
+        self.slots = array('i', [EMPTY]) * capacity
+        self.used = 0
+        for row in range(len(self.flags)):
+            if self.flags[row] & ALIVE:
+                self._slot(self.ids(row), row)
+
+
+class ColumnarFactStore(object):
+    """Fact storage backend for KnowledgeBase(store=ColumnarFactStore()),
+        with the interface of FactStore. Ground facts are kept as rows of
+        integer symbol ids in a ColumnTable per predicate and arity, a few
+        bytes per argument, and Fact objects are only built when a caller
+        asks for them. A built Fact is kept while the support graph may
+        point at it; release() lets go of the ones that have no
+        Justifications, to be rebuilt from their row when needed again. The
+        KB calls it after every change unless its engine holds facts of its
+        own (see KnowledgeBase._commit), so in between only the facts with
+        Justifications stay built. Facts with variables are kept in an
+        ordinary FactStore.
+
+    Attributes:
+        symbols (SymbolTable): ids of constants
+        tables (listof ColumnTable): the tables, by table id
+        table_ids (dictof int): maps (predicate, arity) to a table id
+        order_tables (array): table id of every fact in insertion order, -1
+            for a fact with variables
+        order_rows (array): row of every fact in insertion order, or its
+            position in loose_items
+        objects (dictof Fact): maps (table id, row) to the Fact built for it
+        built (listof tuple): (table id, row) of the Facts put in objects
+            since the last release
+        loose (FactStore): facts with variables
+        loose_items (listof Fact|None): facts with variables in insertion
+            order, None once removed
+        live (int): number of stored facts
+    """
+    __slots__ = ('symbols', 'tables', 'table_ids', 'order_tables', 'order_rows',
+                 'objects', 'built', 'loose', 'loose_items', 'live')
+
+    def __init__(self, items=[]):
+        """Constructor for ColumnarFactStore
+
+        Args:
+            items (listof Fact): initial contents, duplicates are dropped
+        """
+        super(ColumnarFactStore, self).__init__()
+        self.symbols = SymbolTable()
+        self.tables = []
+        self.table_ids = {}
+        self.order_tables = array('i')
+        self.order_rows = array('i')
+        self.objects = {}
+        self.built = []
+        self.loose = FactStore()
+        self.loose_items = []
+        self.live = 0
+        for item in items:
+            self.append(item)
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'ColumnarFactStore({} facts, {} tables, {} built)'.format(
+                self.live, len(self.tables), len(self.objects))
+
+    def __len__(self):
+        """Define behavior of len, the number of stored facts
+        """
+        return self.live
+
+    def __iter__(self):
+        """Iterate over the facts in insertion order, building them as they
+            come. Facts appended meanwhile are left out and facts removed
+            meanwhile are skipped, like the snapshot FactStore iterates over.
+        """
+        tables, rows = self.order_tables, self.order_rows
+        for i in range(len(tables)):
+            fact = self._fact(tables[i], rows[i])
+            if fact is not None:
+                yield fact
+
+    def __contains__(self, fact):
+        """Define behavior of `in`
+        """
+        return self.get(fact) is not None
+
+    def __getitem__(self, key):
+        """Define behavior for indexing and slicing, like a list (O(n))
+        """
+        if isinstance(key, int) and key >= 0:
+            for fact in islice(self, key, None):
+                return fact
+            raise IndexError("ColumnarFactStore index out of range")
+        return list(self)[key]
+
+    def __eq__(self, other):
+        """Define behavior of == against other stores or plain lists
+        """
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        """Define behavior of != when applied to this object
+        """
+        return not self == other
+
+    def get(self, fact):
+        """Get the stored fact that is equal to the fact argument
+
+        Args:
+            fact (Fact): fact we're searching for
+
+        Returns:
+            Fact|None: the stored fact, None if there is none
+        """
+        statement = fact.statement
+        if not statement.ground:
+            return self.loose.get(fact)
+        key = self._key(fact)
+        return None if key is None else self._fact(*key)
+
+    def _key(self, fact):
+        """(table id, row) of a stored ground fact, None for any other fact
+        """
+        statement = fact.statement
+        tid = self.table_ids.get((statement.predicate, len(statement.terms)))
+        if tid is None or not statement.ground:
+            return None
+        ids = self._ids(statement)
+        row = -1 if ids is None else self.tables[tid].find(ids)
+        return None if row < 0 else (tid, row)
+
+    def append(self, fact):
+        """Add a fact at the end unless an equal fact is already stored
+
+        Args:
+            fact (Fact): fact to add
+        """
+        statement = fact.statement
+        if not statement.ground:
+            if fact not in self.loose:
+                self.loose.append(fact)
+                self.order_tables.append(-1)
+                self.order_rows.append(len(self.loose_items))
+                self.loose_items.append(fact)
+                self.live += 1
+            return
+        key = (statement.predicate, len(statement.terms))
+        tid = self.table_ids.get(key)
+        if tid is None:
+            tid = self.table_ids[key] = len(self.tables)
+            self.tables.append(ColumnTable(statement.predicate, len(statement.terms)))
+        table = self.tables[tid]
+        ids = [self.symbols.intern(term.term.element) for term in statement.terms]
+        if table.find(ids) >= 0:
+            return
+        row = table.add(ids, fact.asserted)
+        self.order_tables.append(tid)
+        self.order_rows.append(row)
+        self.objects[(tid, row)] = fact
+        self.built.append((tid, row))
+        self.live += 1
+
+    def remove(self, fact):
+        """Remove the stored fact equal to the fact argument
+
+        Args:
+            fact (Fact): fact to remove
+
+        Raises:
+            ValueError: if no equal fact is stored, like list.remove
+        """
+        self.remove_many([fact])
+
+    def remove_many(self, facts):
+        """Remove the stored facts equal to each of the facts. Their rows are
+            only flagged dead, compact() reclaims the space.
+
+        Args:
+            facts (listof Fact): facts to remove
+
+        Raises:
+            ValueError: if one of them is not stored
+        """
+        for fact in facts:
+            statement = fact.statement
+            if not statement.ground:
+                if fact not in self.loose:
+                    raise ValueError("ColumnarFactStore.remove_many(x): x not in list")
+                stored = self.loose.get(fact)
+                self.loose.remove(fact)
+                self.loose_items[self.loose_items.index(stored)] = None
+                self.live -= 1
+                continue
+            tid = self.table_ids.get((statement.predicate, len(statement.terms)))
+            ids = self._ids(statement)
+            row = -1 if tid is None or ids is None else self.tables[tid].find(ids)
+            if row < 0:
+                raise ValueError("ColumnarFactStore.remove_many(x): x not in list")
+            self.tables[tid].kill(row)
+            self.objects.pop((tid, row), None)
+            self.live -= 1
+
+    def candidates(self, statement):
+        """Facts that may match statement: those with the same predicate and
+            arity that agree with every constant of statement and have equal
+            constants wherever statement repeats a variable, in insertion
+            order, then the facts with variables that may match it. Only these
+            are built. The caller still has to run match on each of them.
+
+        Args:
+            statement (Statement): pattern to look up
+
+        Returns:
+            listof Fact: candidate facts
+        """
+        found = self.loose.candidates(statement) if len(self.loose) else []
+        tid, pattern = self._pattern(statement)
+        if pattern is None:
+            return found
+        return [self._fact(tid, row) for row in self.tables[tid].rows(*pattern)] + found
+
+    def iter_candidates(self, statement):
+        """Generate the candidates of statement one at a time, in the order
+            candidates returns them, building each fact only when it is
+            reached. The store may change in the meantime: facts removed
+            since are skipped, facts stored since may be missed.
+
+        Args:
+            statement (Statement): pattern to look up
+
+        Yields:
+            Fact: candidate facts
+        """
+        tid, pattern = self._pattern(statement)
+        if pattern is not None:
+            for row in self.tables[tid].rows(*pattern):
+                fact = self._fact(tid, row)
+                if fact is not None:
+                    yield fact
+        if len(self.loose):
+            for fact in self.loose.iter_candidates(statement):
+                yield fact
+
+    def bindings(self, statement):
+        """Bindings of the variables of statement for all the ground facts
+            matching it, in bulk: one column of constants per variable
+            instead of a Bindings and a Fact per match, none of which are
+            built. Facts with variables are left out.
+
+        Args:
+            statement (Statement): pattern to match
+
+        Returns:
+            dictof list: maps the name of every variable of statement to its
+                value in each matching fact, in insertion order
+        """
+        variables = {}
+        for position, term in enumerate(statement.terms):
+            if term.is_variable:
+                variables.setdefault(term.term.element, position)
+        tid, pattern = self._pattern(statement)
+        if pattern is None:
+            return dict((name, []) for name in variables)
+        table, names = self.tables[tid], self.symbols.names
+        rows = table.rows(*pattern)
+        return dict((name, [names[table.columns[position][row]] for row in rows])
+                    for name, position in variables.items())
+
+    def estimate(self, statement, bound=()):
+        """Estimate how many facts match statement once the variables in
+            bound have values, as FactStore.estimate does
+
+        Args:
+            statement (Statement): pattern to estimate
+            bound (setof str): names of variables that will have values
+
+        Returns:
+            float: estimated number of matching facts
+        """
+        tid = self.table_ids.get((statement.predicate, len(statement.terms)))
+        estimate = self.loose.estimate(statement, bound)
+        if tid is None:
+            return estimate
+        table = self.tables[tid]
+        size = table.live
+        for position, term in enumerate(statement.terms):
+            if not term.is_variable:
+                i = self.symbols.ids.get(term.term.element)
+                size = min(size, 0 if i is None else len(table.posting(position, i)))
+            elif term.term.element in bound:
+                size = min(size, table.live / float(max(table.distinct.get(position, 1), 1)))
+        return estimate + size
+
+    def release(self, recent=False, facts=()):
+        """Let go of the built Facts that take part in no Justification,
+            keeping only their asserted flag, to save memory. Facts held
+            elsewhere stay valid, the store builds an equal one when needed.
+
+        Args:
+            recent (bool): only look at the Facts built since the last
+                release, as the KB does after every change
+            facts (iterable of Fact): more stored facts to look at when
+                recent, such as the ones a retraction took Justifications from
+        """
+        keys = self.built if recent else list(self.objects)
+        for fact in facts:
+            key = self._key(fact)
+            if key is not None:
+                keys.append(key)
+        for key in keys:
+            fact = self.objects.get(key)
+            if fact is not None and not fact.supported_by and not fact.supports:
+                table = self.tables[key[0]]
+                table.flags[key[1]] = ALIVE | ASSERTED * bool(fact.asserted)
+                del self.objects[key]
+        self.built = []
+
+    def compact(self):
+        """Reclaim the rows of removed facts, renumbering the others. Must
+            not be called while iterating over the store.
+        """
+        tables = [ColumnTable(table.predicate, len(table.columns)) for table in self.tables]
+        objects, order_tables, order_rows, loose_items = {}, array('i'), array('i'), []
+        for tid, row in zip(self.order_tables, self.order_rows):
+            if tid < 0:
+                fact = self.loose_items[row]
+                if fact is not None:
+                    order_tables.append(-1)
+                    order_rows.append(len(loose_items))
+                    loose_items.append(fact)
+                continue
+            table = self.tables[tid]
+            if not table.flags[row] & ALIVE:
+                continue
+            new_row = tables[tid].add(table.ids(row), table.flags[row] & ASSERTED)
+            fact = self.objects.get((tid, row))
+            if fact is not None:
+                objects[(tid, new_row)] = fact
+            order_tables.append(tid)
+            order_rows.append(new_row)
+        self.tables, self.objects, self.built = tables, objects, list(objects)
+        self.order_tables, self.order_rows, self.loose_items = order_tables, order_rows, loose_items
+
+    def _fact(self, tid, row):
+        """Stored fact of a row, built if needed, None if the row is dead
+        """
+        if tid < 0:
+            return self.loose_items[row]
+        fact = self.objects.get((tid, row))
+        if fact is None:
+            table = self.tables[tid]
+            flags = table.flags[row]
+            if not flags & ALIVE:
+                return None
+            term = self.symbols.term
+            fact = Fact(Statement([table.predicate] + [term(i) for i in table.ids(row)]))
+            fact.asserted = bool(flags & ASSERTED)
+            self.objects[(tid, row)] = fact
+            self.built.append((tid, row))
+        return fact
+
+    def _ids(self, statement):
+        """Symbol ids of a ground statement's arguments, None if one of them
+            has none (so no stored fact has it)
+        """
+        ids = [self.symbols.ids.get(term.term.element) for term in statement.terms]
+        return None if None in ids else ids
+
+    def _pattern(self, statement):
+        """Table id of statement's predicate and arity, and the arguments of
+            ColumnTable.rows selecting the rows matching it: (position, symbol
+            id) of its constants and (position, earlier position) of its
+            repeated variables. The arguments are None if no row can match.
+        """
+        tid = self.table_ids.get((statement.predicate, len(statement.terms)))
+        if tid is None:
+            return None, None
+        constants, repeats, first = [], [], {}
+        for position, term in enumerate(statement.terms):
+            if not term.is_variable:
+                i = self.symbols.ids.get(term.term.element)
+                if i is None:
+                    return tid, None
+                constants.append((position, i))
+            elif term in first:
+                repeats.append((position, first[term]))
+            else:
+                first[term] = position
+        return tid, (constants, repeats)
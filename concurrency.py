@@ -0,0 +1,466 @@
+import threading
+from contextlib import contextmanager
+from logical_classes import *
+from student_code import KnowledgeBase
+import snapshot
+
+class RWLock(object):
+    """Readers-writer lock: any number of readers or a single writer. A
+        waiting writer holds back new readers, so a stream of readers can't
+        starve it. Not reentrant.
+
+    Attributes:
+        condition (threading.Condition): guards the counts below
+        readers (int): readers holding the lock
+        writer (bool): whether a writer holds the lock
+        waiting (int): writers waiting for the lock
+    """
+    def __init__(self):
+        """Constructor for an unlocked RWLock
+        """
+        super(RWLock, self).__init__()
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = False
+        self.waiting = 0
+
+    def acquire_read(self):
+        """Wait until no writer holds or waits for the lock, then hold it as
+            a reader
+        """
+        with self.condition:
+            while self.writer or self.waiting:
+                self.condition.wait()
+            self.readers += 1
+
+    def release_read(self):
+        """Stop holding the lock as a reader, waking the waiting writers
+            when the last reader leaves
+        """
+        with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        """Wait until no one holds the lock, then hold it as the writer
+        """
+        with self.condition:
+            self.waiting += 1
+            while self.writer or self.readers:
+                self.condition.wait()
+            self.waiting -= 1
+            self.writer = True
+
+    def release_write(self):
+        """Stop holding the lock as the writer, waking everyone waiting
+        """
+        with self.condition:
+            self.writer = False
+            self.condition.notify_all()
+
+    @contextmanager
+    def reading(self):
+        """Hold the lock as a reader for the body of a with statement
+        """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self):
+        """Hold the lock as the writer for the body of a with statement
+        """
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class ConcurrentKnowledgeBase(KnowledgeBase):
+    """KnowledgeBase that can be asked from many threads while other threads
+        assert and retract.
+
+        Writes (kb_assert, kb_assert_many, kb_retract, kb_retract_many, or
+        several of them grouped in a writing block) take turns, and each one
+        is published as a new version of the KB once its inference is done.
+        Every fact and rule is stamped with the version it was stored in,
+        and one that is removed goes to a graveyard stamped with the version
+        it was removed in. An ask pins the last published version and only
+        sees what was stored at or before it and not removed by then, so it
+        never sees half of a forward-chaining cascade and isn't held up by
+        one: the stores are only locked while a single fact or rule goes in
+        or out. Graveyard entries are dropped once no pinned version can see
+        them any more.
+
+        Asks go through reading, which gives a ReadView of the pinned
+        version; the query cache is not used for them. Facts and rules added
+        with kb_add outside of a write are not seen until the next write is
+        published.
+
+    Attributes:
+        lock (RWLock): held by readers of the stores and by a writer while
+            it stores or removes a fact or rule
+        writer (threading.RLock): held for a whole write, so writes take turns
+        mutex (threading.Lock): guards version and pins
+        version (int): last published version
+        pins (dictof int): maps a pinned version to the number of readers
+            pinning it
+        depth (int): nesting of writing blocks in the writing thread
+    """
+    def __init__(self, facts=[], rules=[], engine=None, agenda=None, cache=None,
+                 journal=None, store=None, metrics=None):
+        """Constructor for ConcurrentKnowledgeBase, with the same arguments
+            as for KnowledgeBase. The initial facts and rules are version 0.
+        """
+        super(ConcurrentKnowledgeBase, self).__init__(facts, rules, engine, agenda, cache,
+                                                      journal, store, metrics)
+        self.lock = RWLock()
+        self.writer = threading.RLock()
+        self.mutex = threading.Lock()
+        self.version = 0
+        self.pins = {}
+        self.depth = 0
+        self.facts = VersionedStore(self.facts, self)
+        self.rules = VersionedStore(self.rules, self)
+
+    def __str__(self):
+        with self.reading() as view:
+            return str(view)
+
+    @contextmanager
+    def writing(self):
+        """Make the writes in the body of a with statement one version of
+            the KB, published when the outermost writing block ends
+        """
+        with self.writer:
+            self.depth += 1
+            try:
+                yield
+            finally:
+                self.depth -= 1
+                if not self.depth:
+                    self._publish()
+
+    def _publish(self):
+        """INTERNAL USE ONLY
+        Make the version being written the last published one and drop the
+        graveyard entries no reader can see any more
+        """
+        with self.mutex:
+            self.version += 1
+            oldest = min(self.pins) if self.pins else self.version
+        with self.lock.writing():
+            self.facts.prune(oldest)
+            self.rules.prune(oldest)
+
+    @contextmanager
+    def reading(self):
+        """Pin the last published version of the KB for the body of a with
+            statement
+
+        Yields:
+            ReadView: the KB as of the pinned version
+        """
+        with self.mutex:
+            version = self.version
+            self.pins[version] = self.pins.get(version, 0) + 1
+        try:
+            yield ReadView(self, version)
+        finally:
+            with self.mutex:
+                self.pins[version] -= 1
+                if not self.pins[version]:
+                    del self.pins[version]
+
+    def kb_assert(self, fact_rule):
+        """As for KnowledgeBase, published as one version
+        """
+        with self.writing():
+            super(ConcurrentKnowledgeBase, self).kb_assert(fact_rule)
+
+    def kb_assert_many(self, items):
+        """As for KnowledgeBase, published as one version
+        """
+        with self.writing():
+            super(ConcurrentKnowledgeBase, self).kb_assert_many(items)
+
+    def kb_retract(self, fact_or_rule):
+        """As for KnowledgeBase, published as one version
+        """
+        with self.writing():
+            super(ConcurrentKnowledgeBase, self).kb_retract(fact_or_rule)
+
+    def kb_retract_many(self, items):
+        """As for KnowledgeBase, published as one version
+        """
+        with self.writing():
+            super(ConcurrentKnowledgeBase, self).kb_retract_many(items)
+
+    def _release(self, unlinked=()):
+        """INTERNAL USE ONLY
+        As for KnowledgeBase, with the stores locked, since readers build
+        facts too
+        """
+        with self.lock.writing():
+            super(ConcurrentKnowledgeBase, self)._release(unlinked)
+
+    def save_snapshot(self, path):
+        """As for KnowledgeBase, between writes
+        """
+        with self.writer:
+            super(ConcurrentKnowledgeBase, self).save_snapshot(path)
+
+    @classmethod
+    def load_snapshot(cls, path, engine=None, agenda=None, cache=None, store=None):
+        """As for KnowledgeBase, the loaded facts and rules being version 1
+        """
+        kb = cls([], [], engine=engine, agenda=agenda, cache=cache, store=store)
+        with kb.writing():
+            snapshot.load(kb, path)
+        return kb
+
+    def kb_ask(self, fact, mode="forward"):
+        """As for KnowledgeBase, on the last published version
+        """
+        with self.reading() as view:
+            return view.kb_ask(fact, mode)
+
+    def iter_ask(self, fact, mode="forward", limit=None, exists=False):
+        """As for KnowledgeBase, on the version published when the first
+            answer is asked for, pinned until the generator is done or closed
+        """
+        with self.reading() as view:
+            for answer in view.iter_ask(fact, mode, limit, exists):
+                yield answer
+
+    def kb_ask_all(self, statements):
+        """As for KnowledgeBase, all on the last published version
+        """
+        with self.reading() as view:
+            return view.kb_ask_all(statements)
+
+
+class VersionedStore(object):
+    """FactStore or RuleStore of a ConcurrentKnowledgeBase, stamping what is
+        stored and keeping what is removed in a graveyard. Writers use it
+        like the store it wraps; readers look at it through StoreView.
+
+    Attributes:
+        store (FactStore|RuleStore): the wrapped store, holding what is
+            stored now
+        kb (ConcurrentKnowledgeBase): KB the store belongs to
+        born (dict): maps a stored item to the version it was stored in
+        graveyard (dictof list): maps a predicate (of the first premise for
+            rules) to the (item, born, died) of removed items
+    """
+    def __init__(self, store, kb):
+        """Constructor for VersionedStore, what store holds is version 0
+        """
+        super(VersionedStore, self).__init__()
+        self.store = store
+        self.kb = kb
+        self.born = dict.fromkeys(store, 0)
+        self.graveyard = {}
+
+    def __repr__(self):
+        return repr(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __contains__(self, item):
+        return item in self.store
+
+    def __getitem__(self, key):
+        return self.store[key]
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def get(self, item):
+        """Stored item equal to item, see FactStore.get
+        """
+        return self.store.get(item)
+
+    def candidates(self, statement):
+        """Candidates for statement now, see FactStore.candidates
+        """
+        return self.store.candidates(statement)
+
+    def iter_candidates(self, statement):
+        """Candidates for statement now, lazily, see FactStore.iter_candidates
+        """
+        return self.store.iter_candidates(statement)
+
+    def estimate(self, statement, bound=()):
+        """Estimated number of matches, see FactStore.estimate
+        """
+        return self.store.estimate(statement, bound)
+
+    def append(self, item):
+        """Store an item in the version being written
+        """
+        with self.kb.lock.writing():
+            if self.store.get(item) is None:
+                self.store.append(item)
+                self.born[item] = self.kb.version + 1
+
+    def remove(self, item):
+        """Remove an item in the version being written, see remove_many
+        """
+        self.remove_many([item])
+
+    def remove_many(self, items):
+        """Remove items in the version being written, moving them to the
+            graveyard
+        """
+        with self.kb.lock.writing():
+            died = self.kb.version + 1
+            for item in items:
+                stored = self.store.get(item)
+                if stored is not None:
+                    self.graveyard.setdefault(_key(stored), []).append(
+                        (stored, self.born.pop(stored, died), died))
+            self.store.remove_many(items)
+
+    def prune(self, oldest):
+        """Drop the graveyard entries removed at or before version oldest
+        """
+        for key in list(self.graveyard):
+            entries = [entry for entry in self.graveyard[key] if entry[2] > oldest]
+            if entries:
+                self.graveyard[key] = entries
+            else:
+                del self.graveyard[key]
+
+    def get_at(self, item, version):
+        """The stored item equal to item as of version, None if none was
+        """
+        with self.kb.lock.reading():
+            stored = self.store.get(item)
+            if stored is not None and self.born.get(stored, version + 1) <= version:
+                return stored
+            for stored, born, died in self.graveyard.get(_key(item), ()):
+                if born <= version < died and stored == item:
+                    return stored
+        return None
+
+    def candidates_at(self, statement, version):
+        """Candidates for statement as of version, see FactStore.candidates
+        """
+        with self.kb.lock.reading():
+            born = self.born
+            found = [item for item in self.store.iter_candidates(statement)
+                     if born.get(item, version + 1) <= version]
+            found.extend(stored for stored, b, died in self.graveyard.get(statement.predicate, ())
+                         if b <= version < died)
+        return found
+
+    def items_at(self, version):
+        """Everything stored as of version
+        """
+        with self.kb.lock.reading():
+            born = self.born
+            found = [item for item in self.store if born.get(item, version + 1) <= version]
+            for entries in self.graveyard.values():
+                found.extend(stored for stored, b, died in entries if b <= version < died)
+        return found
+
+
+def _key(item):
+    """Graveyard key of a fact or rule: the predicate of the statements it
+        is a candidate for
+    """
+    return item.statement.predicate if isinstance(item, Fact) else item.lhs[0].predicate
+
+
+class StoreView(object):
+    """Read-only view of a VersionedStore as of one version, standing in for
+        the FactStore or RuleStore of a ReadView
+    """
+    def __init__(self, store, version):
+        """Constructor for StoreView
+
+        Args:
+            store (VersionedStore): the store
+            version (int): the version to see, pinned by the caller
+        """
+        super(StoreView, self).__init__()
+        self.store = store
+        self.version = version
+
+    def __iter__(self):
+        return iter(self.store.items_at(self.version))
+
+    def __len__(self):
+        return len(self.store.items_at(self.version))
+
+    def get(self, item):
+        """Stored item equal to item as of the version, see
+            VersionedStore.get_at
+        """
+        return self.store.get_at(item, self.version)
+
+    def candidates(self, statement):
+        """Candidates for statement as of the version, see
+            VersionedStore.candidates_at
+        """
+        return self.store.candidates_at(statement, self.version)
+
+    def iter_candidates(self, statement):
+        """Candidates for statement as of the version, as an iterator
+        """
+        # taken at once, as writers may change the store between two steps
+        return iter(self.store.candidates_at(statement, self.version))
+
+    def estimate(self, statement, bound=()):
+        """Estimated number of matches, from the store as it is now
+        """
+        with self.store.kb.lock.reading():
+            return self.store.estimate(statement, bound)
+
+
+class ReadView(object):
+    """A ConcurrentKnowledgeBase as of a pinned version, answering asks like
+        a KnowledgeBase. Only valid in the reading block that gave it.
+
+    Attributes:
+        kb (ConcurrentKnowledgeBase): the KB
+        version (int): the pinned version
+        facts (StoreView): the facts as of version
+        rules (StoreView): the rules as of version
+        cache (None): asks on a view are not cached
+    """
+    def __init__(self, kb, version):
+        """Constructor for ReadView
+
+        Args:
+            kb (ConcurrentKnowledgeBase): the KB
+            version (int): the version to see, pinned by the caller
+        """
+        super(ReadView, self).__init__()
+        self.kb = kb
+        self.version = version
+        self.facts = StoreView(kb.facts, version)
+        self.rules = StoreView(kb.rules, version)
+        self.cache = None
+
+    def __repr__(self):
+        return 'ReadView({!r}, version={})'.format(self.kb, self.version)
+
+    __str__ = KnowledgeBase.__str__
+    kb_ask = KnowledgeBase.kb_ask
+    iter_ask = KnowledgeBase.iter_ask
+    kb_ask_all = KnowledgeBase.kb_ask_all
+    _get_fact = KnowledgeBase._get_fact
+    _valid_ask = KnowledgeBase._valid_ask
+    _answers = KnowledgeBase._answers
+    _join_order = KnowledgeBase._join_order
+    _join = KnowledgeBase._join
@@ -0,0 +1,282 @@
+import os
+import read
+from logical_classes import *
+from student_code import KnowledgeBase
+
+class Journal(object):
+    """Append-only log of the changes made to a KnowledgeBase, to be passed
+        as KnowledgeBase(journal=Journal(path)) or opened with recover. Each
+        record is one line, with facts and rules written as in a statements
+        file and fields separated by tabs:
+
+            +   item                    item asserted
+            <   conclusion  fact  rule  conclusion stored and inferred from
+                                        fact and rule
+            ~   conclusion  fact  rule  same, for a partial match the engine
+                                        keeps out of kb.rules
+            -   fact                    fact retracted
+
+        Inferred facts and rules are logged with their support, so replaying
+        the journal rebuilds the KB without running the inference engine.
+        Records are buffered and written in groups: each kb_assert or
+        kb_retract ends a change, and every group_size changes the buffer is
+        written out (and synced to disk if sync). A checkpoint saves the KB
+        as a snapshot next to the journal and empties the journal.
+
+    Attributes:
+        path (str): name of the journal file, the checkpoint snapshot is
+            path + ".snapshot"
+        group_size (int): number of changes written out together
+        sync (bool): whether to fsync after every write
+        buffer (listof str): records not written yet
+        pending (int): changes in buffer
+        file (file|None): journal opened for appending, None until the
+            first write
+    """
+    def __init__(self, path, group_size=1, sync=True):
+        """Constructor for Journal
+
+        Args:
+            path (str): name of the journal file
+            group_size (int): number of changes written out together
+            sync (bool): whether to fsync after every write
+        """
+        super(Journal, self).__init__()
+        self.path = path
+        self.group_size = group_size
+        self.sync = sync
+        self.buffer = []
+        self.pending = 0
+        self.file = None
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'Journal({!r}, group_size={!r}, sync={!r})'.format(
+                self.path, self.group_size, self.sync)
+
+    def asserted(self, fact_rule):
+        """Log that a fact or rule was asserted
+        """
+        self.buffer.append("+\t{}\n".format(unparse(fact_rule)))
+
+    def inferred(self, justification, stored):
+        """Log a Justification attached to its conclusion
+
+        Args:
+            justification (Justification): attached Justification
+            stored (bool): whether its conclusion is stored in the KB
+        """
+        self.buffer.append("{}\t{}\t{}\t{}\n".format(
+                "<" if stored else "~", unparse(justification.conclusion),
+                unparse(justification.fact), unparse(justification.rule)))
+
+    def retracted(self, fact):
+        """Log that a fact was retracted
+        """
+        self.buffer.append("-\t{}\n".format(unparse(fact)))
+
+    def commit(self):
+        """End a change, writing the buffer out once group_size changes are
+            in it
+        """
+        self.pending += 1
+        if self.pending >= self.group_size:
+            self.flush()
+
+    def flush(self):
+        """Write out the buffered records
+        """
+        if self.buffer:
+            if self.file is None:
+                self.file = open(self.path, "a")
+            self.file.writelines(self.buffer)
+            self.file.flush()
+            if self.sync:
+                os.fsync(self.file.fileno())
+            del self.buffer[:]
+        self.pending = 0
+
+    def close(self):
+        """Write out the buffered records and close the journal file
+        """
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def checkpoint(self, kb):
+        """Save kb as the snapshot the journal starts from and empty the
+            journal. Replaying a journal on top of the snapshot it was
+            compacted into gives the same KB, so a crash between the two
+            steps loses nothing.
+
+        Args:
+            kb (KnowledgeBase): the KB this journal logs
+        """
+        self.flush()
+        kb.save_snapshot(self.path + ".snapshot.tmp")
+        os.replace(self.path + ".snapshot.tmp", self.path + ".snapshot")
+        if self.file is not None:
+            self.file.close()
+        self.file = open(self.path, "w")
+        if self.sync:
+            os.fsync(self.file.fileno())
+
+    def recover(self, engine=None, agenda=None, cache=None, store=None):
+        """Rebuild the KB from the last checkpoint and the journal, then log
+            its further changes here. As with KnowledgeBase.load_snapshot,
+            the engine must keep no state of its own.
+
+        The journal is replayed up to its first record that is torn or
+        doesn't apply to the KB, and cut off there.
+
+        Args:
+            engine, agenda, cache, store: as for the KnowledgeBase constructor
+
+        Returns:
+            KnowledgeBase: the recovered KB
+        """
+        if os.path.exists(self.path + ".snapshot"):
+            kb = KnowledgeBase.load_snapshot(self.path + ".snapshot",
+                                             engine=engine, agenda=agenda, cache=cache,
+                                             store=store)
+        else:
+            kb = KnowledgeBase([], [], engine=engine, agenda=agenda, cache=cache,
+                               store=store)
+        if os.path.exists(self.path):
+            # a crash may leave a torn record at the end, which is cut off so
+            # that new records don't get appended to it
+            with open(self.path, "r+b") as file:
+                count = replay(kb, (line.decode("utf-8", "replace") for line in file))
+                file.seek(0)
+                file.truncate(sum(len(line) for line, _ in zip(file, range(count))))
+        kb.journal = self
+        return kb
+
+
+def unparse(fact_rule):
+    """Write a fact or rule as in a statements file, e.g.
+        rule: ((inst ?x ?y) (isa ?y ?z)) -> (inst ?x ?z)
+
+    Args:
+        fact_rule (Fact|Rule): fact or rule to write
+
+    Returns:
+        str
+    """
+    if isinstance(fact_rule, Fact):
+        return "fact: {}".format(fact_rule.statement)
+    return "rule: ({}) -> {}".format(" ".join(str(s) for s in fact_rule.lhs), fact_rule.rhs)
+
+
+def parse(text):
+    """Read a fact or rule written by unparse, None if text doesn't parse
+    """
+    tokens = read.TOKEN.findall(text)
+    if not tokens or tokens[0] not in read.HEADERS:
+        return None
+    statement = read.parse_tokens(tokens[0], tokens[1:])
+    if statement is None:
+        return None
+    return read.make_item((tokens[0], statement))
+
+
+# number of facts and rules in each kind of record
+FIELDS = {"+": 1, "<": 3, "~": 3, "-": 1}
+
+def parse_record(line):
+    """Read a journal record
+
+    Args:
+        line (str): the record's line
+
+    Returns:
+        (str, listof Fact|Rule)|None: the kind of record and its facts and
+            rules, None if the line is torn (has no newline) or malformed
+    """
+    if not line.endswith("\n"):
+        return None
+    fields = line[:-1].split("\t")
+    kind = fields[0]
+    if FIELDS.get(kind) != len(fields) - 1:
+        return None
+    items = [parse(field) for field in fields[1:]]
+    if any(item is None for item in items):
+        return None
+    if kind == "-" and not isinstance(items[0], Fact):
+        return None
+    if kind in ("<", "~") and not (isinstance(items[1], Fact) and isinstance(items[2], Rule)):
+        return None
+    return kind, items
+
+
+def replay(kb, lines):
+    """Apply journal records to kb, storing facts and rules and linking
+        them as logged instead of running the inference engine. Records
+        already reflected in kb change nothing.
+
+    Args:
+        kb (KnowledgeBase): KB to apply the records to, its journal (if
+            any) does not log them again
+        lines (iterable of str): journal records
+
+    Returns:
+        int: number of records applied, stopping at the first one that is
+            torn or malformed or whose premises are not in kb
+    """
+    journal, kb.journal = kb.journal, None
+    try:
+        return _replay(kb, lines)
+    finally:
+        kb.journal = journal
+
+
+def _replay(kb, lines):
+    partial = {}
+
+    def find(item, stored=True):
+        if isinstance(item, Fact):
+            return kb._get_fact(item)
+        return kb._get_rule(item) if stored else partial.get(item)
+
+    def store(item, stored=True):
+        if not stored:
+            partial[item] = item
+        elif isinstance(item, Fact):
+            kb.facts.append(item)
+        else:
+            kb.rules.append(item)
+        kb._changed(item)
+        return item
+
+    count = 0
+    for line in lines:
+        record = parse_record(line)
+        if record is None:
+            break
+        kind, items = record
+        if kind == "+":
+            item = items[0]
+            known = find(item)
+            if known is None:
+                store(item)
+            else:
+                known.asserted = True
+        elif kind in ("<", "~"):
+            stored = kind == "<"
+            conclusion, fact, rule = items
+            fact = find(fact)
+            rule = find(rule) or partial.get(rule)
+            if fact is None or rule is None:
+                break
+            known = find(conclusion, stored)
+            if known is None:
+                known = store(conclusion, stored)
+                known.asserted = False
+            if not any(j.fact is fact and j.rule is rule for j in known.supported_by):
+                Justification(fact, rule).attach(known)
+        elif kind == "-":
+            kb.kb_retract_many(items)
+        count += 1
+    return count
@@ -1,4 +1,9 @@
-from util import is_var
+import threading, weakref
+from util import is_var, match
+
+# guards creating an interned Statement, Term, Variable or Constant, so two
+# threads making the same one at once still share a single instance
+intern_lock = threading.Lock()
 
 class Fact(object):
     """Represents a fact in our knowledge base. Has a statement containing the
@@ -10,37 +15,38 @@ class Fact(object):
         statement (Statement): statement of this fact, basically what the fact actually says
         asserted (bool): boolean flag indicating if fact was asserted instead of
             inferred from other rules/facts in the KB
-        supported_by (listof Fact|Rule): Facts/Rules that allow inference of
-            the statement
+        supported_by (dictof Justification): ordered set of the
+            Justifications that allow inference of the statement
+        supports (dictof Justification): ordered set of the Justifications
+            this fact takes part in
         supports_facts (listof Fact): Facts that this fact supports
         supports_rules (listof Rule): Rules that this fact supports
     """
+    __slots__ = ('statement', 'asserted', 'supported_by', 'supports')
+    name = "fact"
+
     def __init__(self, statement, supported_by=[]):
         """Constructor for Fact setting up useful flags and generating appropriate statement
 
         Args:
             statement (str|Statement): The statement of this fact, basically what the
                 fact actually says
-            supported_by (listof Fact|Rule): Facts/Rules that allow inference of
-                the statement
+            supported_by (listof Justification|Fact|Rule): Justifications that
+                allow inference of the statement, or the facts and rules of
+                such Justifications in alternating order
         """
         super(Fact, self).__init__()
-        self.name = "fact"
         self.statement = statement if isinstance(statement, Statement) else Statement(statement)
         self.asserted = not supported_by
-        #self.supported_by = supported_by
-        self.supported_by = []
-        self.supports_facts = []
-        self.supports_rules = []
-        for pair in supported_by:
-           self.supported_by.append(pair)
+        self.supported_by = Justification.make_all(supported_by, self)
+        self.supports = {}
 
     def __repr__(self):
         """Define internal string representation
         """
         return 'Fact({!r}, {!r}, {!r}, {!r}, {!r}, {!r})'.format(
                 self.name, self.statement,
-                self.asserted, self.supported_by,
+                self.asserted, list(self.supported_by),
                 self.supports_facts, self.supports_rules)
 
     def __str__(self):
@@ -49,7 +55,7 @@ class Fact(object):
         string = self.name + ":\n"
         string += "\t" + str(self.statement) + "\n"
         string += "\t Asserted:       " + str(self.asserted) + "\n"
-        if self.supported_by != []:
+        if self.supported_by:
             name_strings = [str(x.name) for y in self.supported_by for x in y]
             supported_by_str = ", ".join(name_strings)
             string += "\t Supported by:   [" + supported_by_str + "]\n"
@@ -63,11 +69,28 @@ class Fact(object):
             string += "\t Supports rules: [" + supports_r_str + "]\n"
         return string
 
+    @property
+    def supports_facts(self):
+        """Facts that this fact supports
+        """
+        return Justification.conclusions(self.supports, Fact)
+
+    @property
+    def supports_rules(self):
+        """Rules that this fact supports
+        """
+        return Justification.conclusions(self.supports, Rule)
+
     def __eq__(self, other):
         """Define behavior of == when applied to this object
         """
         return isinstance(other, Fact) and self.statement == other.statement
 
+    def __hash__(self):
+        """Define hash consistent with ==, facts hash on their statement
+        """
+        return hash(self.statement)
+
     def __ne__(self, other):
         """Define behavior of != when applied to this object
         """
@@ -85,37 +108,42 @@ class Rule(object):
         rhs (Statement): RHS statment of this rule
         asserted (bool): boolean flag indicating if rule was asserted instead of
             inferred from other rules/facts in the KB
-        supported_by (listof Fact|Rule): Facts/Rules that allow inference of
-            the statement
+        supported_by (dictof Justification): ordered set of the
+            Justifications that allow inference of the rule
+        supports (dictof Justification): ordered set of the Justifications
+            this rule takes part in
         supports_facts (listof Fact): Facts that this rule supports
         supports_rules (listof Rule): Rules that this rule supports
+        matcher (PatternMatcher): first LHS statement compiled for matching
+            facts against it
     """
+    __slots__ = ('lhs', 'rhs', 'asserted', 'supported_by', 'supports', 'matcher')
+    name = "rule"
+
     def __init__(self, rule, supported_by=[]):
         """Constructor for Rule setting up useful flags and generating appropriate LHS & RHS
 
         Args:
             rule (listof list): Raw representation of statements making up LHS and
                 RHS of this rule
-            supported_by (listof Fact|Rule): Facts/Rules that allow inference of
-                the statement
+            supported_by (listof Justification|Fact|Rule): Justifications that
+                allow inference of the rule, or the facts and rules of such
+                Justifications in alternating order
         """
         super(Rule, self).__init__()
-        self.name = "rule"
         self.lhs = [statement if isinstance(statement, Statement) else Statement(statement) for statement in rule[0]]
         self.rhs = rule[1] if isinstance(rule[1], Statement) else Statement(rule[1])
+        self.matcher = PatternMatcher(self.lhs[0])
         self.asserted = not supported_by
-        self.supported_by = []
-        self.supports_facts = []
-        self.supports_rules = []
-        for pair in supported_by:
-            self.supported_by.append(pair)
+        self.supported_by = Justification.make_all(supported_by, self)
+        self.supports = {}
 
     def __repr__(self):
         """Define internal string representation
         """
         return 'Rule({!r}, {!r}, {!r}, {!r}, {!r}, {!r}, {!r})'.format(
                 self.name, self.lhs, self.rhs,
-                self.asserted, self.supported_by,
+                self.asserted, list(self.supported_by),
                 self.supports_facts, self.supports_rules)
 
     def __str__(self):
@@ -127,8 +155,8 @@ class Rule(object):
             string += "\t\t" + str(statement) + "\n"
         string += "\t Right hand:\n\t\t" + str(self.rhs) + "\n"
         string += "\t Asserted:       " + str(self.asserted) + "\n"
-        if self.supported_by != []:
-            name_strings = [str(x.name) for y in self.supported_by for x in y ]
+        if self.supported_by:
+            name_strings = [str(x.name) for y in self.supported_by for x in y]
             supported_by_str = ", ".join(name_strings)
             string += "\t Supported by:   [" + supported_by_str + "]\n"
         if self.supports_facts != []:
@@ -141,28 +169,146 @@ class Rule(object):
             string += "\t Supports rules: [" + supports_r_str + "]\n"
         return string
 
+    @property
+    def supports_facts(self):
+        """Facts that this rule supports
+        """
+        return Justification.conclusions(self.supports, Fact)
+
+    @property
+    def supports_rules(self):
+        """Rules that this rule supports
+        """
+        return Justification.conclusions(self.supports, Rule)
+
     def __eq__(self, other):
         """Define behavior of == when applied to this object
         """
         is_rule = isinstance(other, Rule)
         return is_rule and self.lhs == other.lhs and self.rhs == other.rhs
 
+    def __hash__(self):
+        """Define hash consistent with ==, rules hash on their LHS and RHS
+        """
+        return hash((tuple(self.lhs), self.rhs))
+
     def __ne__(self, other):
         """Define behavior of != when applied to this object
         """
         return not self == other
 
+class Justification(object):
+    """One way of inferring a fact or rule: a fact matching the first
+        premise of a rule. A Justification is held in the supported_by set of
+        its conclusion and in the supports sets of its fact and rule, so it
+        can be added and removed on all three in constant time. Iterating over
+        it gives the fact and then the rule, like the old [fact, rule] pairs.
+
+    Attributes:
+        fact (Fact): the fact that matched
+        rule (Rule): the rule whose first premise it matched
+        conclusion (Fact|Rule): the fact or rule inferred from them
+    """
+    __slots__ = ('fact', 'rule', 'conclusion')
+
+    def __init__(self, fact, rule, conclusion=None):
+        """Constructor for Justification, attach() links it into the support graph
+
+        Args:
+            fact (Fact): the fact that matched
+            rule (Rule): the rule whose first premise it matched
+            conclusion (Fact|Rule): the fact or rule inferred from them
+        """
+        super(Justification, self).__init__()
+        self.fact = fact
+        self.rule = rule
+        self.conclusion = conclusion
+
+    def __repr__(self):
+        """Define internal string representation, premises only to keep
+            the support graph's cycles out of it
+        """
+        return 'Justification({!r}, {!r}, {!r})'.format(
+                self.fact.statement, self.rule.lhs, self.rule.rhs)
+
+    def __iter__(self):
+        """Iterate over the fact and the rule
+        """
+        yield self.fact
+        yield self.rule
+
+    def attach(self, conclusion):
+        """Record this Justification on conclusion and on both premises
+
+        Args:
+            conclusion (Fact|Rule): the stored fact or rule it supports
+        """
+        self.conclusion = conclusion
+        conclusion.supported_by[self] = None
+        self.fact.supports[self] = None
+        self.rule.supports[self] = None
+
+    def detach(self):
+        """Remove this Justification from its conclusion and both premises
+        """
+        self.conclusion.supported_by.pop(self, None)
+        self.fact.supports.pop(self, None)
+        self.rule.supports.pop(self, None)
+
+    @staticmethod
+    def make_all(supported_by, conclusion):
+        """Build the supported_by set of a new fact or rule. The
+            Justifications point at it but are only recorded on their
+            premises once attached to the stored copy.
+
+        Args:
+            supported_by (listof Justification|Fact|Rule): Justifications, or
+                the facts and rules of Justifications in alternating order
+            conclusion (Fact|Rule): the new fact or rule
+
+        Returns:
+            dictof Justification: ordered set of Justifications
+        """
+        justifications = {}
+        items = iter(supported_by)
+        for item in items:
+            if not isinstance(item, Justification):
+                item = Justification(item, next(items))
+            item.conclusion = conclusion
+            justifications[item] = None
+        return justifications
+
+    @staticmethod
+    def conclusions(justifications, kind):
+        """Conclusions of the given kind among justifications
+
+        Args:
+            justifications (dictof Justification): a supports set
+            kind (type): Fact or Rule
+
+        Returns:
+            listof Fact|Rule
+        """
+        return [j.conclusion for j in justifications if isinstance(j.conclusion, kind)]
+
+
 class Statement(object):
     """Represents a statement in our knowledge base, e.g. (attacked Ai Nosliw),
         (diamonds Loot), (isa Sorceress Wizard), etc. These statements show up
-        in Facts or on the LHS and RHS of Rules
+        in Facts or on the LHS and RHS of Rules. Statements are immutable and
+        hash-consed: building a statement equal to an existing one returns the
+        existing instance, so equal statements are identical.
 
     Attributes:
-        terms (listof Term): List of terms (Variable or Constant) in the
+        terms (tupleof Term): Terms (Variable or Constant) in the
             statement, e.g. 'Nosliw' or '?d'
         predicate (str): The predicate of the statement, e.g. isa, hero, needs
+        ground (bool): whether none of the terms is a Variable
     """
-    def __init__(self, statement_list=[]):
+    __slots__ = ('terms', 'predicate', 'hash', 'ground', '__weakref__')
+    interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, statement_list=[]):
         """Constructor for Statements with optional list of Statements that are
             converted to appropriate terms (and one predicate)
 
@@ -171,19 +317,44 @@ class Statement(object):
                 index 0 is the predicate of the statement (a str) while the rest of
                 the list is either instantiated Terms or strings to be passed to the
                 Term constructor
+
+        Returns:
+            Statement: the one instance of this statement
         """
-        super(Statement, self).__init__()
-        self.terms = []
-        self.predicate = ""
+        key = (statement_list[0],) if statement_list else ("",)
+        key += tuple(t if isinstance(t, Term) else Term(t) for t in statement_list[1:])
+        self = cls.interned.get(key)
+        if self is None:
+            with intern_lock:
+                self = cls.interned.get(key)
+                if self is None:
+                    self = object.__new__(cls)
+                    object.__setattr__(self, 'predicate', key[0])
+                    object.__setattr__(self, 'terms', key[1:])
+                    object.__setattr__(self, 'hash', hash(key))
+                    object.__setattr__(self, 'ground', not any(t.is_variable for t in key[1:]))
+                    cls.interned[key] = self
+        return self
 
-        if statement_list:
-            self.predicate = statement_list[0]
-            self.terms = [t if isinstance(t, Term) else Term(t) for t in statement_list[1:]]
+    def __init__(self, statement_list=[]):
+        """Everything is set up once by __new__
+        """
+        pass
+
+    def __setattr__(self, name, value):
+        """Statements are shared, so they can't be changed
+        """
+        raise AttributeError("Statement is immutable")
+
+    def __reduce__(self):
+        """Rebuild through the constructor so copies are interned too
+        """
+        return (Statement, ([self.predicate] + list(self.terms),))
 
     def __repr__(self):
         """Define internal string representation
         """
-        return 'Statement({!r}, {!r})'.format(self.predicate, self.terms)
+        return 'Statement({!r}, {!r})'.format(self.predicate, list(self.terms))
 
     def __str__(self):
         """Define external representation when printed
@@ -191,40 +362,74 @@ class Statement(object):
         return "(" + self.predicate + " " + ' '.join((str(t) for t in self.terms)) + ")"
 
     def __eq__(self, other):
-        """Define behavior of == when applied to this object
+        """Define behavior of == when applied to this object, equal
+            statements are the same instance
         """
-        if self.predicate != other.predicate:
-            return False
+        return self is other
 
-        for self_term, other_term in zip(self.terms, other.terms):
-            if self_term != other_term:
-                return False
-
-        return True
+    def __hash__(self):
+        """Define hash consistent with ==, statements hash on predicate and terms
+        """
+        return self.hash
 
     def __ne__(self, other):
         """Define behavior of != when applied to this object
         """
-        return not self == other
+        return self is not other
 
 class Term(object):
     """Represents a term (a Variable or Constant) in our knowledge base. Can
         sorta be thought of as a super class of Variable and Constant, though
-        there is no inheritance implemented in the code.
+        there is no inheritance implemented in the code. Terms are immutable
+        and hash-consed like Statements.
 
     Attributes:
         term (Variable|Constant): The Variable or Constant that this term holds (represents)
+        is_variable (bool): whether term is a Variable
     """
-    def __init__(self, term):
+    __slots__ = ('term', 'is_variable', '__weakref__')
+    interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, term):
         """Constructor for Term which converts term to appropriate form
 
         Args:
-            term (Variable|Constant|string): Either an instantiated Variable or
-                Constant, or a string to be passed to the appropriate constructor
+            term (Term|Variable|Constant|string): Either an instantiated Term,
+                Variable or Constant, or a string to be passed to the
+                appropriate constructor
+
+        Returns:
+            Term: the one instance of this term
+        """
+        if isinstance(term, Term):
+            return term
+        if not (isinstance(term, Variable) or isinstance(term, Constant)):
+            term = Variable(term) if is_var(term) else Constant(term)
+        self = cls.interned.get(term)
+        if self is None:
+            with intern_lock:
+                self = cls.interned.get(term)
+                if self is None:
+                    self = object.__new__(cls)
+                    object.__setattr__(self, 'term', term)
+                    object.__setattr__(self, 'is_variable', isinstance(term, Variable))
+                    cls.interned[term] = self
+        return self
+
+    def __init__(self, term):
+        """Everything is set up once by __new__
+        """
+        pass
+
+    def __setattr__(self, name, value):
+        """Terms are shared, so they can't be changed
+        """
+        raise AttributeError("Term is immutable")
+
+    def __reduce__(self):
+        """Rebuild through the constructor so copies are interned too
         """
-        super(Term, self).__init__()
-        is_var_or_const = isinstance(term, Variable) or isinstance(term, Constant)
-        self.term = term if is_var_or_const else (Variable(term) if is_var(term) else Constant(term))
+        return (Term, (self.term,))
 
     def __repr__(self):
         """Define internal string representation
@@ -237,12 +442,15 @@ class Term(object):
         return str(self.term)
 
     def __eq__(self, other):
-        """Define behavior of == when applied to this object
+        """Define behavior of == when applied to this object, a Term also
+            equals the Variable or Constant it holds
+        """
+        return self is other or self.term is other
+
+    def __hash__(self):
+        """Define hash consistent with ==, so equal terms share a hash
         """
-        return (self is other
-            or isinstance(other, Term) and self.term.element == other.term.element
-            or ((isinstance(other, Variable) or isinstance(other, Constant))
-                and self.term.element == other.element))
+        return hash(self.term.element)
 
     def __ne__(self, other):
         """Define behavior of != when applied to this object
@@ -250,19 +458,48 @@ class Term(object):
         return not self == other
 
 class Variable(object):
-    """Represents a variable used in statements
+    """Represents a variable used in statements. Variables are immutable and
+        hash-consed on their name.
 
     Attributes:
         element (str): The name of the variable, e.g. '?x'
     """
-    def __init__(self, element):
+    __slots__ = ('element', '__weakref__')
+    interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, element):
         """Constructor for Variable
 
         Args:
             element (str): The name of the variable, e.g. '?x'
+
+        Returns:
+            Variable: the one instance of this variable
         """
-        super(Variable, self).__init__()
-        self.element = element
+        self = cls.interned.get(element)
+        if self is None:
+            with intern_lock:
+                self = cls.interned.get(element)
+                if self is None:
+                    self = object.__new__(cls)
+                    object.__setattr__(self, 'element', element)
+                    cls.interned[element] = self
+        return self
+
+    def __init__(self, element):
+        """Everything is set up once by __new__
+        """
+        pass
+
+    def __setattr__(self, name, value):
+        """Variables are shared, so they can't be changed
+        """
+        raise AttributeError("Variable is immutable")
+
+    def __reduce__(self):
+        """Rebuild through the constructor so copies are interned too
+        """
+        return (Variable, (self.element,))
 
     def __repr__(self):
         """Define internal string representation
@@ -275,12 +512,15 @@ class Variable(object):
         return str(self.element)
 
     def __eq__(self, other):
-        """Define behavior of == when applied to this object
+        """Define behavior of == when applied to this object, a Variable also
+            equals the Term holding it
         """
-        return (self is other
-            or isinstance(other, Term) and self.term.element == other.term.element
-            or ((isinstance(other, Variable) or isinstance(other, Constant))
-                and self.term.element == other.element))
+        return self is other or isinstance(other, Term) and other.term is self
+
+    def __hash__(self):
+        """Define hash consistent with ==, so equal terms share a hash
+        """
+        return hash(self.element)
 
     def __ne__(self, other):
         """Define behavior of != when applied to this object
@@ -288,19 +528,48 @@ class Variable(object):
         return not self == other
 
 class Constant(object):
-    """Represents a constant used in statements
+    """Represents a constant used in statements. Constants are immutable and
+        hash-consed on their value.
 
     Attributes:
         element (str): The value of the constant, e.g. 'Nosliw'
     """
-    def __init__(self, element):
+    __slots__ = ('element', '__weakref__')
+    interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, element):
         """Constructor for Constant
 
         Args:
             element (str): The value of the constant, e.g. 'Nosliw'
+
+        Returns:
+            Constant: the one instance of this constant
         """
-        super(Constant, self).__init__()
-        self.element = element
+        self = cls.interned.get(element)
+        if self is None:
+            with intern_lock:
+                self = cls.interned.get(element)
+                if self is None:
+                    self = object.__new__(cls)
+                    object.__setattr__(self, 'element', element)
+                    cls.interned[element] = self
+        return self
+
+    def __init__(self, element):
+        """Everything is set up once by __new__
+        """
+        pass
+
+    def __setattr__(self, name, value):
+        """Constants are shared, so they can't be changed
+        """
+        raise AttributeError("Constant is immutable")
+
+    def __reduce__(self):
+        """Rebuild through the constructor so copies are interned too
+        """
+        return (Constant, (self.element,))
 
     def __repr__(self):
         """Define internal string representation
@@ -313,12 +582,15 @@ class Constant(object):
         return str(self.element)
 
     def __eq__(self, other):
-        """Define behavior of == when applied to this object
+        """Define behavior of == when applied to this object, a Constant also
+            equals the Term holding it
         """
-        return (self is other
-            or isinstance(other, Term) and self.term.element == other.term.element
-            or ((isinstance(other, Variable) or isinstance(other, Constant))
-                and self.term.element == other.element))
+        return self is other or isinstance(other, Term) and other.term is self
+
+    def __hash__(self):
+        """Define hash consistent with ==, so equal terms share a hash
+        """
+        return hash(self.element)
 
     def __ne__(self, other):
         """Define behavior of != when applied to this object
@@ -333,6 +605,8 @@ class Binding(object):
         variable (Variable): The name of the variable associated with this binding
         constant (Constant): The value of the variable
     """
+    __slots__ = ('variable', 'constant')
+
     def __init__(self, variable, constant):
         """Constructor for Binding
 
@@ -363,6 +637,8 @@ class Bindings(object):
             bound variable and value is bound value,
             e.g. some_bindings.bindings_dict['?d'] => 'Nosliw'
     """
+    __slots__ = ('bindings', 'bindings_dict')
+
     def __init__(self):
         """Constructor for Bindings creating initially empty instance
         """
@@ -429,10 +705,10 @@ class Bindings(object):
             bool: if variable bound returns whether or not bound value matches value_term,
                 else True
         """
-        bound = self.bound_to(variable_term.term)
+        bound = self.bindings_dict.get(variable_term.term.element)
         if bound:
-            return value_term.term == bound
-            
+            return value_term.term.element == bound
+
         self.add_binding(variable_term.term, value_term.term)
         return True
 
@@ -443,6 +719,8 @@ class ListOfBindings(object):
         Attributes:
             list_of_bindings (listof Bindings): collects Bindings
     """
+    __slots__ = ('list_of_bindings',)
+
     def __init__(self):
         """Constructor for ListOfBindings
         """
@@ -487,3 +765,442 @@ class ListOfBindings(object):
                 Nothing
         """
         self.list_of_bindings.append((bindings, facts_rules))
+
+
+class PatternMatcher(object):
+    """A statement pattern compiled once for matching many statements
+        against it: the predicate and arity to check, the positions that must
+        hold given constants, the positions binding a variable for the first
+        time and the positions repeating an earlier variable. Calling it on a
+        ground statement gives the same result as match(statement, pattern)
+        without rediscovering the pattern's structure; other statements go
+        through match.
+
+        Attributes:
+            pattern (Statement): the compiled pattern
+            constants (tupleof tuple): (position, Term) for every constant
+            slots (tupleof tuple): (position, Variable) for the first
+                occurrence of every variable
+            repeats (tupleof tuple): (position, earlier position) for every
+                further occurrence of a variable
+    """
+    __slots__ = ('pattern', 'constants', 'slots', 'repeats')
+
+    def __init__(self, pattern):
+        """Constructor for PatternMatcher
+
+        Args:
+            pattern (Statement): the pattern to compile
+        """
+        super(PatternMatcher, self).__init__()
+        self.pattern = pattern
+        constants, slots, repeats, first = [], [], [], {}
+        for i, term in enumerate(pattern.terms):
+            if not term.is_variable:
+                constants.append((i, term))
+            elif term in first:
+                repeats.append((i, first[term]))
+            else:
+                first[term] = i
+                slots.append((i, term.term))
+        self.constants = tuple(constants)
+        self.slots = tuple(slots)
+        self.repeats = tuple(repeats)
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'PatternMatcher({!r})'.format(self.pattern)
+
+    def __call__(self, statement):
+        """Match statement against the pattern
+
+        Args:
+            statement (Statement): statement to match
+
+        Returns:
+            Bindings|False: bindings of the pattern's variables or no match found
+        """
+        if not self.matches(statement):
+            return False
+        if not statement.ground:
+            return match(statement, self.pattern)
+        terms = statement.terms
+        bindings = Bindings()
+        for i, variable in self.slots:
+            bindings.add_binding(variable, terms[i].term)
+        return bindings
+
+    def matches(self, statement):
+        """Check whether statement matches the pattern without building
+            Bindings
+
+        Args:
+            statement (Statement): statement to match
+
+        Returns:
+            bool
+        """
+        pattern = self.pattern
+        terms = statement.terms
+        if statement.predicate != pattern.predicate or len(terms) != len(pattern.terms):
+            return False
+        if not statement.ground:
+            return match(statement, pattern) is not False
+        for i, term in self.constants:
+            if terms[i] is not term:
+                return False
+        for i, j in self.repeats:
+            if terms[i] is not terms[j]:
+                return False
+        return True
+
+
+class IndexedList(object):
+    """Ordered container of Facts or Rules that behaves like a list but is
+        backed by a dict keyed on the items themselves, so membership tests,
+        lookups of the stored equal item and removal are O(1)
+
+        Attributes:
+            items (dictof Fact|Rule): maps every stored item to itself, in
+                insertion order
+    """
+    __slots__ = ('items',)
+
+    def __init__(self, items=[]):
+        """Constructor for IndexedList
+
+        Args:
+            items (listof Fact|Rule): initial contents, duplicates are dropped
+        """
+        super(IndexedList, self).__init__()
+        self.items = {}
+        for item in items:
+            self.append(item)
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return repr(list(self.items))
+
+    def __len__(self):
+        """Define behavior of len, when called on this class
+        """
+        return len(self.items)
+
+    def __iter__(self):
+        """Iterate over a snapshot of the items in insertion order, so the
+            container may be extended while it is being walked (e.g. by
+            inference triggered from inside the loop)
+        """
+        return iter(list(self.items))
+
+    def __contains__(self, item):
+        """Define behavior of `in`, O(1) thanks to hashing
+        """
+        return item in self.items
+
+    def __getitem__(self, key):
+        """Define behavior for indexing and slicing, like a list (O(n))
+        """
+        return list(self.items)[key]
+
+    def __eq__(self, other):
+        """Define behavior of == against other IndexedLists or plain lists
+        """
+        if isinstance(other, IndexedList):
+            other = list(other.items)
+        return list(self.items) == other
+
+    def __ne__(self, other):
+        """Define behavior of != when applied to this object
+        """
+        return not self == other
+
+    def get(self, item):
+        """Get the stored item that is equal to the item argument
+
+        Args:
+            item (Fact|Rule): item we're searching for
+
+        Returns:
+            Fact|Rule|None: the stored item, None if there is none
+        """
+        return self.items.get(item)
+
+    def append(self, item):
+        """Add an item at the end unless an equal item is already stored
+
+        Args:
+            item (Fact|Rule): item to add
+        """
+        if item not in self.items:
+            self.items[item] = item
+
+    def remove(self, item):
+        """Remove the stored item equal to the item argument
+
+        Args:
+            item (Fact|Rule): item to remove
+
+        Raises:
+            ValueError: if no equal item is stored, like list.remove
+        """
+        if item not in self.items:
+            raise ValueError("IndexedList.remove(x): x not in list")
+        del self.items[item]
+
+    def remove_many(self, items):
+        """Remove the stored items equal to each of the items
+
+        Args:
+            items (listof Fact|Rule): items to remove
+
+        Raises:
+            ValueError: if one of them is not stored
+        """
+        for item in items:
+            self.remove(item)
+
+    def index(self, item):
+        """Position of the stored item equal to the item argument (O(n))
+
+        Raises:
+            ValueError: if no equal item is stored, like list.index
+        """
+        if item not in self.items:
+            raise ValueError("{!r} is not in list".format(item))
+        return list(self.items).index(item)
+
+class FactStore(IndexedList):
+    """IndexedList of Facts that also keeps a discrimination index: facts are
+        filed by predicate, then by (argument position, constant). Queries
+        whose predicate and some arguments are bound only need to look at
+        the facts filed under all of those keys.
+
+        Attributes:
+            by_predicate (dictof dict): maps a predicate to an insertion
+                ordered dict (used as an ordered set) of the facts using it
+            by_argument (dictof dict): maps a predicate to a dict from
+                (position, constant) to the ordered set of facts having that
+                constant at that position. Facts with a variable at a
+                position are filed under (position, None) since they can
+                match any constant there
+            distinct (dictof dict): maps a predicate to a dict from position
+                to the number of index keys at that position, i.e. of
+                distinct constants there (plus one if some fact has a
+                variable there); statistics for estimate
+    """
+    __slots__ = ('by_predicate', 'by_argument', 'distinct')
+
+    def __init__(self, items=[]):
+        """Constructor for FactStore
+
+        Args:
+            items (listof Fact): initial contents, duplicates are dropped
+        """
+        self.by_predicate = {}
+        self.by_argument = {}
+        self.distinct = {}
+        super(FactStore, self).__init__(items)
+
+    def append(self, fact):
+        """Add a fact at the end unless an equal fact is already stored, and
+            file it in the index
+
+        Args:
+            fact (Fact): fact to add
+        """
+        if fact in self.items:
+            return
+        self.items[fact] = fact
+        self._file(fact)
+
+    def _file(self, fact):
+        """File a stored fact in the index
+        """
+        statement = self._statement(fact)
+        self.by_predicate.setdefault(statement.predicate, {})[fact] = None
+        postings = self.by_argument.setdefault(statement.predicate, {})
+        distinct = self.distinct.setdefault(statement.predicate, {})
+        for key in self._keys(statement):
+            posting = postings.get(key)
+            if posting is None:
+                posting = postings[key] = {}
+                distinct[key[0]] = distinct.get(key[0], 0) + 1
+            posting[fact] = None
+
+    def remove(self, fact):
+        """Remove the stored fact equal to the fact argument and unfile it
+
+        Args:
+            fact (Fact): fact to remove
+
+        Raises:
+            ValueError: if no equal fact is stored, like list.remove
+        """
+        super(FactStore, self).remove(fact)
+        statement = self._statement(fact)
+        facts = self.by_predicate[statement.predicate]
+        del facts[fact]
+        if not facts:
+            del self.by_predicate[statement.predicate]
+        postings = self.by_argument[statement.predicate]
+        distinct = self.distinct[statement.predicate]
+        for key in self._keys(statement):
+            posting = postings[key]
+            del posting[fact]
+            if not posting:
+                del postings[key]
+                distinct[key[0]] -= 1
+        if not postings:
+            del self.by_argument[statement.predicate]
+            del self.distinct[statement.predicate]
+
+    def remove_many(self, facts):
+        """Remove the stored facts equal to each of the facts. A predicate
+            losing more than half of its facts has its index rebuilt from the
+            survivors instead of being unfiled one fact at a time.
+
+        Args:
+            facts (listof Fact): facts to remove
+
+        Raises:
+            ValueError: if one of them is not stored
+        """
+        by_predicate = {}
+        for fact in facts:
+            if fact not in self.items:
+                raise ValueError("FactStore.remove_many(x): x not in list")
+            by_predicate.setdefault(self._statement(fact).predicate, {})[fact] = None
+        for predicate, removed in by_predicate.items():
+            stored = self.by_predicate[predicate]
+            if 2 * len(removed) <= len(stored):
+                for fact in removed:
+                    self.remove(fact)
+                continue
+            for fact in removed:
+                del self.items[fact]
+            del self.by_predicate[predicate]
+            del self.by_argument[predicate]
+            del self.distinct[predicate]
+            for fact in stored:
+                if fact not in removed:
+                    self._file(fact)
+
+    def candidates(self, statement):
+        """Facts that may match statement: those with the same predicate that
+            agree with every constant of statement. They come in insertion
+            order unless variables of stored facts had to be taken into
+            account. The caller still has to run match on each of them.
+
+        Args:
+            statement (Statement): pattern to look up
+
+        Returns:
+            listof Fact: candidate facts
+        """
+        driver, filters = self._lookup(statement)
+        return [fact for posting in driver for fact in posting
+                if all(fact in exact or fact in loose for exact, loose in filters)]
+
+    def iter_candidates(self, statement):
+        """Generate the candidates of statement one at a time, in the order
+            candidates returns them, without matching them all first. The
+            store may change in the meantime: facts removed since are
+            skipped, facts stored since may be missed.
+
+        Args:
+            statement (Statement): pattern to look up
+
+        Yields:
+            Fact: candidate facts
+        """
+        driver, filters = self._lookup(statement)
+        items = self.items
+        for posting in driver:
+            for fact in list(posting):
+                if fact in items and all(fact in exact or fact in loose
+                                         for exact, loose in filters):
+                    yield fact
+
+    def _lookup(self, statement):
+        """Postings to walk for the candidates of statement, the shortest
+            ones its constants select, and the (exact, loose) postings of
+            every constant that a candidate must be in one of
+        """
+        facts = self.by_predicate.get(statement.predicate)
+        if not facts:
+            return (), ()
+        postings = self.by_argument[statement.predicate]
+        filters = []
+        driver = [facts]
+        size = len(facts)
+        for key in self._keys(statement):
+            if key[1] is None:
+                continue
+            exact = postings.get(key, {})
+            loose = postings.get((key[0], None), {})
+            if not exact and not loose:
+                return (), ()
+            filters.append((exact, loose))
+            if len(exact) + len(loose) < size:
+                driver = [exact, loose]
+                size = len(exact) + len(loose)
+        return driver, filters
+
+    def estimate(self, statement, bound=()):
+        """Estimate how many facts match statement once the variables in
+            bound have values: the smallest posting list size among its
+            constants, or for a bound variable the predicate's fact count
+            over the number of distinct constants at that position
+
+        Args:
+            statement (Statement): pattern to estimate
+            bound (setof str): names of variables that will have values
+
+        Returns:
+            float: estimated number of matching facts
+        """
+        facts = self.by_predicate.get(statement.predicate)
+        if not facts:
+            return 0
+        postings = self.by_argument[statement.predicate]
+        distinct = self.distinct[statement.predicate]
+        estimate = len(facts)
+        for key, term in zip(self._keys(statement), statement.terms):
+            if key[1] is not None:
+                size = len(postings.get(key, ())) + len(postings.get((key[0], None), ()))
+            elif term.term.element in bound:
+                size = len(facts) / float(max(distinct.get(key[0], 1), 1))
+            else:
+                continue
+            estimate = min(estimate, size)
+        return estimate
+
+    def _statement(self, fact):
+        """Statement a stored item is filed under
+        """
+        return fact.statement
+
+    @staticmethod
+    def _keys(statement):
+        """Index keys of statement: (position, constant) for every argument,
+            with None in place of the constant for variables
+        """
+        return [(i, None if is_var(term) else term.term.element)
+                for i, term in enumerate(statement.terms)]
+
+
+class RuleStore(FactStore):
+    """IndexedList of Rules filed like a FactStore under their first premise,
+        so the rules a new fact may trigger are found without walking all of
+        them: candidates(fact.statement) returns the rules whose first premise
+        may match the fact
+    """
+    __slots__ = ()
+
+    def _statement(self, rule):
+        """Statement a stored item is filed under
+        """
+        return rule.lhs[0]
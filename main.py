@@ -1,16 +1,34 @@
 import unittest
-import read, copy
+import read, contextlib, copy, io, os, tempfile
 from logical_classes import *
 from student_code import KnowledgeBase
+from rete import ReteEngine
+from agenda import LifoAgenda, PriorityAgenda
+from backward import BackwardEngine, TabledSolver
+from cache import QueryCache
+from metrics import Metrics
+from journal import Journal
+from parallel import ParallelInferenceEngine
+from concurrency import ConcurrentKnowledgeBase
+from server import KBServer
+from client import Client
+import asyncio, sys, threading
+import columnar
+from benchmark import generate, suite
+from columnar import ColumnarFactStore
+from util import match, matches
 
 class KBTest(unittest.TestCase):
 
+    def make_kb(self):
+        return KnowledgeBase([], [])
+
     def setUp(self):
         # Assert starter facts
         file = 'statements_kb4.txt'
         self.data = read.read_tokenize(file)
         data = read.read_tokenize(file)
-        self.KB = KnowledgeBase([], [])
+        self.KB = self.make_kb()
         for item in data:
             if isinstance(item, Fact) or isinstance(item, Rule):
                 self.KB.kb_assert(item)
@@ -72,6 +90,559 @@ class KBTest(unittest.TestCase):
         answer = self.KB.kb_ask(ask1)
         self.assertEqual(str(answer[0]), "?X : bing")
 
+    def test6(self):
+        # makes sure duplicates are found by hash and stored only once
+        f1 = read.parse_input("fact: (motherof ada bing)")
+        self.assertEqual(hash(f1), hash(self.KB.facts[0]))
+        count = len(self.KB.facts)
+        self.KB.kb_assert(f1)
+        self.assertEqual(len(self.KB.facts), count)
+        self.assertTrue(self.KB._get_fact(f1) is self.KB.facts[0])
+
+    def test7(self):
+        # makes sure the discrimination index narrows asks and follows retracts
+        ask1 = read.parse_input("fact: (motherof ?X chen)")
+        candidates = self.KB.facts.candidates(ask1.statement)
+        self.assertEqual([str(f.statement) for f in candidates],
+                         ["(motherof bing chen)", "(motherof dolores chen)"])
+        self.KB.kb_retract(read.parse_input("fact: (motherof bing chen)"))
+        answer = self.KB.kb_ask(ask1)
+        self.assertEqual(len(answer), 1)
+        self.assertEqual(str(answer[0]), "?X : dolores")
+
+    def test8(self):
+        # makes sure long inference chains do not recurse
+        kbs = [KnowledgeBase([], []), KnowledgeBase([], [], agenda=LifoAgenda())]
+        for kb in kbs:
+            kb.kb_assert(read.parse_input("rule: ((inst ?x ?y) (isa ?y ?z)) -> (inst ?x ?z)"))
+            for i in range(500):
+                kb.kb_assert(read.parse_input("fact: (isa c%d c%d)" % (i, i + 1)))
+            kb.kb_assert(read.parse_input("fact: (inst obj c0)"))
+        ask1 = read.parse_input("fact: (inst obj c500)")
+        self.assertEqual(len(kbs[0].kb_ask(ask1)), 1)
+        self.assertEqual(set(str(f.statement) for f in kbs[0].facts),
+                         set(str(f.statement) for f in kbs[1].facts))
+        # a PriorityAgenda pops smallest keys first, equal keys in order
+        agenda = PriorityAgenda(key=lambda item: len(item.statement.terms))
+        items = [read.parse_input("fact: " + s) for s in ("(a b c)", "(d e)", "(f g h)", "(i j)")]
+        for item in items:
+            agenda.push(item)
+        self.assertEqual([agenda.pop() for _ in items], [items[1], items[3], items[0], items[2]])
+        self.assertEqual(len(agenda), 0)
+
+    def test9(self):
+        # makes sure batch assertion ends in the same KB as one at a time
+        KB = self.make_kb()
+        KB.kb_assert_many(self.data)
+        self.assertEqual(set(str(f.statement) for f in KB.facts),
+                         set(str(f.statement) for f in self.KB.facts))
+        ask1 = read.parse_input("fact: (grandmotherof ada chen)")
+        fact1 = KB._get_fact(ask1)
+        self.assertFalse(fact1.asserted)
+        self.assertEqual(len(fact1.supported_by), 1)
+        KB.kb_retract(read.parse_input("fact: (motherof ada bing)"))
+        self.assertFalse(KB.kb_ask(ask1))
+
+    def test10(self):
+        # makes sure equal statements and terms are shared, immutable instances
+        f1 = read.parse_input("fact: (motherof ada bing)")
+        self.assertTrue(f1.statement is self.KB.facts[0].statement)
+        self.assertTrue(f1.statement.terms[0] is Term("ada"))
+        self.assertTrue(Term("?x").term is Variable("?x"))
+        self.assertRaises(AttributeError, setattr, f1.statement, "predicate", "isa")
+        self.assertFalse(hasattr(f1, "__dict__"))
+
+    def test11(self):
+        # makes sure repeated variables are checked by match and matches
+        pattern = read.parse_input("fact: (likes ?x ?x)").statement
+        same = read.parse_input("fact: (likes ada ada)").statement
+        other = read.parse_input("fact: (likes ada bing)").statement
+        self.assertEqual(str(match(same, pattern)), "?X : ada")
+        self.assertFalse(match(other, pattern))
+        self.assertTrue(matches(pattern, same))
+        self.assertFalse(matches(pattern, other))
+
+    def test12(self):
+        # makes sure compiled rule premises match like util.match
+        rule1 = read.parse_input("rule: ((likes ?x ?x ada) (isa ?x ?y)) -> (self ?x)")
+        for text in ["(likes bo bo ada)", "(likes bo bo eve)", "(likes bo al ada)", "(likes bo bo)"]:
+            statement = read.parse_input("fact: " + text).statement
+            self.assertEqual(str(rule1.matcher(statement)), str(match(statement, rule1.lhs[0])))
+            self.assertEqual(rule1.matcher.matches(statement), bool(match(statement, rule1.lhs[0])))
+
+    def test13(self):
+        # makes sure a fact can take part in several justifications of one fact
+        for text in ["fact: (pet rex)",
+                     "rule: ((pet ?x)) -> (happy home)",
+                     "rule: ((pet ?x) (pet ?x)) -> (happy home)"]:
+            self.KB.kb_assert(read.parse_input(text))
+        pet = self.KB._get_fact(read.parse_input("fact: (pet rex)"))
+        happy = self.KB._get_fact(read.parse_input("fact: (happy home)"))
+        self.assertEqual(len(happy.supported_by), 2)
+        self.assertEqual([j.fact for j in happy.supported_by], [pet, pet])
+        self.assertEqual(len(pet.supports_facts), 2)
+        self.KB.kb_retract(pet)
+        self.assertFalse(self.KB.kb_ask(read.parse_input("fact: (happy ?x)")))
+        self.assertEqual(len(self.KB.rules.candidates(pet.statement)), 2)
+        # a fact asserted after the rule can match two premises of it
+        for text in ["rule: ((likes ?x ?y) (likes ?y ?x)) -> (mutual ?x ?y)",
+                     "rule: ((pet ?x) (pet ?y)) -> (pair ?x ?y)",
+                     "fact: (likes a a)", "fact: (pet rex)"]:
+            self.KB.kb_assert(read.parse_input(text))
+        for text in ["fact: (mutual a a)", "fact: (pair rex rex)"]:
+            self.assertEqual(len(self.KB._get_fact(read.parse_input(text)).supported_by), 1)
+
+    def test14(self):
+        # makes sure batch retraction matches one-at-a-time retraction
+        texts = ["fact: (motherof ada bing)", "fact: (motherof greta felix)",
+                 "fact: (grandmotherof ada felix)", "fact: (sisters ada eva)"]
+        KB = self.make_kb()
+        KB.kb_assert_many(self.data)
+        KB.kb_retract_many([read.parse_input(text) for text in texts])
+        for text in texts:
+            self.KB.kb_retract(read.parse_input(text))
+        self.assertEqual([str(f.statement) for f in KB.facts],
+                         [str(f.statement) for f in self.KB.facts])
+        motherof = read.parse_input("fact: (motherof ?X ?Y)").statement
+        self.assertEqual(len(KB.facts.candidates(motherof)), 2)
+        self.assertFalse(KB.kb_ask(read.parse_input("fact: (grandmotherof ?X ?Y)")))
+
+    def test15(self):
+        # makes sure retracting the root of a long chain does not recurse
+        KB = self.make_kb()
+        KB.kb_assert(read.parse_input("rule: ((inst ?x ?y) (isa ?y ?z)) -> (inst ?x ?z)"))
+        for i in range(2000):
+            KB.kb_assert(read.parse_input("fact: (isa c%d c%d)" % (i, i + 1)))
+        KB.kb_assert(read.parse_input("fact: (inst obj c0)"))
+        self.assertEqual(len(KB.facts), 4001)
+        KB.kb_retract(read.parse_input("fact: (inst obj c0)"))
+        self.assertEqual(len(KB.facts), 2000)
+
+    def test16(self):
+        # makes sure backward asks find what forward chaining materializes
+        KB = KnowledgeBase([], [], engine=BackwardEngine())
+        KB.kb_assert_many(read.read_tokenize('statements_kb4.txt'))
+        self.assertEqual(len(KB.facts), 6)
+        ask1 = read.parse_input("fact: (grandmotherof ada ?X)")
+        answer = KB.kb_ask(ask1, mode="backward")
+        self.assertEqual([str(b) for b in answer], ["?X : felix", "?X : chen"])
+        # a proved answer that isn't stored isn't asserted either
+        proved = answer.list_of_bindings[1][1][0]
+        self.assertIsNone(KB._get_fact(proved))
+        self.assertFalse(proved.asserted)
+        self.assertEqual(str(self.KB.kb_ask(ask1, mode="backward")[1]), "?X : chen")
+        # recursive rules terminate thanks to tabling
+        KB.kb_assert(read.parse_input("rule: ((isa ?x ?y) (isa ?y ?z)) -> (isa ?x ?z)"))
+        for i in range(30):
+            KB.kb_assert(read.parse_input("fact: (isa c%d c%d)" % (i, i + 1)))
+        KB.kb_assert(read.parse_input("fact: (isa c30 c0)"))
+        answer = KB.kb_ask(read.parse_input("fact: (isa c5 ?X)"), mode="backward")
+        self.assertEqual(len(answer), 31)
+        # a solver asked again answers the new goal, not its first one
+        solver = TabledSolver(KB)
+        self.assertEqual(len(solver.solve(read.parse_input("fact: (isa c5 ?X)").statement)), 31)
+        goal = read.parse_input("fact: (grandmotherof ada ?X)").statement
+        self.assertEqual(len(solver.solve(goal)), 2)
+
+    def test17(self):
+        # makes sure conjunctive asks join their patterns on shared variables
+        ask1 = read.parse_input("fact: (motherof ?X ?Y)")
+        ask2 = read.parse_input("fact: (sisters ?X ?Z)")
+        answer = self.KB.kb_ask_all([ask1, ask2])
+        self.assertEqual(len(answer), 1)
+        self.assertEqual(str(answer[0]), "?X : ada, ?Z : eva, ?Y : bing")
+        self.assertEqual([str(f.statement) for f in answer.list_of_bindings[0][1]],
+                         ["(motherof ada bing)", "(sisters ada eva)"])
+        ask3 = read.parse_input("fact: (grandmotherof ?X ?W)")
+        self.assertEqual(len(self.KB.kb_ask_all([ask1, ask3])), 2)
+        self.assertFalse(self.KB.kb_ask_all([ask2, read.parse_input("fact: (sisters ?Z ?X)")]))
+
+    def test18(self):
+        # makes sure streamed asks stop early and agree with kb_ask
+        ask1 = read.parse_input("fact: (motherof ?X ?Y)")
+        answers = list(self.KB.iter_ask(ask1))
+        self.assertEqual([str(b) for b, facts in answers],
+                         [str(b) for b in self.KB.kb_ask(ask1)])
+        self.assertEqual(len(list(self.KB.iter_ask(ask1, limit=2))), 2)
+        first = next(self.KB.iter_ask(ask1, limit=1))
+        self.assertEqual(str(first[0]), "?X : ada, ?Y : bing")
+        found = list(self.KB.iter_ask(ask1, exists=True))
+        self.assertEqual(len(found), 1)
+        self.assertIsNone(found[0][0])
+        self.assertEqual(str(found[0][1][0].statement), "(motherof ada bing)")
+        ask2 = read.parse_input("fact: (motherof ?X ada)")
+        self.assertEqual(list(self.KB.iter_ask(ask2, exists=True)), [])
+        ask3 = read.parse_input("fact: (grandmotherof ada ?X)")
+        self.assertEqual(len(list(self.KB.iter_ask(ask3, mode="backward", exists=True))), 1)
+        # candidates are looked up lazily and nothing is printed
+        for ask in (ask1, ask2, read.parse_input("fact: (sisters ?X ?X)")):
+            self.assertEqual(list(self.KB.facts.iter_candidates(ask.statement)),
+                             list(self.KB.facts.candidates(ask.statement)))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            next(self.KB.iter_ask(ask1))
+            self.KB.kb_ask_all([ask1, ask3])
+        self.assertEqual(output.getvalue(), "")
+        # the KB may change while a streamed ask is consumed
+        seen = []
+        for bindings, facts in self.KB.iter_ask(ask1):
+            seen.append(str(facts[0].statement))
+            self.KB.kb_assert(read.parse_input("fact: (motherof zoe z{})".format(len(seen))))
+        self.assertEqual(seen[:4], [str(f.statement) for f in self.data[:6]
+                                    if f.statement.predicate == "motherof"])
+        candidates = self.KB.facts.iter_candidates(ask1.statement)
+        next(candidates)
+        self.KB.kb_retract(read.parse_input("fact: (motherof dolores chen)"))
+        self.assertNotIn("(motherof dolores chen)", [str(f.statement) for f in candidates])
+
+    def test19(self):
+        # makes sure cached asks are shared across variable names and only
+        # invalidated by writes to their predicate
+        KB = KnowledgeBase([], [], cache=QueryCache(maxsize=2))
+        KB.kb_assert_many(read.read_tokenize('statements_kb4.txt'))
+        ask1 = read.parse_input("fact: (motherof ?X ?Y)")
+        ask2 = read.parse_input("fact: (motherof ?A ?B)")
+        self.assertEqual(len(KB.kb_ask(ask1)), 4)
+        self.assertEqual(str(KB.kb_ask(ask2)[0]), "?A : ada, ?B : bing")
+        self.assertEqual((KB.cache.hits, KB.cache.misses), (1, 1))
+        KB.kb_assert(read.parse_input("fact: (sisters bing eva)"))
+        self.assertEqual(len(KB.kb_ask(ask1)), 4)
+        self.assertEqual((KB.cache.hits, KB.cache.misses), (2, 1))
+        KB.kb_retract(read.parse_input("fact: (motherof ada bing)"))
+        self.assertEqual(len(KB.kb_ask(ask1)), 3)
+        self.assertEqual((KB.cache.hits, KB.cache.misses), (2, 2))
+        # least recently used entries go first
+        KB.kb_ask(read.parse_input("fact: (sisters ?X ?Y)"))
+        KB.kb_ask(read.parse_input("fact: (parentof ?X ?Y)"))
+        self.assertEqual(len(KB.cache), 2)
+        KB.kb_ask(ask1)
+        self.assertEqual(KB.cache.misses, 5)
+        # a streamed ask is only cached once it has been consumed
+        ask3 = read.parse_input("fact: (grandmotherof ?X ?Y)")
+        next(KB.iter_ask(ask3))
+        self.assertIsNone(KB.cache.get(ask3.statement, "forward"))
+        self.assertEqual(len(list(KB.iter_ask(ask3))), 1)
+        self.assertEqual(len(KB.cache.get(ask3.statement, "forward")), 1)
+
+    def test20(self):
+        # makes sure streamed reading handles multi-line rules and comments
+        items = list(read.iter_tokenize('statements_kb4.txt'))
+        self.assertEqual([str(item) for item in items], [str(item) for item in self.data])
+        text = io.StringIO("# comment\nfact: (isa cube\n block)\n"
+                           "rule: ((inst ?x ?y)\n  # comment\n (isa ?y ?z))->(inst ?x ?z)\n"
+                           "fact: (broken\nrule: (isa ?x ?y) -> (kind ?x)\n")
+        items = list(read.iter_tokenize(text))
+        self.assertEqual(len(items), 3)
+        self.assertEqual(str(items[0].statement), "(isa cube block)")
+        self.assertEqual([str(s) for s in items[1].lhs], ["(inst ?x ?y)", "(isa ?y ?z)"])
+        self.assertEqual(str(items[2].rhs), "(kind ?x)")
+        streamed, listed = self.make_kb(), self.make_kb()
+        streamed.kb_assert_many(read.iter_tokenize('statements_kb4.txt'))
+        listed.kb_assert_many(self.data)
+        self.assertEqual(str(streamed), str(listed))
+
+    def test21(self):
+        # makes sure parallel loading keeps the order of files and statements
+        paths = ['statements_kb4.txt', 'statements_kb.txt']
+        expected = [str(item) for path in paths for item in read.read_tokenize(path)]
+        self.assertGreater(len(read.split_file('statements_kb.txt', 64)), 1)
+        items = read.load_many(paths, workers=2, chunk_size=64)
+        self.assertEqual([str(item) for item in items], expected)
+        items = read.load_many(paths, workers=1)
+        self.assertEqual([str(item) for item in items], expected)
+
+    def test22(self):
+        # makes sure snapshots give back the KB with its support links
+        # without inferring again
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            self.KB.save_snapshot(path)
+            KB = KnowledgeBase.load_snapshot(path, engine=BackwardEngine())
+        finally:
+            os.remove(path)
+        self.assertEqual(str(KB), str(self.KB))
+        for fact in self.KB.facts:
+            self.assertEqual(KB._get_fact(fact).asserted, fact.asserted)
+            self.assertEqual(len(KB._get_fact(fact).supported_by), len(fact.supported_by))
+        KB.ie = self.KB.ie
+        r1 = read.parse_input("fact: (motherof ada bing)")
+        KB.kb_retract(r1)
+        self.KB.kb_retract(r1)
+        self.assertEqual(str(KB), str(self.KB))
+
+    def test23(self):
+        # makes sure a journal and its checkpoints give back the KB
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "kb.journal")
+        try:
+            journal = Journal(path, group_size=2, sync=False)
+            KB = KnowledgeBase([], [], journal=journal)
+            for item in self.data[:5]:
+                KB.kb_assert(item)
+            journal.checkpoint(KB)
+            KB.kb_assert_many(self.data[5:])
+            KB.kb_retract(read.parse_input("fact: (motherof ada bing)"))
+            journal.close()
+            recovered = Journal(path).recover()
+            self.assertEqual(str(recovered), str(KB))
+            self.assertEqual(len(recovered._get_fact(read.parse_input(
+                "fact: (parentof dolores chen)")).supported_by), 1)
+            recovered.kb_assert(read.parse_input("fact: (motherof ada bing)"))
+            recovered.journal.close()
+            self.assertEqual(str(Journal(path).recover()), str(recovered))
+            # replay stops at a torn or unusable record and cuts it off
+            size = os.path.getsize(path)
+            for tail in ["+\tfact: (motherof ada", "+\tfact: (motherof ada\n",
+                         "<\tfact: (auntof ada bing)\n",
+                         "<\tfact: (a b)\tfact: (c d)\trule: ((c ?x)) -> (a ?x)\n"]:
+                with open(path, "a") as file:
+                    file.write(tail)
+                torn = Journal(path).recover()
+                self.assertEqual(str(torn), str(recovered))
+                self.assertEqual(os.path.getsize(path), size)
+            torn.kb_assert(read.parse_input("fact: (motherof bing ada)"))
+            torn.journal.close()
+            self.assertEqual(str(Journal(path).recover()), str(torn))
+        finally:
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            os.rmdir(directory)
+
+    def test24(self):
+        # makes sure rounds matched in worker processes give the same KB
+        for data in (self.data, generate.random_rules(facts=300, constants=30),
+                     generate.hierarchy(classes=30, instances=40)):
+            KB = KnowledgeBase([], [])
+            KB.kb_assert_many(data)
+            for partition in ("first_argument", "predicate"):
+                engine = ParallelInferenceEngine(workers=2, partition=partition, min_delta=0)
+                parallel = KnowledgeBase([], [], engine=engine)
+                parallel.kb_assert_many(data)
+                self.assertEqual(str(parallel), str(KB))
+                self.assertEqual([len(f.supported_by) for f in parallel.facts],
+                                 [len(f.supported_by) for f in KB.facts])
+        self.assertRaises(ValueError, ParallelInferenceEngine, partition="rule")
+
+    def test25(self):
+        # makes sure the benchmark phases run and retracting the held back
+        # facts undoes asserting them
+        results = []
+        for case in sorted(suite.CASES):
+            # at 70 the rules case draws a held back fact it also loads
+            records = suite.run_case(case, 70, self.make_kb, asks=20)
+            self.assertEqual([r["phase"] for r in records], ["load", "assert", "ask", "retract"])
+            self.assertEqual(records[3]["facts"], records[0]["facts"])
+            self.assertGreater(records[1]["facts"], records[0]["facts"])
+            for record in records:
+                record["per_op"] = record["seconds"] / record["ops"]
+            results.extend(records)
+        self.assertEqual(suite.compare(results, results), [])
+        slower = [dict(r, per_op=2 * r["per_op"]) for r in results]
+        self.assertEqual(len(suite.compare(slower, results)), len(results))
+
+    def test26(self):
+        # makes sure metrics charge derivations to the rules they came from
+        KB = self.make_kb()
+        KB.metrics = Metrics()
+        derived, removed = [], []
+        KB.metrics.on_derive.append(lambda conclusion, fact, rule: derived.append(conclusion))
+        KB.metrics.on_retract.append(removed.extend)
+        for item in self.data:
+            KB.kb_assert(item)
+        parentof, auntof, grandmotherof = [read.parse_input(text) for text in [
+            "rule: ((motherof ?x ?y)) -> (parentof ?x ?y)",
+            "rule: ((parentof ?x ?y) (sisters ?x ?z)) -> (auntof ?z ?y)",
+            "rule: ((parentof ?x ?y) (motherof ?z ?x)) -> (grandmotherof ?z ?y)"]]
+        self.assertEqual(KB.metrics.facts, {parentof: 4, auntof: 1, grandmotherof: 1})
+        self.assertEqual(KB.metrics.rules, {auntof: 4, grandmotherof: 4})
+        self.assertEqual(KB.metrics.matches, 14)
+        self.assertEqual(len(derived), 14)
+        self.assertEqual(KB.metrics.max_depth, 2)
+        self.assertEqual(set(row[0] for row in KB.metrics.report()),
+                         set([parentof, auntof, grandmotherof]))
+        KB.kb_retract(read.parse_input("fact: (motherof ada bing)"))
+        self.assertEqual(KB.metrics.largest_retraction, 6)
+        self.assertEqual(len(removed), 6)
+
+
+class ReteKBTest(KBTest):
+    # same tests, run on the Rete network engine
+
+    def make_kb(self):
+        return KnowledgeBase([], [], engine=ReteEngine())
+
+    def test_rete1(self):
+        # partial matches stay in the network instead of kb.rules
+        self.assertEqual(len(self.KB.rules), 3)
+        self.assertEqual(len(self.KB.facts), 12)
+
+
+class ColumnarKBTest(KBTest):
+    # same tests, with facts stored in integer columns
+
+    def make_kb(self):
+        return KnowledgeBase([], [], store=ColumnarFactStore())
+
+    def test_columnar1(self):
+        # makes sure facts are rebuilt from their rows once released
+        facts = [str(f) for f in self.KB.facts]
+        self.KB.facts.release()
+        self.assertEqual(len(self.KB.facts.objects), 11)
+        self.assertEqual([str(f) for f in self.KB.facts], facts)
+        ask1 = read.parse_input("fact: (motherof ?X ?Y)")
+        self.assertEqual(len(self.KB.kb_ask(ask1)), 4)
+        self.KB.kb_retract(read.parse_input("fact: (sisters ada eva)"))
+        self.KB.kb_retract(read.parse_input("fact: (motherof greta felix)"))
+        self.KB.facts.compact()
+        self.assertEqual(len(self.KB.facts), 8)
+        self.assertEqual(len(self.KB.kb_ask(ask1)), 3)
+        self.assertEqual(str(self.KB.kb_ask(read.parse_input("fact: (motherof ?X felix)"))), "[]")
+
+    def test_columnar2(self):
+        # makes sure repeated variables are matched in the columns, with and
+        # without NumPy masks
+        for text in ["fact: (likes a a)", "fact: (likes a b)", "fact: (likes b b)"]:
+            self.KB.kb_assert(read.parse_input(text))
+        ask1 = read.parse_input("fact: (likes ?X ?X)")
+        threshold = columnar.VECTOR_MIN_ROWS
+        try:
+            for columnar.VECTOR_MIN_ROWS in (threshold, 0):
+                self.assertEqual(len(self.KB.facts.candidates(ask1.statement)), 2)
+                self.assertEqual(self.KB.facts.bindings(ask1.statement), {"?X": ["a", "b"]})
+                self.assertEqual([str(b) for b in self.KB.kb_ask(ask1)], ["?X : a", "?X : b"])
+                self.assertEqual(self.KB.facts.bindings(read.parse_input(
+                    "fact: (motherof ?X chen)").statement), {"?X": ["bing", "dolores"]})
+                # a posting with a single row
+                self.assertEqual([str(b) for b in self.KB.kb_ask(read.parse_input(
+                    "fact: (likes b ?X)"))], ["?X : b"])
+        finally:
+            columnar.VECTOR_MIN_ROWS = threshold
+        self.KB.kb_assert(read.parse_input("fact: (likes c c)"))
+        self.assertEqual(len(self.KB.facts.candidates(ask1.statement)), 3)
+
+
+    def test_columnar3(self):
+        # makes sure only facts with Justifications stay built between
+        # changes, and released facts keep being asserted
+        objects = self.KB.facts.objects
+        self.assertLess(len(objects), len(self.KB.facts))
+        self.assertTrue(all(f.supported_by or f.supports for f in objects.values()))
+        aunt = read.parse_input("fact: (auntof eva bing)")
+        self.KB.kb_assert(aunt)
+        self.KB.kb_retract(read.parse_input("fact: (sisters ada eva)"))
+        self.assertNotIn(aunt, list(objects.values()))
+        self.assertTrue(self.KB._get_fact(aunt).asserted)
+        self.KB.kb_retract(aunt)
+        self.assertIsNone(self.KB._get_fact(aunt))
+        # a Rete network holds on to its facts, so they stay built
+        KB = KnowledgeBase([], [], engine=ReteEngine(), store=ColumnarFactStore())
+        KB.kb_assert_many(self.data)
+        self.assertEqual(len(KB.facts.objects), len(KB.facts))
+
+
+class ConcurrentKBTest(KBTest):
+    # same tests, on a KB that can be asked from several threads
+
+    def make_kb(self):
+        return ConcurrentKnowledgeBase([], [])
+
+    def test_concurrent1(self):
+        # makes sure a pinned version doesn't see later writes
+        ask1 = read.parse_input("fact: (grandmotherof ?X ?Y)")
+        with self.KB.reading() as view:
+            answers = [str(b) for b in view.kb_ask(ask1)]
+            facts = sorted(str(f.statement) for f in view.facts)
+            rules = list(view.rules)
+            self.KB.kb_retract(read.parse_input("fact: (motherof ada bing)"))
+            self.KB.kb_assert(read.parse_input("fact: (motherof eva ada)"))
+            self.assertTrue(self.KB.rules.graveyard)
+            for rule in rules:
+                self.assertIn(rule, view.rules.candidates(rule.lhs[0]))
+            self.assertEqual([str(b) for b in view.kb_ask(ask1)], answers)
+            self.assertEqual(sorted(str(f.statement) for f in view.facts), facts)
+            self.assertNotEqual(sorted(str(f.statement) for f in self.KB.facts), facts)
+            self.assertTrue(self.KB.facts.graveyard)
+        self.assertNotEqual([str(b) for b in self.KB.kb_ask(ask1)], answers)
+        self.KB.kb_assert(read.parse_input("fact: (motherof eva ada)"))
+        self.assertFalse(self.KB.facts.graveyard)
+
+    def test_concurrent2(self):
+        # makes sure readers only see whole writes while a writer runs
+        KB = ConcurrentKnowledgeBase([], [])
+        KB.kb_assert(read.parse_input("rule: ((edge ?x ?y)) -> (path ?x ?y)"))
+        KB.kb_assert(read.parse_input("rule: ((edge ?x ?y) (path ?y ?z)) -> (path ?x ?z)"))
+        edges = read.parse_input("fact: (edge ?X ?Y)")
+        paths = read.parse_input("fact: (path ?X ?Y)")
+        errors = []
+
+        def ask():
+            while not errors and KB.version < 30:
+                with KB.reading() as view:
+                    n = len(view.facts.candidates(edges.statement))
+                    found = len(view.facts.candidates(paths.statement))
+                    if found != n * (n + 1) // 2:
+                        errors.append((view.version, n, found))
+
+        readers = [threading.Thread(target=ask) for _ in range(3)]
+        for reader in readers:
+            reader.start()
+        for i in range(30):
+            KB.kb_assert(read.parse_input("fact: (edge n{} n{})".format(i, i + 1)))
+        for reader in readers:
+            reader.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent3(self):
+        # makes sure pipelined requests to a server get answered in order
+        async def session():
+            server = KBServer(self.KB)
+            await server.start(port=0)
+            client = await Client.connect(port=server.server.sockets[0].getsockname()[1])
+            try:
+                answers = await asyncio.gather(
+                    client.kb_ask("fact: (grandmotherof ?X ?Y)"),
+                    client.kb_retract("fact: (motherof ada bing)"),
+                    client.kb_assert("fact: (motherof eva greta)"),
+                    client.kb_ask("fact: (grandmotherof ?X ?Y)"),
+                    client.kb_ask("fact: (grandmotherof eva ?Y)", "backward"),
+                    client.kb_ask("fact: (motherof eva greta)"))
+                with self.assertRaises(ValueError):
+                    await client.request("frob fact: (motherof eva ada)")
+            finally:
+                await client.close()
+                await server.close()
+            return answers
+        answers = asyncio.run(session())
+        self.assertEqual(answers[0], ["?X : ada, ?Y : felix", "?X : ada, ?Y : chen"])
+        self.assertEqual(answers[3], ["?X : ada, ?Y : felix", "?X : eva, ?Y : felix"])
+        self.assertEqual(answers[4], ["?Y : felix"])
+        self.assertEqual(answers[5], [""])
+
+    def test_concurrent4(self):
+        # makes sure statements made from several threads at once are
+        # interned as one object each
+        made = [None] * 4
+        start = threading.Barrier(len(made))
+
+        def make(n):
+            start.wait()
+            made[n] = [Statement(["stress{}".format(i % 50), "c{}".format(i), "?v{}".format(i)])
+                       for i in range(5000)]
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=make, args=(n,)) for n in range(len(made))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        for statements in made[1:]:
+            self.assertTrue(all(a is b for a, b in zip(made[0], statements)))
+
 
 def pprint_justification(answer):
     """Pretty prints (hence pprint) justifications for the answer.
@@ -0,0 +1,137 @@
+from logical_classes import *
+
+class Metrics(object):
+    """Counters and timings of the inference in a KB, to be passed as
+        KnowledgeBase(metrics=Metrics()), for finding the rules that cost
+        the most. A KB without one pays a single None check per match.
+
+        Rules derived by currying (see InferenceEngine.fc_infer) are counted
+        under the rule they were curried from, down to a rule of the rule
+        base, its source. The time spent matching a fact with a rule and
+        adding what follows is charged to the rule's source. The depth of a
+        derived fact is the number of rule applications behind it: one more
+        than the deepest fact it was derived from (through every premise of
+        the rule), asserted facts being at depth 0.
+
+        Hooks are called with every conclusion derived, before it is added
+        to the KB (it may already be there, and then only gains support),
+        and with everything removed by a retraction once it is gone.
+
+    Attributes:
+        match_calls (int): fact/rule pairs matched
+        matches (int): pairs that matched
+        calls (dictof int): maps a source rule to the pairs matched with it
+        seconds (dictof float): maps a source rule to the seconds spent on
+            its pairs
+        facts (dictof int): maps a source rule to the facts derived from it
+        rules (dictof int): maps a source rule to the rules curried from it
+        retractions (int): retractions that removed something
+        removed (int): facts and rules removed by them
+        largest_retraction (int): most facts and rules removed at once
+        max_depth (int): deepest derived fact
+        sources (dict): maps a curried rule to its source
+        depths (dict): maps a derived fact or rule to its depth
+        on_derive (listof callable): hooks called with (conclusion, fact,
+            rule) for every conclusion derived from fact and rule
+        on_retract (listof callable): hooks called with the list of facts
+            and rules a retraction removed
+    """
+    def __init__(self):
+        """Constructor for Metrics with every counter at 0 and no hooks
+        """
+        super(Metrics, self).__init__()
+        self.on_derive = []
+        self.on_retract = []
+        self.reset()
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'Metrics(match_calls={}, matches={}, facts={}, rules={}, max_depth={})'.format(
+                self.match_calls, self.matches, sum(self.facts.values()),
+                sum(self.rules.values()), self.max_depth)
+
+    def reset(self):
+        """Set every counter back to 0, keeping the hooks
+        """
+        self.match_calls = 0
+        self.matches = 0
+        self.calls = {}
+        self.seconds = {}
+        self.facts = {}
+        self.rules = {}
+        self.retractions = 0
+        self.removed = 0
+        self.largest_retraction = 0
+        self.max_depth = 0
+        self.sources = {}
+        self.depths = {}
+
+    def matched(self, rule, success, seconds):
+        """Count a fact matched with rule
+
+        Args:
+            rule (Rule): rule matched
+            success (bool): whether the fact matched its first premise
+            seconds (float): time spent matching and adding the conclusion
+        """
+        source = self.sources.get(rule, rule)
+        self.match_calls += 1
+        if success:
+            self.matches += 1
+        self.calls[source] = self.calls.get(source, 0) + 1
+        self.seconds[source] = self.seconds.get(source, 0.0) + seconds
+
+    def derived(self, conclusion, fact, rule):
+        """Count a conclusion derived from fact and rule and call the
+            on_derive hooks
+
+        Args:
+            conclusion (Fact|Rule): the derived fact or curried rule
+            fact (Fact): fact that matched
+            rule (Rule): rule it matched
+        """
+        source = self.sources.get(rule, rule)
+        depth = max(self.depths.get(fact, 0), self.depths.get(rule, 0))
+        if isinstance(conclusion, Fact):
+            depth += 1
+            self.facts[source] = self.facts.get(source, 0) + 1
+            if depth > self.max_depth:
+                self.max_depth = depth
+        else:
+            self.sources.setdefault(conclusion, source)
+            self.rules[source] = self.rules.get(source, 0) + 1
+        self.depths.setdefault(conclusion, depth)
+        for hook in self.on_derive:
+            hook(conclusion, fact, rule)
+
+    def retracted(self, removed):
+        """Count the facts and rules removed by a retraction and call the
+            on_retract hooks
+
+        Args:
+            removed (listof Fact|Rule): facts and rules removed
+        """
+        self.retractions += 1
+        self.removed += len(removed)
+        self.largest_retraction = max(self.largest_retraction, len(removed))
+        for fact_rule in removed:
+            self.depths.pop(fact_rule, None)
+            self.sources.pop(fact_rule, None)
+        for hook in self.on_retract:
+            hook(removed)
+
+    def report(self, top=None):
+        """The source rules that took the most time
+
+        Args:
+            top (int|None): most rules listed, None for all
+
+        Returns:
+            listof (Rule, float, int, int, int): source rule, seconds, pairs
+                matched, facts and rules derived, by decreasing seconds
+        """
+        rows = [(rule, seconds, self.calls.get(rule, 0), self.facts.get(rule, 0),
+                 self.rules.get(rule, 0)) for rule, seconds in self.seconds.items()]
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return rows if top is None else rows[:top]
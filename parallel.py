@@ -0,0 +1,293 @@
+import os, zlib
+from concurrent.futures import ProcessPoolExecutor
+from logical_classes import *
+from util import *
+from student_code import InferenceEngine
+
+verbose = 0
+
+class ParallelInferenceEngine(InferenceEngine):
+    """InferenceEngine whose semi-naive rounds (see InferenceEngine.saturate)
+        are joined in a pool of worker processes, to be passed as
+        KnowledgeBase(engine=ParallelInferenceEngine()) for large
+        kb_assert_many loads. Facts and rules added one at a time are still
+        joined in this process.
+
+        The facts of a round are hash-partitioned: the delta facts, and the
+        older facts the delta rules may match, either by their first
+        argument or by predicate. Partitioning by first argument is a cheap
+        stand-in for the rules' join variables, not a join key: it spreads
+        the facts evenly, and any partitioning gives the same result. Each
+        worker gets the facts of its partition and the rules whose first
+        premise has one of their predicates, builds its own indexes, looks
+        up the candidates, matches them and sends back the instantiated
+        conclusions. Every pair lives in the partition of its fact, so it is
+        joined exactly once. This process only merges the conclusions in the
+        order InferenceEngine joins their pairs and adds them to the KB with
+        the same Justifications fc_infer records, so the KB ends up the same
+        as with InferenceEngine, down to the order of its facts and rules
+        (as long as its facts have no variables, which the indexes put
+        last). The KB's metrics (see metrics.py) count what these rounds
+        derive but not their matches or time.
+
+    Attributes:
+        workers (int|None): number of worker processes, None for one per CPU
+        partition (str): "first_argument" to partition by first argument,
+            "predicate" to partition by predicate
+        min_delta (int): rounds with fewer facts and rules in their delta
+            are joined in this process
+    """
+    def __init__(self, workers=None, partition="first_argument", min_delta=1000):
+        """Constructor for ParallelInferenceEngine
+
+        Args:
+            workers (int|None): number of worker processes, None for one per CPU
+            partition (str): "first_argument" or "predicate"
+            min_delta (int): rounds with a smaller delta are joined in this
+                process
+        """
+        super(ParallelInferenceEngine, self).__init__()
+        if partition not in ("first_argument", "predicate"):
+            raise ValueError("Invalid partition: {}".format(partition))
+        self.workers = workers
+        self.partition = partition
+        self.min_delta = min_delta
+
+    def saturate(self, kb):
+        """Propagate everything on the KB's agenda by semi-naive rounds,
+            joining large rounds in worker processes
+
+        Args:
+            kb (KnowledgeBase) - A KnowledgeBase
+        """
+        pool = None
+        encoded = {}
+        try:
+            while kb.agenda:
+                delta = []
+                while kb.agenda:
+                    delta.append(kb.agenda.pop())
+                if len(delta) < self.min_delta:
+                    for fact, rule in self._round(kb, delta):
+                        self.fc_infer(fact, rule, kb)
+                    continue
+                if pool is None:
+                    pool = ProcessPoolExecutor(max_workers=self.workers)
+                for fact, rule, conclusion in self._join(kb, delta, pool, encoded):
+                    if verbose > 1:
+                        printv('Inferring from {!r} and {!r} => {!r}', 1, verbose,
+                            [fact.statement, rule.lhs, rule.rhs])
+                    if len(conclusion) == 2:
+                        item = Rule(conclusion, supported_by=[fact, rule])
+                    else:
+                        item = Fact(conclusion[0], supported_by=[fact, rule])
+                    if kb.metrics is not None:
+                        kb.metrics.derived(item, fact, rule)
+                    kb.kb_add(item)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def _join(self, kb, delta, pool, encoded):
+        """INTERNAL USE ONLY
+        Join a round in the workers of pool, one task per partition
+
+        Args:
+            kb (KnowledgeBase): the KB
+            delta (listof Fact|Rule): items of the round, taken off the agenda
+            pool (ProcessPoolExecutor): worker processes
+            encoded (dict): maps a rule to its LHS and RHS as symbols, kept
+                from round to round
+
+        Returns:
+            listof (Fact, Rule, list): every matching pair, in the order
+                InferenceEngine._round lists it, with its conclusion as
+                passed to Rule, or in a list of one, as passed to Fact
+        """
+        delta_facts = [item for item in delta if isinstance(item, Fact)]
+        delta_rules = [item for item in delta if isinstance(item, Rule)]
+        rules = list(kb.rules)
+        parts = self.workers or os.cpu_count() or 1
+        tasks = [Task() for _ in range(parts)]
+        for i, fact in enumerate(delta_facts):
+            tasks[self._key(fact) % parts].add_fact(i, fact)
+        # the older facts with the predicates of the delta rules' first
+        # premises, the workers look up which ones they may match
+        old = []
+        seen = set(delta_facts)
+        premises = dict(((r.lhs[0].predicate, len(r.lhs[0].terms)), None) for r in delta_rules)
+        for predicate, arity in premises:
+            pattern = Statement([predicate] + ["?x{}".format(i) for i in range(arity)])
+            for fact in kb.facts.candidates(pattern):
+                if fact not in seen:
+                    seen.add(fact)
+                    tasks[self._key(fact) % parts].add_old(len(old), fact)
+                    old.append(fact)
+        by_rule = len(delta_facts) > len(rules)
+        needed = set().union(*[task.predicates for task in tasks])
+        groups = group(rules, needed, encoded)
+        needed = set().union(*[task.old_predicates for task in tasks])
+        delta_groups = group(delta_rules, needed, encoded)
+        results = pool.map(join_task, [task.encode(by_rule, groups, delta_groups)
+                                       for task in tasks if task.facts or task.old])
+        joined = sorted(result for partition in results for result in partition)
+        return [(delta_facts[f], rules[r], conclusion) if key[0] == 0
+                else (old[f], delta_rules[r], conclusion) for key, f, r, conclusion in joined]
+
+    def _key(self, fact):
+        """INTERNAL USE ONLY
+        Partition key of a fact, the same in every process and every run
+        """
+        statement = fact.statement
+        key = statement.predicate
+        if self.partition == "first_argument" and statement.terms:
+            key = str(statement.terms[0])
+        return zlib.crc32(key.encode("utf-8"))
+
+
+class Task(object):
+    """The facts of one partition of a round, numbered as in the round so
+        the worker's results can be merged back in order
+
+    Attributes:
+        facts (listof (int, Fact)): delta facts and their numbers
+        old (listof (int, Fact)): older facts the delta rules may match and
+            their numbers
+        predicates (set): predicates of the delta facts
+        old_predicates (set): predicates of the older facts
+    """
+    def __init__(self):
+        """Constructor for an empty Task
+        """
+        super(Task, self).__init__()
+        self.facts = []
+        self.old = []
+        self.predicates = set()
+        self.old_predicates = set()
+
+    def add_fact(self, i, fact):
+        """Add delta fact i of the round
+        """
+        self.facts.append((i, fact))
+        self.predicates.add(fact.statement.predicate)
+
+    def add_old(self, i, fact):
+        """Add older fact i of the round
+        """
+        self.old.append((i, fact))
+        self.old_predicates.add(fact.statement.predicate)
+
+    def encode(self, by_rule, rules, delta_rules):
+        """The task as lists of symbols, for join_task. Only the rules whose
+            first premise has the predicate of one of the task's facts are
+            sent, all of them for such a predicate, in order, so the worker's
+            rule index lists candidates as the KB's does.
+
+        Args:
+            by_rule (bool): whether the delta facts are looked up for each
+                rule, as InferenceEngine._round does when they outnumber
+                the rules, instead of the rules for each delta fact
+            rules (dictof list): the KB's rules by predicate, as given by
+                group
+            delta_rules (dictof list): the round's delta rules by predicate
+
+        Returns:
+            tuple: by_rule, then facts, older facts, rules and delta rules,
+                each as (number, symbols...)
+        """
+        return (by_rule,
+                [(i, symbols(fact.statement)) for i, fact in self.facts],
+                [(i, symbols(fact.statement)) for i, fact in self.old],
+                [rule for predicate in self.predicates for rule in rules.get(predicate, ())],
+                [rule for predicate in self.old_predicates
+                 for rule in delta_rules.get(predicate, ())])
+
+
+def group(rules, predicates, encoded):
+    """Encode the rules whose first premise has one of the predicates
+
+    Args:
+        rules (listof Rule): rules, numbered by their place in the list
+        predicates (set): predicates to keep
+        encoded (dict): maps a rule to its LHS and RHS as symbols, filled in
+            for the rules not in it yet
+
+    Returns:
+        dictof list: maps a predicate to the (number, lhs, rhs) of its rules,
+            in order
+    """
+    groups = {}
+    for r, rule in enumerate(rules):
+        predicate = rule.lhs[0].predicate
+        if predicate in predicates:
+            lhs_rhs = encoded.get(rule)
+            if lhs_rhs is None:
+                lhs_rhs = encoded[rule] = ([symbols(s) for s in rule.lhs], symbols(rule.rhs))
+            groups.setdefault(predicate, []).append((r,) + lhs_rhs)
+    return groups
+
+
+def symbols(statement):
+    """Statement as the list of symbols the Statement constructor takes
+    """
+    return [statement.predicate] + [str(term) for term in statement.terms]
+
+
+def join_task(task):
+    """Join the facts of a task with its rules, in a worker process, as
+        InferenceEngine._round lists their pairs and fc_infer matches them
+
+    Args:
+        task (tuple): output of Task.encode
+
+    Returns:
+        listof (tuple, int, int, list): every matching pair as its place in
+            the round's order, the numbers of its fact and rule (delta fact
+            and KB rule, or older fact and delta rule, as the place's first
+            item is 0 or 1), and its conclusion as symbols, [lhs, rhs] for a
+            rule and [rhs] for a fact
+    """
+    by_rule, facts, old, rules, delta_rules = task
+    results = []
+
+    def infer(place, f, r, fact, rule):
+        bindings = rule.matcher(fact.statement)
+        if not bindings:
+            return
+        conclusion = symbols(instantiate(rule.rhs, bindings))
+        if len(rule.lhs) > 1:
+            results.append((place, f, r, [[symbols(instantiate(s, bindings))
+                                           for s in rule.lhs[1:]], conclusion]))
+        else:
+            results.append((place, f, r, [conclusion]))
+
+    delta, numbers = index(facts)
+    rules = [(r, Rule([lhs, rhs])) for r, lhs, rhs in rules]
+    if by_rule:
+        for r, rule in rules:
+            for fact in delta.candidates(rule.lhs[0]):
+                infer((0, r, numbers[fact]), numbers[fact], r, fact, rule)
+    else:
+        store = RuleStore([rule for r, rule in rules])
+        rule_numbers = dict((rule, r) for r, rule in rules)
+        for fact in delta:
+            f = numbers[fact]
+            for rank, rule in enumerate(store.candidates(fact.statement)):
+                infer((0, f, rank), f, rule_numbers[rule], fact, rule)
+    older, numbers = index(old)
+    for r, lhs, rhs in delta_rules:
+        rule = Rule([lhs, rhs])
+        for fact in older.candidates(rule.lhs[0]):
+            infer((1, r, numbers[fact]), numbers[fact], r, fact, rule)
+    return results
+
+
+def index(facts):
+    """FactStore of encoded facts, and the number of each fact
+    """
+    store, numbers = FactStore(), {}
+    for i, statement in facts:
+        fact = Fact(statement)
+        store.append(fact)
+        numbers[fact] = i
+    return store, numbers
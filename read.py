@@ -1,3 +1,5 @@
+import os, re
+from concurrent.futures import ProcessPoolExecutor
 from logical_classes import *
 
 # read_tokenize takes the name of a file, reads it in and tokenizes the
@@ -16,23 +18,7 @@ def read_tokenize(file):
     Returns:
         A list of Facts and Rules.
     """
-    file = open(file, "r")
-    elements = []
-    current = ""
-    for line in file:
-        if line[0:5] in ("fact:", "rule:"):
-            elements.append(current)
-            current = line.rstrip()
-        else:
-            current = current + " " + line.rstrip().strip()
-    elements.append(current)
-    output = []
-    for e in elements:
-        parsed = parse_input(e)
-        if isinstance(parsed, Fact) or isinstance(parsed, Rule):
-            output.append(parsed)
-    file.close()
-    return output
+    return list(iter_tokenize(file))
 
 
 def parse_input(e):
@@ -64,6 +50,226 @@ def parse_input(e):
     else:
         print("PARSE ERROR: input header", e[0:5], "not recognized.")
 
+# iter_tokenize reads the same files one line at a time, lexing each line
+# into tokens and parsing every statement as soon as the next one starts.
+TOKEN = re.compile(r"->|[()]|(?:(?!->)[^\s()])+")
+HEADERS = ("fact:", "rule:")
+
+def iter_tokenize(path_or_file):
+    """Reads facts and rules from a file one at a time, so that only the
+    statement being parsed is held in memory, e.g.
+        for item in iter_tokenize("statements_kb.txt"): kb.kb_assert(item)
+
+    A statement starts with "fact:" or "rule:" and may go on over several
+    lines; lines whose first non-blank character is "#" are comments.
+    Statements that do not parse are reported and skipped.
+
+    Args:
+        path_or_file (str|file): name of a txt file as for read_tokenize, or
+            an open file (any iterable of lines)
+
+    Yields:
+        Fact|Rule: the facts and rules of the file, in order
+    """
+    if isinstance(path_or_file, str):
+        with open(path_or_file, "r") as file:
+            for item in iter_tokenize(file):
+                yield item
+        return
+    for parsed in iter_parsed(path_or_file):
+        yield make_item(parsed)
+
+
+def iter_parsed(lines):
+    """Lexes and parses lines of statements without building Facts and
+    Rules, see iter_tokenize
+
+    Args:
+        lines (iterable of str): lines of a statements file
+
+    Yields:
+        (str, list): "fact:" and the fact's symbols, or "rule:" and
+            [premises, rhs] made of lists of symbols
+    """
+    header, tokens, start = None, [], 0
+    for number, line in enumerate(lines, 1):
+        if line.lstrip().startswith("#"):
+            continue
+        for token in TOKEN.findall(line):
+            if token in HEADERS:
+                if header is not None or tokens:
+                    parsed = parse_tokens(header, tokens, start)
+                    if parsed is not None:
+                        yield header, parsed
+                header, tokens, start = token, [], number
+            else:
+                tokens.append(token)
+    if header is not None or tokens:
+        parsed = parse_tokens(header, tokens, start)
+        if parsed is not None:
+            yield header, parsed
+
+
+def make_item(parsed):
+    """Builds the Fact or Rule of a statement yielded by iter_parsed
+
+    Args:
+        parsed (str, list): header and parsed statement
+
+    Returns:
+        Fact|Rule
+    """
+    header, statement = parsed
+    if header == "fact:":
+        return Fact(statement)
+    return Rule(statement)
+
+
+def parse_tokens(header, tokens, line=0):
+    """Parses the tokens of one statement read by iter_parsed
+
+    Args:
+        header (str|None): "fact:" or "rule:", None if tokens came before any
+        tokens (listof str): the statement's parentheses, "->" and symbols
+        line (int): line the statement starts on, for error messages
+
+    Returns:
+        list|None: the fact's symbols or the rule's [premises, rhs], None if
+            the statement does not parse
+    """
+    try:
+        if header == "fact:":
+            return parse_statement(tokens)
+        elif header == "rule:":
+            if "->" not in tokens:
+                raise ValueError("missing ->")
+            arrow = tokens.index("->")
+            lhs, rhs = tokens[:arrow], parse_statement(tokens[arrow + 1:])
+            if lhs[1:2] == ["("] and lhs[-1:] == [")"]:
+                # several premises wrapped in parentheses
+                premises, i = [], 1
+                while i < len(lhs) - 1:
+                    premise, i = parse_group(lhs, i)
+                    premises.append(premise)
+                return [premises, rhs]
+            return [[parse_statement(lhs)], rhs]
+        else:
+            print("PARSE ERROR: input header", " ".join(tokens)[0:5], "not recognized.")
+    except ValueError as error:
+        print("PARSE ERROR: {} on line {}: {}".format(header, line, error))
+    return None
+
+
+def parse_statement(tokens):
+    """Parses tokens holding exactly one parenthesized statement
+
+    Args:
+        tokens (listof str): tokens of the statement
+
+    Returns:
+        listof str: the statement's symbols
+    """
+    statement, i = parse_group(tokens, 0)
+    if i != len(tokens):
+        raise ValueError("unexpected " + tokens[i])
+    return statement
+
+
+def parse_group(tokens, i):
+    """Parses the parenthesized statement "(predicate term ...)" starting at
+    position i of tokens
+
+    Args:
+        tokens (listof str): tokens of a fact or rule
+        i (int): position of the opening parenthesis
+
+    Returns:
+        (listof str, int): the statement's symbols and the position after
+            its closing parenthesis
+    """
+    if i >= len(tokens) or tokens[i] != "(":
+        raise ValueError("expected (")
+    j = i + 1
+    while j < len(tokens) and tokens[j] not in ("(", ")", "->"):
+        j += 1
+    if j == len(tokens) or tokens[j] != ")":
+        raise ValueError("expected )")
+    if j == i + 1:
+        raise ValueError("empty statement")
+    return tokens[i + 1:j], j + 1
+
+
+def load_many(paths, workers=None, chunk_size=1 << 22):
+    """Reads facts and rules from many files in a pool of worker processes.
+    Files larger than chunk_size bytes are cut into chunks at lines starting
+    with "fact:" or "rule:", so one large file is shared among workers too.
+    Workers only send back the parsed symbols; the Facts and Rules are built
+    here, in the order of paths and of the statements in each file.
+
+    Args:
+        paths (listof str): names of txt files as for read_tokenize
+        workers (int|None): number of worker processes, None for one per CPU,
+            1 to parse in this process
+        chunk_size (int): largest number of bytes parsed by one worker at a
+            time
+
+    Returns:
+        A list of Facts and Rules.
+    """
+    chunks = [chunk for path in paths for chunk in split_file(path, chunk_size)]
+    if workers == 1 or len(chunks) <= 1:
+        results = map(parse_chunk, chunks)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(parse_chunk, chunks))
+    return [make_item(parsed) for result in results for parsed in result]
+
+
+def split_file(path, chunk_size):
+    """Cuts a file into byte ranges of about chunk_size bytes, each starting
+    at the beginning of a line starting with "fact:" or "rule:"
+
+    Args:
+        path (str): name of a txt file
+        chunk_size (int): number of bytes after which to look for a cut
+
+    Returns:
+        listof (str, int, int): path, start and end offset of each chunk
+    """
+    size = os.path.getsize(path)
+    cuts = [0]
+    with open(path, "rb") as file:
+        while cuts[-1] + chunk_size < size:
+            file.seek(cuts[-1] + chunk_size)
+            file.readline()
+            while True:
+                position = file.tell()
+                line = file.readline()
+                if not line or line[0:5] in (b"fact:", b"rule:"):
+                    break
+            if position >= size:
+                break
+            cuts.append(position)
+    cuts.append(size)
+    return [(path, start, end) for start, end in zip(cuts, cuts[1:])]
+
+
+def parse_chunk(chunk):
+    """Parses the statements in a byte range of a file, in a worker process
+
+    Args:
+        chunk (str, int, int): path, start and end offset
+
+    Returns:
+        listof (str, list): the statements as yielded by iter_parsed
+    """
+    path, start, end = chunk
+    with open(path, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start)
+    return list(iter_parsed(data.decode("utf-8").splitlines()))
+
+
 def get_new_fact_or_rule():
     """Creates a new fact or rule. (instead of args, we use command line input
     via the read_from_input() function)
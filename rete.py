@@ -0,0 +1,228 @@
+import time
+from logical_classes import *
+from util import *
+
+verbose = 0
+
+class AlphaMemory(object):
+    """Holds the facts matching one rule premise pattern. Patterns that only
+        differ in the names of their variables share one alpha memory.
+
+    Attributes:
+        pattern (Statement): the premise pattern facts are tested against
+        facts (dictof Fact): ordered set of the facts matching pattern
+        successors (listof JoinNode): join nodes fed by this memory, highest
+            position first
+    """
+    def __init__(self, pattern):
+        """Constructor for AlphaMemory
+
+        Args:
+            pattern (Statement): the premise pattern facts are tested against
+        """
+        super(AlphaMemory, self).__init__()
+        self.pattern = pattern
+        self.facts = {}
+        self.successors = []
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'AlphaMemory({!r}, {!r})'.format(self.pattern, list(self.facts))
+
+
+class JoinNode(object):
+    """Joins the partial matches of one rule that are waiting for premise
+        `position` with the facts of the alpha memory for that premise.
+        Partial matches are kept as the Rules the pairwise engine would have
+        derived, i.e. the rule's remaining premises and RHS instantiated with
+        the bindings found so far; the asserted rule itself is the partial
+        match waiting for premise 0.
+
+    Attributes:
+        position (int): index of the premise in the asserted rule's LHS
+        alpha (AlphaMemory): memory holding facts for that premise
+        beta (dictof Rule): ordered set of partial matches waiting here
+        child (JoinNode|None): node for the next premise, None for the last
+    """
+    def __init__(self, position, alpha, child):
+        """Constructor for JoinNode
+
+        Args:
+            position (int): index of the premise in the asserted rule's LHS
+            alpha (AlphaMemory): memory holding facts for that premise
+            child (JoinNode|None): node for the next premise
+        """
+        super(JoinNode, self).__init__()
+        self.position = position
+        self.alpha = alpha
+        self.beta = {}
+        self.child = child
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'JoinNode({!r}, {!r}, {!r})'.format(
+                self.position, self.alpha.pattern, list(self.beta))
+
+
+class ReteEngine(object):
+    """Inference engine compiling asserted rules into a Rete network, to be
+        passed as KnowledgeBase(engine=ReteEngine()). A new fact only visits
+        the alpha memories of its predicate and joins with the partial matches
+        waiting on them, instead of being paired with every rule in the KB.
+        Partial matches stay inside the network, so kb.rules only holds the
+        asserted rules; derived facts get the same facts and support links as
+        with InferenceEngine.
+
+    Attributes:
+        alphas (dictof dict): maps a predicate to a dict from canonical
+            pattern to its AlphaMemory
+        tokens (dictof tuple): maps every partial match (Rule) to the pair
+            (stored Rule, JoinNode it waits on)
+    """
+    def __init__(self):
+        """Constructor for ReteEngine creating an empty network
+        """
+        super(ReteEngine, self).__init__()
+        self.alphas = {}
+        self.tokens = {}
+
+    def fact_added(self, fact, kb):
+        """Right-activate the network with a fact that was just added to the KB
+
+        Args:
+            fact (Fact) - A fact that was just added to the KnowledgeBase
+            kb (KnowledgeBase) - A KnowledgeBase
+        """
+        for alpha in list(self.alphas.get(fact.statement.predicate, {}).values()):
+            if not match(fact.statement, alpha.pattern):
+                continue
+            alpha.facts[fact] = None
+            # deepest nodes first, so a partial match created by an earlier
+            # node of the same rule is not joined with this fact twice
+            for node in alpha.successors:
+                for token in list(node.beta):
+                    self._join(fact, token, node, kb)
+
+    def rule_added(self, rule, kb):
+        """Compile a rule that was just added to the KB into join nodes and
+            join it with the facts already known
+
+        Args:
+            rule (Rule) - A rule that was just added to the KnowledgeBase
+            kb (KnowledgeBase) - A KnowledgeBase
+        """
+        if rule in self.tokens:
+            self.tokens[rule][0].asserted = True
+            return
+        node = None
+        for position in reversed(range(len(rule.lhs))):
+            node = JoinNode(position, self._alpha(rule.lhs[position], kb), node)
+            node.alpha.successors.append(node)
+            node.alpha.successors.sort(key=lambda n: -n.position)
+        self._activate(rule, node, kb)
+
+    def saturate(self, kb):
+        """Propagate everything on the KB's agenda. The network only ever
+            joins new facts and partial matches with what it already holds,
+            so it is semi-naive as it is.
+
+        Args:
+            kb (KnowledgeBase) - A KnowledgeBase
+        """
+        kb._drain()
+
+    def retracted(self, fact_rule, kb):
+        """Forget a fact or partial match that was removed from the KB
+
+        Args:
+            fact_rule (Fact|Rule) - The removed fact or rule
+            kb (KnowledgeBase) - A KnowledgeBase
+        """
+        if isinstance(fact_rule, Fact):
+            for alpha in self.alphas.get(fact_rule.statement.predicate, {}).values():
+                alpha.facts.pop(fact_rule, None)
+        elif fact_rule in self.tokens:
+            token, node = self.tokens.pop(fact_rule)
+            node.beta.pop(token, None)
+
+    def _alpha(self, pattern, kb):
+        """Get the alpha memory for pattern, creating and filling it from the
+            KB's propagated facts when the pattern is new (queued facts enter
+            it when their turn comes)
+
+        Args:
+            pattern (Statement): premise pattern
+            kb (KnowledgeBase): KnowledgeBase whose facts fill a new memory
+
+        Returns:
+            AlphaMemory
+        """
+        key = canonical(pattern)
+        alphas = self.alphas.setdefault(pattern.predicate, {})
+        alpha = alphas.get(key)
+        if alpha is None:
+            alpha = alphas[key] = AlphaMemory(pattern)
+            for fact in kb.facts.candidates(pattern):
+                if fact not in kb.agenda and match(fact.statement, pattern):
+                    alpha.facts[fact] = None
+        return alpha
+
+    def _activate(self, token, node, kb):
+        """Left-activate node with a new partial match
+
+        Args:
+            token (Rule): partial match waiting for node's premise
+            node (JoinNode): node the partial match waits on
+            kb (KnowledgeBase): A KnowledgeBase
+        """
+        self.tokens[token] = (token, node)
+        node.beta[token] = None
+        for fact in list(node.alpha.facts):
+            self._join(fact, token, node, kb)
+
+    def _join(self, fact, token, node, kb):
+        """Extend partial match token with fact, deriving either the next
+            partial match or a fact, with the support links fc_infer records
+
+        Args:
+            fact (Fact): fact from node's alpha memory
+            token (Rule): partial match from node's beta memory
+            node (JoinNode): node joining them
+            kb (KnowledgeBase): A KnowledgeBase
+        """
+        metrics = kb.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        bindings = token.matcher(fact.statement)
+        if not bindings:
+            if metrics is not None:
+                metrics.matched(token, False, time.perf_counter() - start)
+            return
+        if verbose > 1:
+            printv('Joining {!r} with {!r} => {!r}', 1, verbose,
+                [fact.statement, token.lhs, token.rhs])
+        if len(token.lhs) > 1:
+            new_rule_lhs = [instantiate(s, bindings) for s in token.lhs[1:]]
+            new_rule_rhs = instantiate(token.rhs, bindings)
+            new_rule = Rule([new_rule_lhs, new_rule_rhs], supported_by=[fact, token])
+            if metrics is not None:
+                metrics.derived(new_rule, fact, token)
+            known = self.tokens.get(new_rule)
+            # the new partial match is joined on its own time
+            if metrics is not None:
+                metrics.matched(token, True, time.perf_counter() - start)
+            if known is None:
+                kb._attach(new_rule, new_rule)
+                self._activate(new_rule, node.child, kb)
+            else:
+                kb._attach(new_rule, known[0])
+        else:
+            new_fact = Fact(instantiate(token.rhs, bindings), supported_by=[fact, token])
+            if metrics is not None:
+                metrics.derived(new_fact, fact, token)
+            kb.kb_add(new_fact)
+            if metrics is not None:
+                metrics.matched(token, True, time.perf_counter() - start)
+
@@ -0,0 +1,304 @@
+import argparse, asyncio, itertools, read
+from concurrent.futures import ThreadPoolExecutor
+from logical_classes import *
+from concurrency import ConcurrentKnowledgeBase
+
+# Requests and responses are lines of text. A request is a verb followed by
+# a fact or rule as in a statements file:
+#
+#   ask [forward|backward] fact: (isa ?x block)
+#   assert fact: (isa cube block)
+#   assert rule: ((isa ?x ?y) (isa ?y ?z)) -> (isa ?x ?z)
+#   retract fact: (isa cube block)
+#
+# and every request gets one response line, in the order they were sent:
+#
+#   ok                              assert or retract done
+#   ok 2\t?x : cube\t?x : pyramid   number of matches and their bindings
+#                                   (none for a ground ask), tab separated
+#   error <message>                 the request was not understood
+#
+# A client may send any number of requests without waiting for responses.
+# Asks see every write sent before them on the same connection.
+VERBS = ("ask", "assert", "retract")
+MODES = ("forward", "backward")
+
+class KBServer(object):
+    """asyncio server answering requests on a ConcurrentKnowledgeBase over
+        TCP or a Unix socket.
+
+        Forward asks are answered on the event loop from the last published
+        version of the KB. Writes are queued and applied by a single writer
+        thread: all the writes queued while it works on a batch make up the
+        next batch, with runs of asserts given to kb_assert_many and runs of
+        retracts to kb_retract_many, and the whole batch published as one
+        version. Backward asks, which run the TabledSolver, go to a pool of
+        reader threads. So neither inference nor proofs hold up the loop.
+
+    Attributes:
+        kb (ConcurrentKnowledgeBase): KB served
+        batch_size (int): most writes applied in one batch
+        writer (ThreadPoolExecutor): thread applying writes
+        readers (ThreadPoolExecutor): threads answering backward asks
+        writes (asyncio.Queue|None): (verb, item, future) of writes not
+            applied yet, None until started
+        server (asyncio.Server|None): listening server, None until started
+        batcher (asyncio.Task|None): task applying the queued writes
+        requests (int): requests received
+        batches (int): batches of writes applied
+    """
+    def __init__(self, kb=None, batch_size=1024, readers=None):
+        """Constructor for KBServer
+
+        Args:
+            kb (ConcurrentKnowledgeBase|None): KB to serve, a new empty one
+                if None
+            batch_size (int): most writes applied in one batch
+            readers (int|None): number of threads for backward asks, None
+                for the ThreadPoolExecutor default
+        """
+        super(KBServer, self).__init__()
+        self.kb = kb if kb is not None else ConcurrentKnowledgeBase([], [])
+        self.batch_size = batch_size
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.readers = ThreadPoolExecutor(max_workers=readers)
+        self.writes = None
+        self.server = None
+        self.batcher = None
+        self.requests = 0
+        self.batches = 0
+
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        """Start listening
+
+        Args:
+            host (str): address to listen on over TCP
+            port (int): TCP port, 0 for any free one
+            path (str|None): Unix socket to listen on instead of TCP
+
+        Returns:
+            asyncio.Server: the listening server
+        """
+        self.writes = asyncio.Queue()
+        self.batcher = asyncio.ensure_future(self._apply_writes())
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._serve, path=path)
+        else:
+            self.server = await asyncio.start_server(self._serve, host, port)
+        return self.server
+
+    async def close(self):
+        """Stop listening, wait for the queued writes and stop the threads
+        """
+        self.server.close()
+        await self.server.wait_closed()
+        self.writes.put_nowait(None)
+        await self.batcher
+        self.writer.shutdown()
+        self.readers.shutdown()
+
+    async def _serve(self, reader, writer):
+        """INTERNAL USE ONLY
+        Read the requests of a connection and queue their responses in order
+        """
+        responses = asyncio.Queue()
+        sender = asyncio.ensure_future(self._send(responses, writer))
+        last_write = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.requests += 1
+                response, last_write = self._request(line.decode("utf-8").strip(), last_write)
+                responses.put_nowait(response)
+        finally:
+            responses.put_nowait(None)
+            await sender
+            writer.close()
+
+    async def _send(self, responses, writer):
+        """INTERNAL USE ONLY
+        Write the responses of a connection as they are ready, in request
+        order, draining the socket when no response is waiting
+        """
+        while True:
+            response = await responses.get()
+            if response is None:
+                break
+            writer.write(await response)
+            if responses.empty():
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    pass
+
+    def _request(self, line, last_write):
+        """INTERNAL USE ONLY
+        Start handling one request
+
+        Args:
+            line (str): request
+            last_write (asyncio.Future|None): last write of the connection
+
+        Returns:
+            (asyncio.Future, asyncio.Future|None): the response line, and the
+                last write of the connection now
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            verb, mode, item = parse_request(line)
+        except ValueError as error:
+            return done(loop, error_line(error)), last_write
+        if verb != "ask":
+            future = loop.create_future()
+            self.writes.put_nowait((verb, item, future))
+            return future, future
+        if mode == "backward" or (last_write is not None and not last_write.done()):
+            return asyncio.ensure_future(self._ask_later(item, mode, last_write)), last_write
+        return done(loop, self.ask(item, mode)), last_write
+
+    async def _ask_later(self, fact, mode, last_write):
+        """INTERNAL USE ONLY
+        Answer an ask once the write before it is applied, off the loop if
+        it is a backward ask
+        """
+        if last_write is not None:
+            await asyncio.wait([last_write])
+        if mode == "backward":
+            return await asyncio.get_running_loop().run_in_executor(
+                self.readers, self.ask, fact, mode)
+        return self.ask(fact, mode)
+
+    def ask(self, fact, mode="forward"):
+        """Answer an ask from the last published version of the KB
+
+        Args:
+            fact (Fact): statement asked
+            mode (str): "forward" or "backward"
+
+        Returns:
+            bytes: response line
+        """
+        # straight from the view's matches, without kb_ask's printing
+        with self.kb.reading() as view:
+            answers = [str(bindings) for bindings, facts in
+                       view._answers(fact.statement, mode, False)]
+        fields = ["ok {}".format(len(answers))]
+        fields.extend(answer for answer in answers if answer != "No bindings")
+        return ("\t".join(fields) + "\n").encode("utf-8")
+
+    async def _apply_writes(self):
+        """INTERNAL USE ONLY
+        Apply the queued writes in batches on the writer thread, until None
+        is queued
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            write = await self.writes.get()
+            if write is None:
+                return
+            batch = [write]
+            while len(batch) < self.batch_size and not self.writes.empty():
+                write = self.writes.get_nowait()
+                if write is None:
+                    self.writes.put_nowait(None)
+                    break
+                batch.append(write)
+            try:
+                await loop.run_in_executor(self.writer, self.apply, batch)
+                line = b"ok\n"
+            except Exception as error:
+                line = error_line(error)
+            self.batches += 1
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_result(line)
+
+    def apply(self, batch):
+        """Apply a batch of writes to the KB as one version
+
+        Args:
+            batch (listof (str, Fact|Rule, asyncio.Future)): writes in the
+                order they were received
+        """
+        with self.kb.writing():
+            for verb, writes in itertools.groupby(batch, key=lambda write: write[0]):
+                items = [write[1] for write in writes]
+                if verb == "assert":
+                    self.kb.kb_assert_many(items)
+                else:
+                    self.kb.kb_retract_many(items)
+
+
+def parse_request(line):
+    """Read a request line
+
+    Args:
+        line (str): request, without the newline
+
+    Returns:
+        (str, str, Fact|Rule): verb, ask mode and the fact or rule
+
+    Raises:
+        ValueError: if the line is not a valid request
+    """
+    verb, _, text = line.partition(" ")
+    if verb not in VERBS:
+        raise ValueError("unknown verb {!r}".format(verb))
+    mode = "forward"
+    if verb == "ask" and text.split(" ", 1)[0] in MODES:
+        mode, _, text = text.partition(" ")
+    try:
+        item = read.parse_input(text.strip())
+    except (IndexError, ValueError):
+        item = None
+    if not isinstance(item, (Fact, Rule)):
+        raise ValueError("can't parse {!r}".format(text))
+    if verb != "assert" and not isinstance(item, Fact):
+        raise ValueError("can only {} facts".format(verb))
+    return verb, mode, item
+
+
+def error_line(error):
+    """Response line for an error
+    """
+    return "error {}\n".format(error).encode("utf-8")
+
+
+def done(loop, result):
+    """Future already resolved to result
+    """
+    future = loop.create_future()
+    future.set_result(result)
+    return future
+
+
+async def serve(kb, host="127.0.0.1", port=7070, path=None):
+    """Serve kb until cancelled
+    """
+    server = KBServer(kb)
+    await server.start(host, port, path)
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a knowledge base over TCP or a Unix socket")
+    parser.add_argument("files", nargs="*", help="statements files to load first")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7070)
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead")
+    args = parser.parse_args(argv)
+    kb = ConcurrentKnowledgeBase([], [])
+    if args.files:
+        kb.kb_assert_many(read.load_many(args.files))
+    try:
+        asyncio.run(serve(kb, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import mmap, struct, sys
+from array import array
+from logical_classes import *
+
+# A snapshot file is a header followed by int32 sections, in native byte
+# order (recorded in the header) so that loading can map them in place:
+#
+#   header        MAGIC, then the counts in HEADER order
+#   sym_offsets   nsymbols + 1 offsets into blob
+#   blob          utf-8 symbols (predicates and terms), padded to 4 bytes
+#   stmt_offsets  nstatements + 1 offsets into terms
+#   terms         symbol ids, the predicate first for every statement
+#   fact_stmts    statement id of every fact
+#   lhs_offsets   nrules + 1 offsets into lhs
+#   lhs           statement ids of the rules' LHS
+#   rhs           statement id of every rule's RHS
+#   flags         ASSERTED and STORED bits of every fact, then every rule
+#   edges         (fact, rule, conclusion) of every Justification, facts
+#                 numbered from 0 and rules after them
+MAGIC = b"KBSNAP\x01\x00"
+HEADER = struct.Struct("=9i")
+ASSERTED = 1
+STORED = 2
+
+def save(kb, path):
+    """Write the facts, rules and support graph of a KB to a snapshot file
+
+    Args:
+        kb (KnowledgeBase): KnowledgeBase to save
+        path (str): name of the snapshot file
+    """
+    facts = list(kb.facts)
+    rules = list(kb.rules)
+    items = dict((fact, i) for i, fact in enumerate(facts))
+    # partial matches kept by an engine are only reachable through supports
+    known = dict.fromkeys(rules)
+    stack = facts + rules
+    while stack:
+        for justification in stack.pop().supports:
+            conclusion = justification.conclusion
+            if isinstance(conclusion, Rule) and conclusion not in known:
+                known[conclusion] = None
+                rules.append(conclusion)
+                stack.append(conclusion)
+    for i, rule in enumerate(rules):
+        items[rule] = len(facts) + i
+
+    symbols, statements = {}, {}
+    sym_offsets, blob = array("i", [0]), bytearray()
+    stmt_offsets, terms = array("i", [0]), array("i")
+
+    def symbol(text):
+        i = symbols.get(text)
+        if i is None:
+            i = symbols[text] = len(symbols)
+            blob.extend(text.encode("utf-8"))
+            sym_offsets.append(len(blob))
+        return i
+
+    def statement(s):
+        i = statements.get(s)
+        if i is None:
+            i = statements[s] = len(statements)
+            terms.append(symbol(s.predicate))
+            terms.extend(symbol(str(t)) for t in s.terms)
+            stmt_offsets.append(len(terms))
+        return i
+
+    fact_stmts = array("i", (statement(fact.statement) for fact in facts))
+    lhs_offsets, lhs, rhs = array("i", [0]), array("i"), array("i")
+    for rule in rules:
+        lhs.extend(statement(s) for s in rule.lhs)
+        lhs_offsets.append(len(lhs))
+        rhs.append(statement(rule.rhs))
+    stored = kb.rules.get
+    flags = array("i", (ASSERTED * fact.asserted | STORED for fact in facts))
+    flags.extend(ASSERTED * rule.asserted | STORED * (stored(rule) is rule)
+                 for rule in rules)
+    edges = array("i")
+    for item in facts + rules:
+        for justification in item.supported_by:
+            edges.extend((items[justification.fact], items[justification.rule], items[item]))
+
+    blob.extend(b"\0" * (-len(blob) % 4))
+    with open(path, "wb") as file:
+        file.write(MAGIC)
+        file.write(HEADER.pack(1, len(symbols), len(blob), len(statements), len(terms),
+                               len(facts), len(rules), len(lhs), len(edges) // 3))
+        for section in (sym_offsets, blob, stmt_offsets, terms, fact_stmts,
+                        lhs_offsets, lhs, rhs, flags, edges):
+            file.write(section if isinstance(section, bytearray) else section.tobytes())
+
+
+def load(kb, path):
+    """Fill an empty KB from a snapshot file without running inference
+
+    Args:
+        kb (KnowledgeBase): empty KnowledgeBase, its engine is not called
+        path (str): name of a snapshot file written by save
+    """
+    with open(path, "rb") as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        view = memoryview(data)
+        try:
+            _load(kb, view)
+        finally:
+            view.release()
+    finally:
+        data.close()
+
+
+def _load(kb, view):
+    if bytes(view[:len(MAGIC)]) != MAGIC:
+        raise ValueError("not a KB snapshot")
+    position = len(MAGIC) + HEADER.size
+    header = HEADER.unpack(view[len(MAGIC):position])
+    swap = header[0] != 1
+    if swap:
+        header = struct.unpack((">" if sys.byteorder == "little" else "<") + "9i",
+                               view[len(MAGIC):position])
+    _, nsymbols, nblob, nstatements, nterms, nfacts, nrules, nlhs, nedges = header
+
+    def section(count):
+        nonlocal position
+        chunk = view[position:position + 4 * count]
+        position += 4 * count
+        if swap:
+            ints = array("i", chunk)
+            ints.byteswap()
+            return ints
+        return chunk.cast("i")
+
+    sym_offsets = section(nsymbols + 1)
+    blob = view[position:position + nblob]
+    position += nblob
+    stmt_offsets = section(nstatements + 1)
+    terms = section(nterms)
+    fact_stmts = section(nfacts)
+    lhs_offsets = section(nrules + 1)
+    lhs = section(nlhs)
+    rhs = section(nrules)
+    flags = section(nfacts + nrules)
+    edges = section(3 * nedges)
+
+    symbols = [bytes(blob[sym_offsets[i]:sym_offsets[i + 1]]).decode("utf-8")
+               for i in range(nsymbols)]
+    term_of = [Term(s) for s in symbols]
+    statements = []
+    for i in range(nstatements):
+        start, end = stmt_offsets[i], stmt_offsets[i + 1]
+        statements.append(Statement([symbols[terms[start]]] +
+                                    [term_of[t] for t in terms[start + 1:end]]))
+    items = []
+    for i in range(nfacts):
+        fact = Fact(statements[fact_stmts[i]])
+        fact.asserted = bool(flags[i] & ASSERTED)
+        items.append(fact)
+    for i in range(nrules):
+        rule = Rule([[statements[s] for s in lhs[lhs_offsets[i]:lhs_offsets[i + 1]]],
+                     statements[rhs[i]]])
+        rule.asserted = bool(flags[nfacts + i] & ASSERTED)
+        items.append(rule)
+    for i in range(0, 3 * nedges, 3):
+        Justification(items[edges[i]], items[edges[i + 1]]).attach(items[edges[i + 2]])
+    for item in items[:nfacts]:
+        kb.facts.append(item)
+    for i, item in enumerate(items[nfacts:]):
+        if flags[nfacts + i] & STORED:
+            kb.rules.append(item)
@@ -1,14 +1,24 @@
-import read, copy
+import read, copy, snapshot, time
+from agenda import Agenda
+from backward import TabledSolver
 from util import *
 from logical_classes import *
 
 verbose = 0
 
 class KnowledgeBase(object):
-    def __init__(self, facts=[], rules=[]):
-        self.facts = facts
-        self.rules = rules
-        self.ie = InferenceEngine()
+    def __init__(self, facts=[], rules=[], engine=None, agenda=None, cache=None,
+                 journal=None, store=None, metrics=None):
+        self.facts = store if store is not None else FactStore()
+        for fact in facts:
+            self.facts.append(fact)
+        self.rules = RuleStore(rules)
+        self.ie = engine if engine is not None else InferenceEngine()
+        self.agenda = agenda if agenda is not None else Agenda()
+        self.cache = cache
+        self.journal = journal
+        self.metrics = metrics
+        self.propagating = False
 
     def __repr__(self):
         return 'KnowledgeBase({!r}, {!r})'.format(self.facts, self.rules)
@@ -29,9 +39,7 @@ class KnowledgeBase(object):
         Returns:
             Fact: matching fact
         """
-        for kbfact in self.facts:
-            if fact == kbfact:
-                return kbfact
+        return self.facts.get(fact)
 
     def _get_rule(self, rule):
         """INTERNAL USE ONLY
@@ -43,9 +51,67 @@ class KnowledgeBase(object):
         Returns:
             Rule: matching rule
         """
-        for kbrule in self.rules:
-            if rule == kbrule:
-                return kbrule
+        return self.rules.get(rule)
+
+    def _discard(self, fact_rules):
+        """INTERNAL USE ONLY
+        Remove facts and rules that lost all support from the KB in one go
+        and let the inference engine forget about them. Derived rules only
+        live in the engine for engines that keep partial matches to
+        themselves.
+
+        Args:
+            fact_rules (listof Fact|Rule): stored facts and rules to remove
+        """
+        self.facts.remove_many([item for item in fact_rules if isinstance(item, Fact)])
+        self.rules.remove_many([item for item in fact_rules if isinstance(item, Rule)
+                                and self.rules.get(item) is item])
+        for fact_rule in fact_rules:
+            self._changed(fact_rule)
+            self.ie.retracted(fact_rule, self)
+
+    def _changed(self, fact_rule):
+        """INTERNAL USE ONLY
+        Out-date the cached asks a fact or rule being stored or removed may
+        change
+
+        Args:
+            fact_rule (Fact|Rule): fact or rule stored in or removed from the KB
+        """
+        if self.cache is not None:
+            self.cache.invalidate(fact_rule)
+
+    def _propagate(self, fact_rule):
+        """INTERNAL USE ONLY
+        Queue a newly stored fact or rule on the agenda and, unless an outer
+        call is already doing so, run the inference engine on queued items
+        until the agenda is empty. Items derived on the way are queued by
+        kb_add instead of being propagated recursively, so the depth of an
+        inference chain does not grow the call stack.
+
+        Args:
+            fact_rule (Fact|Rule): stored fact or rule to propagate
+        """
+        self.agenda.push(fact_rule)
+        if self.propagating:
+            return
+        self.propagating = True
+        try:
+            self._drain()
+        finally:
+            self.propagating = False
+
+    def _drain(self):
+        """INTERNAL USE ONLY
+        Run the inference engine on queued items, one at a time in agenda
+        order, until the agenda is empty
+        """
+        while self.agenda:
+            item = self.agenda.pop()
+            if isinstance(item, Fact):
+                self.ie.fact_added(item, self)
+            else:
+                self.ie.rule_added(item, self)
 
     def kb_add(self, fact_rule):
         """Add a fact or rule to the KB
@@ -56,33 +122,90 @@ class KnowledgeBase(object):
         """
 
         #
-        printv("Adding {!r}", 1, verbose, [fact_rule])
+        if verbose > 1:
+            printv("Adding {!r}", 1, verbose, [fact_rule])
         if isinstance(fact_rule, Fact):
-            if fact_rule not in self.facts:
+            kbfact = self._get_fact(fact_rule)
+            if kbfact is None:
                 self.facts.append(fact_rule)
-                for rule in self.rules:
-                    self.ie.fc_infer(fact_rule, rule, self)
+                self._changed(fact_rule)
+                if not fact_rule.supported_by:
+                    self._asserted(fact_rule)
+                self._attach(fact_rule, fact_rule)
+                self._propagate(fact_rule)
             else:
                 if fact_rule.supported_by:
-                    ind = self.facts.index(fact_rule)
-                    for f in fact_rule.supported_by:
-                        self.facts[ind].supported_by.append(f)
+                    self._attach(fact_rule, kbfact)
                 else:
-                    ind = self.facts.index(fact_rule)
-                    self.facts[ind].asserted = True
+                    self._asserted(fact_rule)
+                    kbfact.asserted = True
         elif isinstance(fact_rule, Rule):
-            if fact_rule not in self.rules:
+            kbrule = self._get_rule(fact_rule)
+            if kbrule is None:
                 self.rules.append(fact_rule)
-                for fact in self.facts:
-                    self.ie.fc_infer(fact, fact_rule, self)
+                self._changed(fact_rule)
+                if not fact_rule.supported_by:
+                    self._asserted(fact_rule)
+                self._attach(fact_rule, fact_rule)
+                self._propagate(fact_rule)
             else:
                 if fact_rule.supported_by:
-                    ind = self.rules.index(fact_rule)
-                    for f in fact_rule.supported_by:
-                        self.rules[ind].supported_by.append(f)
+                    self._attach(fact_rule, kbrule)
                 else:
-                    ind = self.rules.index(fact_rule)
-                    self.rules[ind].asserted = True
+                    self._asserted(fact_rule)
+                    kbrule.asserted = True
+
+    def _attach(self, fact_rule, kbfact_rule):
+        """INTERNAL USE ONLY
+        Record the Justifications of a fact or rule being added on the stored
+        copy and on their premises
+
+        Args:
+            fact_rule (Fact|Rule): the fact or rule being added
+            kbfact_rule (Fact|Rule): the equal fact or rule stored in the KB
+        """
+        for justification in list(fact_rule.supported_by):
+            justification.attach(kbfact_rule)
+            if self.journal is not None:
+                self.journal.inferred(justification, isinstance(kbfact_rule, Fact)
+                                      or self.rules.get(kbfact_rule) is kbfact_rule)
+
+    def _asserted(self, fact_rule):
+        """INTERNAL USE ONLY
+        Log an asserted fact or rule to the journal, if there is one
+
+        Args:
+            fact_rule (Fact|Rule): the asserted fact or rule
+        """
+        if self.journal is not None:
+            self.journal.asserted(fact_rule)
+
+    def _commit(self, unlinked=()):
+        """INTERNAL USE ONLY
+        End a change to the KB in the journal, if there is one, and release
+        the facts built for it
+
+        Args:
+            unlinked (listof Fact|Rule): stored facts or rules the change took
+                Justifications from
+        """
+        if self.journal is not None:
+            self.journal.commit()
+        self._release(unlinked)
+
+    def _release(self, unlinked=()):
+        """INTERNAL USE ONLY
+        Let a store that builds its facts on demand (see columnar.py) drop
+        the ones it built since the last change, and the unlinked ones,
+        unless the engine may still hold them
+
+        Args:
+            unlinked (listof Fact|Rule): stored facts or rules the change took
+                Justifications from
+        """
+        release = getattr(self.facts, "release", None)
+        if release is not None and not getattr(self.ie, "holds_facts", True):
+            release(recent=True, facts=[f for f in unlinked if isinstance(f, Fact)])
 
     def kb_assert(self, fact_rule):
         """Assert a fact or rule into the KB
@@ -92,151 +215,441 @@ class KnowledgeBase(object):
         """
         printv("Asserting {!r}", 0, verbose, [fact_rule])
         self.kb_add(fact_rule)
+        if not self.propagating:
+            self._commit()
+
+    def kb_assert_many(self, items):
+        """Assert many facts and rules at once. All of them are stored first,
+            then the inference engine saturates the KB in rounds (see
+            InferenceEngine.saturate), which ends in the same KB, support links
+            included, as asserting the items one at a time.
+
+        Args:
+            items (iterable of Fact|Rule): Facts and Rules we're asserting, e.g.
+                the output of read.read_tokenize or read.iter_tokenize
+        """
+        outer = self.propagating
+        self.propagating = True
+        try:
+            count = 0
+            for item in items:
+                if isinstance(item, Fact) or isinstance(item, Rule):
+                    self.kb_add(item)
+                    count += 1
+            printv("Asserting {} items", 0, verbose, [count])
+            if not outer:
+                self.ie.saturate(self)
+        finally:
+            self.propagating = outer
+        if not outer:
+            self._commit()
+
+    def save_snapshot(self, path):
+        """Save the facts and rules of the KB and how they support each other
+            to a binary snapshot file (see snapshot.py), to be opened again
+            with load_snapshot instead of re-asserting everything
+
+        Args:
+            path (str): name of the snapshot file
+        """
+        snapshot.save(self, path)
+
+    @classmethod
+    def load_snapshot(cls, path, engine=None, agenda=None, cache=None, store=None):
+        """Open a KB saved by save_snapshot. The facts, rules and support
+            links are read back as they were saved, no inference is run. The
+            engine is not told about them, so it must be one that keeps no
+            state of its own (InferenceEngine, BackwardEngine): a Rete
+            network is not part of the snapshot.
+
+        Args:
+            path (str): name of the snapshot file
+            engine, agenda, cache, store: as for the constructor
 
-    def kb_ask(self, fact):
+        Returns:
+            KnowledgeBase: the loaded KB
+        """
+        kb = cls([], [], engine=engine, agenda=agenda, cache=cache, store=store)
+        snapshot.load(kb, path)
+        return kb
+
+    def kb_ask(self, fact, mode="forward"):
         """Ask if a fact is in the KB
 
         Args:
             fact (Fact) - Statement to be asked (will be converted into a Fact)
+            mode (str) - "forward" to look only at the facts in the KB, which
+                forward chaining has already inferred, or "backward" to also
+                prove the statement from the KB's rules on demand (see
+                backward.TabledSolver)
 
         Returns:
             listof Bindings|False - list of Bindings if result found, False otherwise
         """
 
         print("Asking {!r}".format(fact))
-        if factq(fact):
-            f = Fact(fact.statement)
-            bindings_lst = ListOfBindings()
-            # ask matched facts
-            for fact in self.facts:
-                binding = match(f.statement, fact.statement)
-                if binding:
-                    bindings_lst.add_bindings(binding, [fact])
+        if not self._valid_ask(fact, mode):
+            return []
+        bindings_lst = ListOfBindings()
+        for binding, facts in self._answers(fact.statement, mode, False):
+            bindings_lst.add_bindings(binding, facts)
 
-            return bindings_lst if bindings_lst.list_of_bindings else []
+        return bindings_lst if bindings_lst.list_of_bindings else []
 
-        else:
-            print("Invalid ask:", fact.statement)
-            return []
+    def iter_ask(self, fact, mode="forward", limit=None, exists=False):
+        """Ask if a fact is in the KB, yielding matches one at a time as they
+            are found instead of collecting them all first. The KB may be
+            changed while they are consumed: facts retracted meanwhile are
+            skipped, facts added meanwhile may be missed.
 
+        Args:
+            fact (Fact) - Statement to be asked (will be converted into a Fact)
+            mode (str) - "forward" or "backward", as for kb_ask. Backward
+                asks still prove the whole goal before the first match.
+            limit (int|None) - stop after this many matches, None for all
+            exists (bool) - only check that there is a match: stop at the
+                first one and yield it with None for its bindings, which are
+                never built
+
+        Yields:
+            (Bindings|None, listof Fact) - bindings of the matching fact and
+                the fact itself
+        """
+        if not self._valid_ask(fact, mode):
+            return
+        if exists:
+            limit = 1
+        if limit is not None and limit <= 0:
+            return
+        count = 0
+        for answer in self._answers(fact.statement, mode, exists):
+            yield answer
+            count += 1
+            if count == limit:
+                return
 
-    def kb_retract(self, fact_or_rule):
-        """Retract a fact from the KB
+    def _valid_ask(self, fact, mode):
+        """INTERNAL USE ONLY
+        Check the arguments of an ask, printing why they are invalid
 
         Args:
-            fact (Fact) - Fact to be retracted
+            fact (Fact) - Statement to be asked
+            mode (str) - ask mode
 
         Returns:
-            None
+            bool: whether the ask can be answered
         """
-        printv("Retracting {!r}", 0, verbose, [fact_or_rule])
-        ####################################################
-        # Student code goes here
-        def remove_f_r (fact_or_rule):
+        if mode not in ("forward", "backward"):
+            print("Invalid ask mode:", mode)
+            return False
+        if not factq(fact):
+            print("Invalid ask:", fact.statement)
+            return False
+        return True
 
-            # 若输入 是assert的，退出
-            if fact_or_rule.asserted == True:
-                return
+    def _answers(self, statement, mode, exists):
+        """INTERNAL USE ONLY
+        Generate the facts matching statement as they are found, from the
+        cache if it has them
 
-            # 若输入 来自下层support内容 大于2项，退出
-            if len(fact_or_rule.supported_by) >=2:
-                return
+        Args:
+            statement (Statement) - Statement asked
+            mode (str) - "forward" or "backward"
+            exists (bool) - whether to skip building the bindings
 
-            # 若输入 的上层support内容为空，无rule，无fact，从KB中除去
-            if len(fact_or_rule.supports_facts) == 0 and len(fact_or_rule.supports_rules) == 0:
-                if isinstance(fact_or_rule,Fact):
-                    self.facts.remove(fact_or_rule)
-                    return
+        Yields:
+            (Bindings|None, listof Fact) - bindings of the matching fact, or
+                None if exists, and the fact itself
+        """
+        matcher = PatternMatcher(statement)
+        found = self.cache.get(statement, mode) if self.cache is not None else None
+        caching = found is None and self.cache is not None and not exists
+        if caching:
+            version = self.cache.version
+        if found is None:
+            if mode == "backward":
+                found = []
+                for s in TabledSolver(self).solve(statement):
+                    fact = self._get_fact(Fact(s))
+                    if fact is None:
+                        # proved, but neither stored nor asserted
+                        fact = Fact(s)
+                        fact.asserted = False
+                    found.append(fact)
+            else:
+                # ask matched facts, only those the index says may match
+                found = self.facts.iter_candidates(statement)
+        matched = []
+        for fact in found:
+            if exists:
+                if matcher.matches(fact.statement):
+                    yield None, [fact]
+                continue
+            binding = matcher(fact.statement)
+            if binding:
+                if caching:
+                    matched.append(fact)
+                yield binding, [fact]
+        # only reached once every match is out, so a partly consumed ask
+        # isn't cached as if it were complete, nor one the KB changed under
+        if caching and self.cache.version == version:
+            self.cache.put(statement, mode, matched)
+
+
+    def kb_ask_all(self, statements):
+        """Ask if a conjunction of statements holds in the KB, e.g.
+            (inst ?x ?y) and (color ?x red) and (size ?x big). Patterns are
+            joined most selective first, as estimated from the fact index
+            statistics, and the bindings found so far are substituted into
+            the next pattern so its facts are looked up in the index.
 
-                else:
-                    self.rules.remove(fact_or_rule)
-                    return
+        Args:
+            statements (listof Fact|Statement) - Statements to be asked together
 
+        Returns:
+            listof Bindings|False - list of Bindings, each with the facts
+                matching the statements in the order of statements, if
+                result found, False otherwise
+        """
+        patterns = []
+        for statement in statements:
+            if factq(statement):
+                statement = statement.statement
+            if not isinstance(statement, Statement):
+                print("Invalid ask:", statement)
+                return []
+            patterns.append(statement)
+
+        bindings_lst = ListOfBindings()
+        for bindings, facts in self._join(self._join_order(patterns), 0, Bindings(),
+                                          [None] * len(patterns)):
+            bindings_lst.add_bindings(bindings, facts)
+        return bindings_lst if bindings_lst.list_of_bindings else []
+
+    def _join_order(self, patterns):
+        """INTERNAL USE ONLY
+        Order patterns greedily, each time taking the one with the fewest
+        estimated matches given the variables bound by those before it
 
-            if isinstance(fact_or_rule, Fact):
+        Args:
+            patterns (listof Statement): patterns to order
 
-                if len(fact_or_rule.supports_facts) != 0:
-                    new_supports_facts = []
+        Returns:
+            listof (int, Statement): patterns in join order, each with its
+                index in patterns
+        """
+        remaining = list(enumerate(patterns))
+        ordered = []
+        bound = set()
+        while remaining:
+            best = min(remaining, key=lambda p: self.facts.estimate(p[1], bound))
+            remaining.remove(best)
+            ordered.append(best)
+            bound.update(t.term.element for t in best[1].terms if t.is_variable)
+        return ordered
+
+    def _join(self, patterns, i, bindings, facts):
+        """INTERNAL USE ONLY
+        Generate the ways to match patterns[i:] extending bindings
 
-                    for item_fact in fact_or_rule.supports_facts:
-                        new_supports_facts.append(item_fact)
-                        # 清空输入 内上层fact信息
-                    fact_or_rule.supports_facts = []
+        Args:
+            patterns (listof (int, Statement)): patterns in join order, as
+                given by _join_order
+            i (int): first pattern still to match
+            bindings (Bindings): bindings found so far
+            facts (listof Fact|None): facts matched so far, at the index of
+                their pattern, None for the patterns still to match
+
+        Yields:
+            (Bindings, listof Fact): bindings of all variables and the facts
+                they came from, in the order of the patterns' indexes
+        """
+        if i == len(patterns):
+            yield bindings, facts
+            return
+        index, pattern = patterns[i]
+        pattern = instantiate(pattern, bindings)
+        matcher = PatternMatcher(pattern)
+        for fact in self.facts.iter_candidates(pattern):
+            if not matcher.matches(fact.statement):
+                continue
+            extended = match(pattern, fact.statement, copy_bindings(bindings))
+            if extended:
+                matched = list(facts)
+                matched[index] = fact
+                for result in self._join(patterns, i + 1, extended, matched):
+                    yield result
 
-                    for item_fact in new_supports_facts:
-                        index = item_fact.supported_by.index(fact_or_rule)
-                        pair_rule = item_fact.supported_by[index+1]
-                        pair_rule.supports_facts.remove(item_fact)
-                        item_fact.supported_by.remove(fact_or_rule)
-                        item_fact.supported_by.remove(pair_rule)
-                        remove_f_r(item_fact)
+    def kb_retract(self, fact_or_rule):
+        """Retract a fact from the KB. The fact stops being asserted and, if
+            nothing else supports it, is removed along with everything that
+            only it supported. Rules can't be retracted.
 
+        Args:
+            fact (Fact) - Fact to be retracted
 
-                if len(fact_or_rule.supports_rules) != 0:
-                    new_supports_rules = []
+        Returns:
+            None
+        """
+        printv("Retracting {!r}", 0, verbose, [fact_or_rule])
+        self.kb_retract_many([fact_or_rule])
 
-                    for item_rule in fact_or_rule.supports_rules:
-                        new_supports_rules.append(item_rule)
-                    fact_or_rule.supports_rules = []
+    def kb_retract_many(self, items):
+        """Retract many facts at once, as if by kb_retract one after the
+            other. Everything losing support across all of them is gathered
+            first, visiting each affected fact or rule once, then removed
+            from the KB in bulk.
 
-                    for item_rule in new_supports_rules:
-                        index = item_rule.supported_by.index(fact_or_rule)
-                        pair_rule = item_rule.supported_by[index+1]
-                        pair_rule.supports_rules.remove(item_rule)
-                        item_rule.supported_by.remove(fact_or_rule)
-                        item_rule.supported_by.remove(pair_rule)
-                        remove_f_r(item_rule)
+        Args:
+            items (listof Fact) - Facts to be retracted
 
-            if isinstance(fact_or_rule,Rule):
-                if len(fact_or_rule.supports_facts) != 0:
-                    new_supports_facts = []
+        Returns:
+            None
+        """
+        unsupported, unlinked = [], []
+        for item in items:
+            if not isinstance(item, Fact):
+                continue
+            kbfact = self._get_fact(item)
+            if kbfact is None or not kbfact.asserted:
+                continue
+            kbfact.asserted = False
+            if self.journal is not None:
+                self.journal.retracted(kbfact)
+            if not kbfact.supported_by:
+                unsupported.append(kbfact)
+        if unsupported:
+            removed = self._collect_unsupported(unsupported, unlinked)
+            self._discard(removed)
+            if self.metrics is not None:
+                self.metrics.retracted(removed)
+        self._commit(unlinked)
+
+    def _collect_unsupported(self, unsupported, unlinked=None):
+        """INTERNAL USE ONLY
+        Starting from unasserted facts or rules that have no Justification
+        left, drop every Justification they take part in and gather, with an
+        explicit stack, every conclusion that is left unasserted and
+        unsupported in turn
 
-                    for item_fact in fact_or_rule.supports_facts:
-                        new_supports_facts.append(item_fact)
+        Args:
+            unsupported (listof Fact|Rule): stored facts or rules losing support
+            unlinked (list|None): gets the facts and rules of the dropped
+                Justifications, some of which stay in the KB
 
-                    fact_or_rule.supports_facts = []
+        Returns:
+            listof Fact|Rule: all stored facts and rules to remove
+        """
+        doomed = dict.fromkeys(unsupported)
+        stack = list(doomed)
+        while stack:
+            fact_rule = stack.pop()
+            for justification in list(fact_rule.supports):
+                justification.detach()
+                conclusion = justification.conclusion
+                if unlinked is not None:
+                    unlinked.extend((justification.fact, justification.rule, conclusion))
+                if (conclusion not in doomed and not conclusion.asserted
+                        and not conclusion.supported_by):
+                    doomed[conclusion] = None
+                    stack.append(conclusion)
+        return list(doomed)
 
-                    for item_fact in new_supports_facts:
-                        index = item_fact.supported_by.index(fact_or_rule)
-                        pair_fact = item_fact.supported_by[index-1]
-                        pair_fact.supports_facts.remove(item_fact)
-                        item_fact.supported_by.remove(fact_or_rule)
-                        item_fact.supported_by.remove(pair_fact)
-                        remove_f_r(item_fact)
 
+class InferenceEngine(object):
+    # keeps no Fact of its own between changes, so the store may let go of
+    # the ones nothing else refers to (see KnowledgeBase._commit)
+    holds_facts = False
 
-                if len(fact_or_rule.supports_rules) != 0:
-                    new_supports_rules= []
-                    for item_rule in fact_or_rule.supports_rules:
-                        new_supports_rules.append(item_rule)
+    def fact_added(self, fact, kb):
+        """Infer from a fact that was just added to the KB, pairing it with
+            the rules in the KB whose first premise may match it and that were
+            propagated already (queued rules are paired with it when their
+            turn comes)
 
-                    fact_or_rule.supports_rules = []
-                    for item_rule in new_supports_rules:
-                        index = item_rule.supported_by.index(fact_or_rule)
-                        pair_fact = item_rule.supported_by[index-1]
-                        pair_fact.supports_rules.remove(item_rule)
-                        item_rule.supported_by.remove(fact_or_rule)
-                        item_rule.supported_by.remove(pair_fact)
-                        remove_f_r(item_rule)
+        Args:
+            fact (Fact) - A fact that was just added to the KnowledgeBase
+            kb (KnowledgeBase) - A KnowledgeBase
+        """
+        for rule in kb.rules.candidates(fact.statement):
+            if rule not in kb.agenda:
+                self.fc_infer(fact, rule, kb)
 
+    def rule_added(self, rule, kb):
+        """Infer from a rule that was just added to the KB, pairing it with
+            the propagated facts that may match its first premise
 
-            if isinstance(fact_or_rule, Fact):
-                self.facts.remove(fact_or_rule)
+        Args:
+            rule (Rule) - A rule that was just added to the KnowledgeBase
+            kb (KnowledgeBase) - A KnowledgeBase
+        """
+        for fact in kb.facts.candidates(rule.lhs[0]):
+            if fact not in kb.agenda:
+                self.fc_infer(fact, rule, kb)
+
+    def saturate(self, kb):
+        """Propagate everything on the KB's agenda by semi-naive rounds: each
+            round takes all queued items as the delta, joins the rules with the
+            delta facts and the delta rules with the older facts. Items derived
+            in a round make up the delta of the next one. Every fact/rule pair
+            is still joined exactly once, as with fact_added and rule_added.
+            The delta facts are joined through whichever index needs fewer
+            lookups: the rules' first premises looked up in an index of the
+            delta, or each delta fact looked up in the rule index.
 
-            else:
-                self.rules.remove(fact_or_rule)
+        Args:
+            kb (KnowledgeBase) - A KnowledgeBase
+        """
+        while kb.agenda:
+            for fact, rule in self._round(kb):
+                self.fc_infer(fact, rule, kb)
 
-        if isinstance(fact_or_rule,Fact):
-            if fact_or_rule.asserted == True:
-                fact_or_rule_one = self._get_fact(fact_or_rule)
-                if len(fact_or_rule.supported_by)>=2:
-                    fact_or_rule_one.asserted = False
-                else:
-                    fact_or_rule_one.asserted = False
-                    remove_f_r(fact_or_rule_one)
+    def _round(self, kb, delta=None):
+        """INTERNAL USE ONLY
+        Take everything queued on the agenda as the delta of a round and list
+        the fact/rule pairs the round joins, in the order they are joined. The
+        items inferred while joining them are queued for the next round, so
+        the pairs can all be listed up front.
 
+        Args:
+            kb (KnowledgeBase) - A KnowledgeBase
+            delta (listof Fact|Rule|None) - items of the round, already
+                taken off the agenda, None to take everything queued
+
+        Returns:
+            listof (Fact, Rule): pairs to pass to fc_infer
+        """
+        if delta is None:
+            delta = []
+            while kb.agenda:
+                delta.append(kb.agenda.pop())
+        delta_facts = FactStore([item for item in delta if isinstance(item, Fact)])
+        delta_rules = [item for item in delta if isinstance(item, Rule)]
+        pairs = []
+        if len(delta_facts) > len(kb.rules):
+            for rule in kb.rules:
+                for fact in delta_facts.candidates(rule.lhs[0]):
+                    pairs.append((fact, rule))
+        else:
+            for fact in delta_facts:
+                for rule in kb.rules.candidates(fact.statement):
+                    pairs.append((fact, rule))
+        for rule in delta_rules:
+            for fact in kb.facts.candidates(rule.lhs[0]):
+                if fact not in delta_facts:
+                    pairs.append((fact, rule))
+        return pairs
+
+    def retracted(self, fact_rule, kb):
+        """Called when a fact or rule is removed from the KB. Nothing to do,
+            this engine keeps no state of its own.
+
+        Args:
+            fact_rule (Fact|Rule) - The removed fact or rule
+            kb (KnowledgeBase) - A KnowledgeBase
+        """
+        pass
 
-class InferenceEngine(object):
     def fc_infer(self, fact, rule, kb):
         """Forward-chaining to infer new facts and rules
 
@@ -256,35 +669,37 @@ class InferenceEngine(object):
 
         # Step 3.1:   yes -> let remaining part of (lhs facts => rhs fact) to be a NEW_RULE,
         #                    using function Rule() to assign new_rule supported by input fact and rule
-        # Step 3.1.1: add new_rule to kb() using function kb_add()
-        # Step 3.1.2: add new_rule into the list of supports_rules that current input fact supports
-        # Step 3.1.3: add new_rule into the list of supports_rules that current input rule supports
-        bindings = match(fact.statement,rule.lhs[0])
+        # Step 3.1.1: add new_rule to kb() using function kb_add(), which records the
+        #             Justification (fact, rule) on new_rule and on both the input fact and rule
+        metrics = kb.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        bindings = rule.matcher(fact.statement)
         if bindings:
             if len(rule.lhs)>1:
                 new_rule_lhs = [instantiate(remaining_facts,bindings) for remaining_facts in rule.lhs[1:]]
                 new_rule_rhs = instantiate(rule.rhs,bindings)
                 new_rule = Rule([new_rule_lhs,new_rule_rhs],supported_by=[fact,rule])
+                if metrics is not None:
+                    metrics.derived(new_rule, fact, rule)
                 kb.kb_add(new_rule)
-                fact.supports_rules.append(new_rule)
-                rule.supports_rules.append(new_rule)
 
         # Step 3.2:   no  -> draw conclusion from rule_rhs,
         #                    using function instantiate() to pass binding constants replacing rule.rhs, which is a fact
         #                    using function Fact() to assign new_fact supported by input fact and rule
-        # Step 3.2.1: add new_fact to kb() using function kb_add()
-        # Step 3.2.2: add new_fact into the list of supports_rules that current input fact supports
-        # Step 3.2.3: add new_fact into the list of supports_rules that current input rule supports
+        # Step 3.2.1: add new_fact to kb() using function kb_add(), which records the
+        #             Justification (fact, rule) on new_fact and on both the input fact and rule
             else:
                 new_rule_rhs = instantiate(rule.rhs, bindings)
                 new_fact = Fact(new_rule_rhs,supported_by= [fact,rule])
+                if metrics is not None:
+                    metrics.derived(new_fact, fact, rule)
                 kb.kb_add(new_fact)
-                fact.supports_facts.append(new_fact)
-                rule.supports_facts.append(new_fact)
-        else:
-            pass
+        if metrics is not None:
+            metrics.matched(rule, bool(bindings), time.perf_counter() - start)
 
-        printv('Attempting to infer from {!r} and {!r} => {!r}', 1, verbose,
-            [fact.statement, rule.lhs, rule.rhs])
+        if verbose > 1:
+            printv('Attempting to infer from {!r} and {!r} => {!r}', 1, verbose,
+                [fact.statement, rule.lhs, rule.rhs])
         ####################################################
         # Student code goes here
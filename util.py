@@ -14,7 +14,7 @@ def is_var(var):
     if type(var) == str:
         return var[0] == "?"
     if isinstance(var, lc.Term):
-        return isinstance(var.term, lc.Variable)
+        return var.is_variable
 
     return isinstance(var, lc.Variable)
 
@@ -32,12 +32,18 @@ def match(state1, state2, bindings=None):
     """
     if len(state1.terms) != len(state2.terms) or state1.predicate != state2.predicate:
         return False
+    # terms are interned, so two constants differ iff they are different
+    # objects; reject on the first clash before allocating any Bindings
+    for term1, term2 in zip(state1.terms, state2.terms):
+        if term1 is not term2 and not term1.is_variable and not term2.is_variable:
+            return False
     if not bindings:
         bindings = lc.Bindings()
-    return match_recursive(state1.terms, state2.terms, bindings)
+    return match_terms(state1.terms, state2.terms, bindings)
 
-def match_recursive(terms1, terms2, bindings):  # recursive...
-    """Recursive helper for match
+def match_terms(terms1, terms2, bindings):
+    """Helper for match binding the variables of two equally long term
+        sequences
 
     Args:
         terms1 (listof Term): terms to match with terms2
@@ -47,17 +53,48 @@ def match_recursive(terms1, terms2, bindings):  # recursive...
     Returns:
         Bindings|False: either associated bindings or no match found
     """
-    if len(terms1) == 0:
-        return bindings
-    if is_var(terms1[0]):
-        if not bindings.test_and_bind(terms1[0], terms2[0]):
-            return False
-    elif is_var(terms2[0]):
-        if not bindings.test_and_bind(terms2[0], terms1[0]):
+    for term1, term2 in zip(terms1, terms2):
+        if term1.is_variable:
+            if not bindings.test_and_bind(term1, term2):
+                return False
+        elif term2.is_variable:
+            if not bindings.test_and_bind(term2, term1):
+                return False
+        elif term1 is not term2:
             return False
-    elif terms1[0] != terms2[0]:
+    return bindings
+
+# the name match's helper had when it was recursive
+match_recursive = match_terms
+
+def matches(state1, state2):
+    """Check whether two statements match without building their Bindings,
+        for callers that only need a yes or no
+
+    Args:
+        state1 (Statement): statement to match with state2
+        state2 (Statement): statement to match with state1
+
+    Returns:
+        bool
+    """
+    if len(state1.terms) != len(state2.terms) or state1.predicate != state2.predicate:
         return False
-    return match_recursive(terms1[1:], terms2[1:], bindings)
+    seen = None
+    for term1, term2 in zip(state1.terms, state2.terms):
+        if term1.is_variable:
+            variable, value = term1, term2
+        elif term2.is_variable:
+            variable, value = term2, term1
+        elif term1 is not term2:
+            return False
+        else:
+            continue
+        if seen is None:
+            seen = {}
+        if seen.setdefault(variable, value) is not value:
+            return False
+    return True
 
 def instantiate(statement, bindings):
     """Generate Statement from given statement and bindings. Constructed statement
@@ -77,6 +114,40 @@ def instantiate(statement, bindings):
     new_terms = [handle_term(t) for t in statement.terms]
     return lc.Statement([statement.predicate] + new_terms)
 
+def copy_bindings(bindings):
+    """Copy Bindings so one search branch can extend them without affecting
+        the others
+
+    Args:
+        bindings (Bindings): bindings to copy
+
+    Returns:
+        Bindings
+    """
+    new_bindings = lc.Bindings()
+    new_bindings.bindings = list(bindings.bindings)
+    new_bindings.bindings_dict = dict(bindings.bindings_dict)
+    return new_bindings
+
+def canonical(statement):
+    """Key identifying statement up to the names of its variables, e.g.
+        (isa ?x ?y) and (isa ?a ?b) share a key but (isa ?x ?x) does not
+
+    Args:
+        statement (Statement): statement to build the key of
+
+    Returns:
+        tuple: predicate followed by constants and variable numbers
+    """
+    names = {}
+    key = [statement.predicate]
+    for term in statement.terms:
+        if term.is_variable:
+            key.append(names.setdefault(term.term.element, len(names)))
+        else:
+            key.append(term.term.element)
+    return tuple(key)
+
 def factq(element):
     """Check if element is a fact
 